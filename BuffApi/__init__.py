@@ -20,6 +20,7 @@ from typing import no_type_check, Dict, List, Union
 import requests
 
 from utils.logger import PluginLogger
+from utils.rate_limiter import RateLimiter
 from BuffApi import models
 
 logger = PluginLogger("BuffApi")
@@ -64,6 +65,17 @@ class BuffAccount:
     """
     
     BASE_URL = "https://buff.163.com"
+    # At most DEFAULT_REQUEST_RATE requests in any DEFAULT_REQUEST_PERIOD seconds: a poll's steam_trade and
+    # to_deliver fetches go out together, while the long-run pace stays close to the old 5 s sleeps
+    DEFAULT_REQUEST_RATE = 3
+    DEFAULT_REQUEST_PERIOD = 10.0
+    # Shared by every BuffAccount in the process, BUFF throttles per account/IP
+    rate_limiter = RateLimiter(DEFAULT_REQUEST_RATE, DEFAULT_REQUEST_PERIOD)
+
+    @classmethod
+    def set_rate_limit(cls, rate: int, period: float):
+        """Let every BuffAccount in the process send at most `rate` requests in any `period` seconds"""
+        cls.rate_limiter = RateLimiter(max(int(rate), 1), max(float(period), 0.0))
 
     def __init__(self, buffcookie, user_agent=None, proxies=None):
         if not user_agent:
@@ -79,6 +91,7 @@ class BuffAccount:
 
     def get(self, url, **kwargs):
         for i in range(10):
+            self.rate_limiter.acquire()
             response = self.session.get(url, **kwargs)
             logger.debug(f"GET {url} {response.status_code} {json.dumps(response.json(), ensure_ascii=False)}")
             if "系统繁忙" in response.text:
@@ -90,6 +103,7 @@ class BuffAccount:
 
     def post(self, url, **kwargs):
         for i in range(5):
+            self.rate_limiter.acquire()
             response = self.session.post(url, **kwargs)
             logger.debug(f"POST {url} {response.status_code} {json.dumps(response.json(), ensure_ascii=False)}")
             if "系统繁忙" in response.text:
@@ -163,6 +177,7 @@ class BuffAccount:
         }
         
         url = f"{self.BASE_URL}/market/sell_order/to_deliver?game={game}"
+        self.rate_limiter.acquire()
         response = self.session.get(url, headers=headers)
         if response.status_code == 200:
             return response.text
@@ -187,6 +202,7 @@ class BuffAccount:
         
         # Use session.get directly to avoid JSON parsing in debug log
         url = f"{self.BASE_URL}/market/sell_order/to_deliver/batch"
+        self.rate_limiter.acquire()
         response = self.session.get(url, params=params, headers=headers)
         if response.status_code == 200:
             try:
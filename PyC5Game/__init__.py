@@ -1,26 +1,45 @@
 import json
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
+from requests.adapters import HTTPAdapter
 
 from utils.logger import PluginLogger
 
+BASE_URL = 'https://openapi.c5game.com'
+# (connect, read) seconds
+REQUEST_TIMEOUT = (5, 20)
+INVALID_APP_KEY = 400001
+# Order IDs sent per deliver call
+DELIVER_BATCH_SIZE = 50
+
+
+class C5ApiError(Exception):
+    def __init__(self, resp: dict):
+        self.error_code = resp.get('errorCode')
+        super().__init__(resp.get('errorMsg') or str(resp))
+
 
 class C5Account:
     # API reference: https://apifox.com/apidoc/shared-bcbf0c5d-caf4-4ea6-b2c1-0bc292a2e6b2/doc-3014376
-    def __init__(self, app_key):
+    def __init__(self, app_key, max_workers=4):
         self.app_key = app_key
+        self.max_workers = max_workers
+        # One keep-alive HTTPS pool per account, shared by concurrent page fetches
         self.client = requests.Session()
+        self.client.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=max(max_workers, 4)))
         self.client.headers.update({"app-key": self.app_key})
         self.logger = PluginLogger("C5Game API")
 
     def post(self, path, data):
-        url = 'http://openapi.c5game.com/' + path
-        resp = self.client.post(url, json=data)
+        url = BASE_URL + path
+        resp = self.client.post(url, json=data, timeout=REQUEST_TIMEOUT)
         self.logger.debug(f"POST {path} {json.dumps(data, ensure_ascii=False)} {resp.text}")
         return resp.json()
 
     def get(self, path, params):
-        url = 'http://openapi.c5game.com/' + path
-        resp = self.client.get(url, params=params)
+        url = BASE_URL + path
+        resp = self.client.get(url, params=params, timeout=REQUEST_TIMEOUT)
         self.logger.debug(f"GET {path} {params} {resp.text}")
         return resp.json()
 
@@ -47,5 +66,42 @@ class C5Account:
             data['steamId'] = steamId
         return self.get('/merchant/order/v1/list', data)
 
+    def getFullOrderList(self, status=0, steamId=None) -> list:
+        """
+        Every order with `status`. If page 1 reports a total, the remaining pages are fetched concurrently,
+        otherwise pages are read one by one until a short page.
+        :raises C5ApiError: C5 returned an error instead of a page
+        """
+
+        def get_page(page):
+            resp = self.orderList(status=status, page=page, steamId=steamId)
+            if not resp.get("data"):
+                raise C5ApiError(resp)
+            return resp["data"]
+
+        first = get_page(1)
+        orders = list(first.get("list") or [])
+        limit = first.get("limit") or len(orders)
+        if not limit or len(orders) < limit:
+            return orders
+        total = first.get("total")
+        if total:
+            pages = range(2, -(-int(total) // limit) + 1)
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                for data in executor.map(get_page, pages):
+                    orders += data.get("list") or []
+            return orders
+        page = 1
+        while True:
+            page += 1
+            items = get_page(page).get("list") or []
+            orders += items
+            if len(items) < limit:
+                return orders
+
     def deliver(self, order_list: list):
         return self.post('/merchant/order/v1/deliver', order_list)
+
+    def deliverAll(self, order_list: list) -> list:
+        """`deliver` in batches of DELIVER_BATCH_SIZE, returns each batch's response"""
+        return [self.deliver(order_list[i : i + DELIVER_BATCH_SIZE]) for i in range(0, len(order_list), DELIVER_BATCH_SIZE)]
@@ -1,51 +1,110 @@
 import json
-import logging
+import threading
 import time
 
 import requests
-from apscheduler.schedulers.background import BackgroundScheduler
-from pytz import timezone
+from requests.adapters import HTTPAdapter
 
 import PyECOsteam.models as models
-from PyECOsteam.sign import generate_rsa_signature
+from PyECOsteam.sign import RSASigner
 from utils.logger import PluginLogger
 from utils.models import Asset, LeaseAsset
+from utils.rate_limiter import RateLimiter
 from utils.static import CURRENT_VERSION
-from utils.tools import jobHandler
+
+# Compact bodies, built once instead of per call
+body_encoder = json.JSONEncoder(separators=(",", ":"))
+# Most assets PublishRentAndSaleGoods accepts per request
+PUBLISH_BATCH_SIZE = 100
+
+
+class ECOStockIndex:
+    """
+    AssetId -> StockId lookups over the ECO-side Steam stock.
+    Built from one full stock scan and reused. A lookup miss rescans at most once every `refresh_interval` seconds,
+    RefreshUserSteamStock empties the index, since StockIds may change, and sold items are dropped from it as their orders come in.
+    searchStockIds is answered from it; the plugins don't look StockIds up themselves and only feed it delivered orders.
+    """
+
+    def __init__(self, client: "ECOsteamClient", refresh_interval: float = 60):
+        self.client = client
+        self.refresh_interval = refresh_interval
+        # AssetId -> StockId
+        self._stock = {}
+        self._synced_at = 0.0
+        self._lock = threading.Lock()
+
+    def refresh(self) -> list:
+        """Scan the full stock, reindex it and return the raw list"""
+        stock = self.client.getFullInventory()
+        with self._lock:
+            self._stock = {str(item["AssetId"]): item["StockId"] for item in stock}
+            self._synced_at = time.time()
+        return stock
+
+    def _refresh_if_stale(self):
+        if time.time() - self._synced_at >= self.refresh_interval:
+            self.refresh()
+
+    def get(self, assetid):
+        """StockId for `assetid`, or None"""
+        assetid = str(assetid)
+        if assetid not in self._stock:
+            self._refresh_if_stale()
+        return self._stock.get(assetid)
+
+    def __contains__(self, assetid):
+        return self.get(assetid) is not None
+
+    def lookup(self, assetids) -> dict:
+        """AssetId -> StockId for the `assetids` in stock, with at most one rescan for all misses"""
+        assetids = [str(assetid) for assetid in assetids]
+        if any(assetid not in self._stock for assetid in assetids):
+            self._refresh_if_stale()
+        return {assetid: self._stock[assetid] for assetid in assetids if assetid in self._stock}
+
+    def forget(self, assetids):
+        """Drop assets that left the stock"""
+        with self._lock:
+            for assetid in assetids:
+                self._stock.pop(str(assetid), None)
+
+    def apply_orders(self, orders: list):
+        """Drop the assets of sold orders. Order records without an AssetId are ignored"""
+        self.forget([order["AssetId"] for order in orders if order.get("AssetId")])
+
+    def invalidate(self):
+        """Forget every StockId, the next lookup rescans"""
+        with self._lock:
+            self._stock = {}
+            self._synced_at = 0.0
 
 
 class ECOsteamClient:
     # See API docs: https://openapi.ecosteam.cn/index.html/
-    def __rps_counter(self):
-        try:
-            self.rps = 0
-        except RuntimeError:
-            pass
-
     def __init__(self, partnerId, RSAKey, qps=10) -> None:
         self.logger = PluginLogger("ECOsteam.cn")
         self.partnerId = partnerId
         self.RSAKey = RSAKey
+        self.signer = RSASigner(RSAKey)
+        # One keep-alive pool per client, so batches don't pay a TCP+TLS handshake per call
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(int(qps), 10))
+        self.session.mount("https://", adapter)
+        self.session.headers.update(
+            {"User-Agent": "Steamauto " + CURRENT_VERSION, "Content-Type": "application/json", "Accept-Encoding": "gzip, deflate"}
+        )
         self.qps = qps
-        self.rps = 0
-        logging.getLogger("apscheduler").propagate = False
-        logging.getLogger("apscheduler").setLevel(logging.WARNING)
-        scheduler = BackgroundScheduler(timezone=timezone("Asia/Shanghai"))
-        jobHandler.add(scheduler.add_job(self.__rps_counter, "interval", seconds=1))
-        scheduler.start()
+        # Thread-safe, so concurrent callers share the qps budget instead of each assuming it's theirs
+        self.rate_limiter = RateLimiter(max(int(qps), 1), 1.0)
+        self.stock_index = ECOStockIndex(self)
 
     def post(self, api: str, data: dict):
+        self.rate_limiter.acquire()
         data["PartnerId"] = self.partnerId
         data["Timestamp"] = int(time.time())
-        data["Sign"] = generate_rsa_signature(self.RSAKey, data)
-        if self.rps >= self.qps:
-            time.sleep(1)
-        self.rps += 1
-        resp = requests.post(
-            "https://openapi.ecosteam.cn" + api,
-            data=json.dumps(data, indent=4),
-            headers={"User-Agent": "Steamauto " + CURRENT_VERSION, "Content-Type": "application/json"},
-        )
+        data["Sign"] = self.signer.sign(data)
+        resp = self.session.post("https://openapi.ecosteam.cn" + api, data=body_encoder.encode(data))
         data["Sign"] = "******"
         self.logger.debug(f"POST {api} {json.dumps(data,ensure_ascii=False)} {resp.text}")
         # if not resp.ok:
@@ -144,40 +203,32 @@ class ECOsteamClient:
     def QueryStock(self, index, PageSize=100):
         return self.post("/Api/Selling/QueryStock", data={"PageIndex": index, "PageSize": PageSize})
 
-    def getFullInventory(self):
+    def getFullInventory(self, PageSize=100) -> list:
         index = 1
         inv = list()
         while True:
-            res = self.QueryStock(index).json()
+            res = self.QueryStock(index, PageSize=PageSize).json()
             if res["ResultCode"] != "0":
                 raise Exception(res["ResultMsg"])
             elif res["ResultData"]["PageResult"] == []:
                 break
             else:
+                self.logger.debug(f'Iteration {index}, fetched {len(res["ResultData"]["PageResult"])} inventory items this page')
                 index += 1
                 inv += res["ResultData"]["PageResult"]
+                if len(res["ResultData"]["PageResult"]) < PageSize:
+                    break
+        return inv
 
-    def searchStockIds(self, assetId: list):
-        index = 1
-        inv = dict()
-        while True:
-            res = self.QueryStock(index).json()
-            if res["ResultCode"] != "0":
-                raise Exception(res["ResultMsg"])
-            elif res["ResultData"]["PageResult"] == []:
-                break
-            else:
-                self.logger.debug(f'Iteration {index}, fetched {len(res["ResultData"]["PageResult"])} inventory items this page')
-                index += 1
-                for item in res["ResultData"]["PageResult"]:
-                    if item["AssetId"] in assetId:
-                        inv[item["AssetId"]] = item["StockId"]
-                        assetId.remove(item["AssetId"])
-                        if assetId == []:
-                            return inv
+    def searchStockIds(self, assetId: list) -> dict:
+        """AssetId -> StockId for the given asset IDs, answered from the stock index"""
+        return self.stock_index.lookup(assetId)
 
     def RefreshUserSteamStock(self):
-        return self.post("/Api/Selling/RefreshUserSteamStock", data={})
+        response = self.post("/Api/Selling/RefreshUserSteamStock", data={})
+        # ECO re-reads the Steam inventory, StockIds may have changed
+        self.stock_index.invalidate()
+        return response
 
     def QuerySteamAccountList(self):
         return self.post("/Api/Merchant/QuerySteamAccountList", data={})
@@ -219,12 +270,12 @@ class ECOsteamClient:
         for good in goods:
             lease_assets.append(
                 LeaseAsset(
-                    assetid=good["AssetId"],
+                    assetid=str(good["AssetId"]),
                     orderNo=good["GoodsNum"],
-                    LeaseMaxDays=good["RentMaxDay"],
-                    LeaseUnitPrice=good["Price"],
-                    LeaseDeposit=good["Deposits"],
-                    LongLeaseUnitPrice=good["LongRentPrice"],
+                    LeaseMaxDays=int(good["RentMaxDay"]),
+                    LeaseUnitPrice=float(good["Price"]),
+                    LeaseDeposit=float(good["Deposits"]),
+                    LongLeaseUnitPrice=float(good["LongRentPrice"] or 0),
                     market_hash_name=good['GoodsName'],
                 )
             )
@@ -283,7 +334,7 @@ class ECOsteamClient:
         for rsp_asset in lease_assets_dict.values():
             assets.append(models.ECORentAsset.fromLeaseAsset(rsp_asset).model_dump(exclude_none=True))
 
-        batches = [assets[i : i + 100] for i in range(0, len(assets), 100)]
+        batches = [assets[i : i + PUBLISH_BATCH_SIZE] for i in range(0, len(assets), PUBLISH_BATCH_SIZE)]
         change_reonshelf_list = []
         success_count = 0
         for batch in batches:
@@ -324,7 +375,7 @@ class ECOsteamClient:
                             asset['SellPrice'] = sell_asset['Price']
                             break
                 asset['TradeTypes'] = [1, 2]
-            batches = [change_reonshelf_list[i : i + 100] for i in range(0, len(change_reonshelf_list), 100)]
+            batches = [change_reonshelf_list[i : i + PUBLISH_BATCH_SIZE] for i in range(0, len(change_reonshelf_list), PUBLISH_BATCH_SIZE)]
             for batch in batches:
                 rsp = self.post(
                     "/Api/Rent/PublishRentAndSaleGoods", {"SteamId": steamid, "PublishType": 2, "Assets": batch}
@@ -29,6 +29,16 @@ hidden_imports = [
         'utils.old_version_patches',
         'utils.build_info',
         'utils.cloud_service',
+        'utils.rate_limiter',
+        'utils.master_panel',
+        'utils.currency',
+        'utils.buff_history',
+        'utils.profit_report',
+        'utils.scheduler',
+        'utils.lease_price',
+        'utils.reprice',
+        'utils.shelf_diff',
+        'utils.job_queue',
         'utils.static',
         'json5',
         'numpy',
@@ -1,14 +1,16 @@
 import re
-import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import ROUND_HALF_UP, Decimal
 
 import json5
-import requests
 from bs4 import BeautifulSoup
 import utils.static as static
 from BuffApi import BuffAccount
 from utils.buff_helper import get_valid_session_for_buff
+from utils.currency import get_currency_service
 from utils.logger import PluginLogger, handle_caught_exception
+from utils.master_panel import get_master_panel_reporter
 from utils.steam_client import accept_trade_offer
 from utils.tools import exit_code
 from utils.multi_account_manager import get_multi_account_manager
@@ -23,18 +25,16 @@ class BuffAutoAcceptOffer:
         self.SUPPORT_GAME_TYPES = [{"game": "csgo", "app_id": 730}]
         self.config = config
         self.order_info = {}
+        # order_id -> {"assetid", "float", "cny_price"} scraped from the to_deliver batch HTML
+        self.deliver_order_cache = {}
         
         self.master_panel_config = self.config.get("master_panel", {})
         self.api_url = self.master_panel_config.get("baseurl", "")
         self.api_key = self.master_panel_config.get("api_key", "")
-        
-        self.usd_to_cny_rate = 7.1098
-        self.exchange_rate_lock = threading.Lock()
-        self.exchange_rate_fetched = False
-        
+
         if self.api_url and self.api_key:
-            self.exchange_rate_thread = threading.Thread(target=self._exchange_rate_worker, daemon=True)
-            self.exchange_rate_thread.start()
+            # Kicks off a background refresh if the persisted rate is stale
+            get_currency_service().rate("CNY", "USD")
 
     def init(self) -> bool:
         return False
@@ -86,57 +86,127 @@ class BuffAutoAcceptOffer:
 
         return result
     
-    def fetch_exchange_rate(self):
-        """Fetch USD to CNY exchange rate from API"""
-        try:
-            response = requests.get("https://api.frankfurter.dev/v1/latest?base=USD", timeout=10)
-            if response.status_code == 200:
-                data = response.json()
-                cny_rate = data.get("rates", {}).get("CNY")
-                if cny_rate:
-                    with self.exchange_rate_lock:
-                        old_rate = self.usd_to_cny_rate
-                        self.usd_to_cny_rate = float(cny_rate)
-                        if old_rate != self.usd_to_cny_rate:
-                            logger.info(f"Updated USD to CNY exchange rate: {self.usd_to_cny_rate}")
-                    return True
-        except Exception as e:
-            logger.warning(f"Failed to fetch exchange rate: {str(e)}. Using cached rate: {self.usd_to_cny_rate}")
-        return False
-    
-    def _exchange_rate_worker(self):
-        """Background worker to fetch exchange rate every hour"""
-        self.fetch_exchange_rate()
-        self.exchange_rate_fetched = True
-        
-        while True:
-            time.sleep(3600)
-            self.fetch_exchange_rate()
-    
-    def round_price(self, price):
-        """Round price to 2 decimals: round up if third decimal >= 0.005, down if < 0.005"""
-        price_100 = price * 100
-        integer_part = int(price_100)
-        decimal_part = price_100 - integer_part
-        
-        if decimal_part >= 0.5:
-            return round((integer_part + 1) / 100, 2)
-        else:
-            return round(integer_part / 100, 2)
-    
+    def fetch_trades_and_orders_to_deliver(self):
+        """
+        Fetch Steam trades and the to_deliver list of every supported game at the same time.
+        Pacing is left to BuffAccount.rate_limiter instead of fixed sleeps.
+        :return: (trades, [(game, to_deliver_data), ...])
+        """
+        with ThreadPoolExecutor(max_workers=len(self.SUPPORT_GAME_TYPES) + 1) as executor:
+            trades_future = executor.submit(self.buff_account.get_steam_trade)
+            order_futures = [
+                (game, executor.submit(self.buff_account.get_sell_order_to_deliver, game["game"], game["app_id"]))
+                for game in self.SUPPORT_GAME_TYPES
+            ]
+            to_deliver = []
+            for game, future in order_futures:
+                try:
+                    to_deliver.append((game, future.result()))
+                except Exception as e:
+                    handle_caught_exception(e, "BuffAutoAcceptOffer", known=True)
+                    logger.error(f"Failed to fetch {game['game']} orders to deliver")
+            return trades_future.result(), to_deliver
+
+    def parse_deliver_order_row(self, row):
+        """Extract assetid, float and CNY price from a to_deliver batch `deliver-order` row"""
+        item_div = row.find("div", class_="item-detail-img")
+        if not item_div:
+            return None
+        assetid = item_div.get("data-assetid")
+        if not assetid:
+            return None
+
+        float_value = None
+        float_p = row.find("p", string=re.compile(r"Float:"))
+        if float_p:
+            float_match = re.search(r"Float:\s*([\d.]+)", float_p.get_text())
+            if float_match:
+                float_value = float_match.group(1)
+
+        cny_price = None
+        price_span = row.find("span", class_="custom-currency")
+        if price_span:
+            cny_price = price_span.get("data-price")
+
+        if float_value and cny_price:
+            return {"assetid": assetid, "float": float_value, "cny_price": cny_price}
+        return None
+
+    # Row attributes that name the order a to_deliver `deliver-order` row belongs to
+    ORDER_ID_ATTRIBUTES = ("data-orderid", "data-order-id", "data-order_id")
+
+    def get_row_order_id(self, row, order_ids):
+        """Order ID named by one of the row's ORDER_ID_ATTRIBUTES, None if it carries none of the requested ones"""
+        for attribute in self.ORDER_ID_ATTRIBUTES:
+            order_id = row.get(attribute)
+            if order_id and str(order_id) in order_ids:
+                return str(order_id)
+        return None
+
+    def get_float_map(self, trades):
+        """
+        Build assetid -> {"float", "cny_price"} for the given trades.
+        Scraped orders are cached by order ID, so the batch endpoint is only asked for orders not seen before.
+        Rows are only attributed by an explicit order ID attribute; orders no row could be attributed to are cached as misses (None).
+        """
+        def cached_float_map():
+            return {
+                entry["assetid"]: {"float": entry["float"], "cny_price": entry["cny_price"]}
+                for entry in self.deliver_order_cache.values()
+                if entry is not None
+            }
+
+        float_map = cached_float_map()
+        if all(any(item.get("assetid") in float_map for item in trade.get("items_to_trade", [])) for trade in trades):
+            return float_map
+
+        game_type = trades[0].get("game", "csgo")
+        html_page = self.buff_account.get_sell_order_to_deliver_page(game_type)
+        if not html_page:
+            return float_map
+        order_ids_match = re.search(r'sellingToDeliver\(\[(.*?)\],\s*\d+\)', html_page, re.DOTALL)
+        if not order_ids_match:
+            return float_map
+        order_ids = re.findall(r'"([^"]+)"', order_ids_match.group(1))
+
+        # Orders no longer waiting for delivery will not come back
+        for order_id in list(self.deliver_order_cache.keys()):
+            if order_id not in order_ids:
+                del self.deliver_order_cache[order_id]
+
+        new_order_ids = [order_id for order_id in order_ids if order_id not in self.deliver_order_cache]
+        if new_order_ids:
+            logger.debug(f"Scraping {len(new_order_ids)} new order(s) out of {len(order_ids)} waiting for delivery")
+            batch_data = self.buff_account.get_sell_order_to_deliver_batch(game_type, new_order_ids)
+            if batch_data.get("code") == "OK" and "data" in batch_data:
+                soup = BeautifulSoup(batch_data["data"], "html.parser")
+                rows = soup.find_all("tr", class_="deliver-order")
+                unattributed = 0
+                for row in rows:
+                    entry = self.parse_deliver_order_row(row)
+                    if not entry:
+                        continue
+                    order_id = self.get_row_order_id(row, new_order_ids)
+                    if order_id is None:
+                        # Can't tell which order the row belongs to, use it for this cycle only
+                        unattributed += 1
+                        float_map[entry["assetid"]] = {"float": entry["float"], "cny_price": entry["cny_price"]}
+                        continue
+                    self.deliver_order_cache[order_id] = entry
+                missed = [order_id for order_id in new_order_ids if order_id not in self.deliver_order_cache]
+                for order_id in missed:
+                    self.deliver_order_cache[order_id] = None
+                if missed:
+                    logger.warning(f"No to_deliver row attributed to {len(missed)} order(s) ({unattributed} row(s) carry no order ID), they won't be scraped again while waiting for delivery")
+
+        float_map.update(cached_float_map())
+        return float_map
+
     def calculate_prices(self, cny_price):
-        """Calculate platformPrice and actualPrice from CNY price"""
-        with self.exchange_rate_lock:
-            usd_to_cny = self.usd_to_cny_rate
-        
-        usd_price = float(cny_price) / usd_to_cny
-        platform_price = self.round_price(usd_price)
-        
-        actual_price = platform_price / 1.025
-        actual_price = actual_price / 1.01
-        actual_price = self.round_price(actual_price)
-        
-        return platform_price, actual_price
+        """Calculate platformPrice and actualPrice (USD) from CNY price"""
+        platform_price = get_currency_service().convert(cny_price, "CNY", "USD")
+        actual_price = (platform_price / Decimal("1.025") / Decimal("1.01")).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+        return float(platform_price), float(actual_price)
     
     def truncate_float(self, value, decimals=16):
         """Truncate float to specified decimal places (not rounded)"""
@@ -144,7 +214,7 @@ class BuffAutoAcceptOffer:
         return int(float(value) * multiplier) / multiplier
     
     def post_to_master_panel(self, float_value, platform_price, actual_price, market_hash_name):
-        """POST item data to master panel API"""
+        """Queue item data for the master panel API, delivery happens in the background"""
         if not self.api_url or not self.api_key:
             return False
         
@@ -163,27 +233,10 @@ class BuffAutoAcceptOffer:
                 "type": "sell"
             }
             
-            response = requests.post(
-                f"{self.api_url}/items",
-                json=item_data,
-                headers={
-                    "Content-Type": "application/json",
-                    "X-API-Key": self.api_key
-                },
-                timeout=10
-            )
-            
-            if response.status_code in [200, 201]:
-                return True
-            else:
-                try:
-                    response_text = response.text
-                    logger.warning(f"Failed to post item to master panel. Status: {response.status_code}, Response: {response_text}")
-                except:
-                    logger.warning(f"Failed to post item to master panel. Status: {response.status_code}")
-                return False
+            get_master_panel_reporter(self.api_url, self.api_key).submit(item_data)
+            return True
         except Exception as e:
-            logger.error(f"Error posting to master panel: {str(e)}", exc_info=True)
+            logger.error(f"Error queueing item for master panel: {str(e)}", exc_info=True)
             return False
 
     def exec(self):
@@ -193,6 +246,10 @@ class BuffAutoAcceptOffer:
             proxies = self.config.get("proxies")
             logger.info("Detected Steam proxy settings, applying same proxy to BUFF...")
 
+        BuffAccount.set_rate_limit(
+            self.config["buff_auto_accept_offer"].get("request_rate", BuffAccount.DEFAULT_REQUEST_RATE),
+            self.config["buff_auto_accept_offer"].get("request_period", BuffAccount.DEFAULT_REQUEST_PERIOD),
+        )
         session = get_valid_session_for_buff(self.steam_client, logger, proxies=proxies)
         self.buff_account = BuffAccount(session, proxies=proxies)
 
@@ -297,103 +354,57 @@ class BuffAutoAcceptOffer:
                         logger.error("BUFF API returned invalid data. Check network or try later!")
 
                 if any(list(notification["to_deliver_order"].values()) + list(notification["to_confirm_sell"].values())):
-                    trades = self.buff_account.get_steam_trade()
-                    logger.info("Sleeping 5s to avoid hitting APIs too frequently...")
-                    time.sleep(5)
+                    trades, to_deliver = self.fetch_trades_and_orders_to_deliver()
 
                     if trades is None:
                         logger.error("Failed to fetch Steam trades. Retrying...")
                         time.sleep(5)
                         continue
 
-                    for index, game in enumerate(self.SUPPORT_GAME_TYPES):
-                        response_data = self.buff_account.get_sell_order_to_deliver(game["game"], game["app_id"])
-                        if response_data and "items" in response_data:
-                            trade_supply = response_data["items"]
-                            for trade_offer in trade_supply:
-                                if trade_offer["tradeofferid"] is not None and trade_offer["tradeofferid"] != "":
-                                    self.order_info[trade_offer["tradeofferid"]] = trade_offer
-                                    if not any(trade_offer["tradeofferid"] == trade["tradeofferid"] for trade in trades):
-                                        user_steamid = str(trade_offer.get('user_steamid', ''))
-                                        
-                                        if not user_steamid:
-                                            logger.warning(f"No user_steamid found in offer {trade_offer['tradeofferid']}")
-                                            continue
-                                            
-                                        target_client = multi_account_manager.get_client_for_steamid(user_steamid)
-                                        if not target_client:
-                                            logger.warning(f"No Steam client found for user_steamid: {user_steamid}")
-                                            continue
-                                            
-                                        trade_offer['target_client'] = target_client
-                                        trade_offer['user_steamid'] = user_steamid
-                                        for goods_id, goods_info in response_data["goods_infos"].items():
-                                            goods_id = str(goods_id)
-                                            trade_offer["goods_id"] = str(trade_offer["goods_id"])
-                                            if goods_id == trade_offer["goods_id"]:
-                                                trade_offer["goods_infos"] = {}
-                                                trade_offer["goods_infos"][goods_id] = goods_info
-                                                break
-                                        trades.append(trade_offer)
-
-                        if index != len(self.SUPPORT_GAME_TYPES) - 1:
-                            logger.info("Sleeping 5s to avoid hitting APIs too frequently...")
-                            time.sleep(5)
-
-                    seen_offers = set()
-                    unique_trades = []
+                    # Index by offer ID, first occurrence wins
+                    trades_by_offer_id = {}
                     for trade in trades:
                         offer_id = trade.get("tradeofferid")
-                        if offer_id and offer_id not in seen_offers:
-                            seen_offers.add(offer_id)
-                            unique_trades.append(trade)
-                    
-                    trades = unique_trades
+                        if offer_id and offer_id not in trades_by_offer_id:
+                            trades_by_offer_id[offer_id] = trade
+
+                    for game, response_data in to_deliver:
+                        if not response_data or "items" not in response_data:
+                            continue
+                        goods_infos = {str(goods_id): goods_info for goods_id, goods_info in response_data.get("goods_infos", {}).items()}
+                        for trade_offer in response_data["items"]:
+                            offer_id = trade_offer["tradeofferid"]
+                            if offer_id is None or offer_id == "":
+                                continue
+                            self.order_info[offer_id] = trade_offer
+                            if offer_id in trades_by_offer_id:
+                                continue
+                            user_steamid = str(trade_offer.get('user_steamid', ''))
+
+                            if not user_steamid:
+                                logger.warning(f"No user_steamid found in offer {offer_id}")
+                                continue
+
+                            target_client = multi_account_manager.get_client_for_steamid(user_steamid)
+                            if not target_client:
+                                logger.warning(f"No Steam client found for user_steamid: {user_steamid}")
+                                continue
+
+                            trade_offer['target_client'] = target_client
+                            trade_offer['user_steamid'] = user_steamid
+                            trade_offer["goods_id"] = str(trade_offer["goods_id"])
+                            if trade_offer["goods_id"] in goods_infos:
+                                trade_offer["goods_infos"] = {trade_offer["goods_id"]: goods_infos[trade_offer["goods_id"]]}
+                            trades_by_offer_id[offer_id] = trade_offer
+
+                    trades = list(trades_by_offer_id.values())
                     unprocessed_count = len(trades)
                     logger.info(f"Found {unprocessed_count} unique BUFF offer(s) to process")
                     
                     float_map = {}
                     if len(trades) > 0:
                         try:
-                            game_type = trades[0].get("game", "csgo")
-                            
-                            html_page = self.buff_account.get_sell_order_to_deliver_page(game_type)
-                            if html_page:
-                                order_ids_match = re.search(r'sellingToDeliver\(\[(.*?)\],\s*\d+\)', html_page, re.DOTALL)
-                                if order_ids_match:
-                                    order_ids_str = order_ids_match.group(1)
-                                    order_ids = re.findall(r'"([^"]+)"', order_ids_str)
-                                    
-                                    if order_ids:
-                                        batch_data = self.buff_account.get_sell_order_to_deliver_batch(game_type, order_ids)
-                                        if batch_data.get("code") == "OK" and "data" in batch_data:
-                                            html_content = batch_data["data"]
-                                            soup = BeautifulSoup(html_content, "html.parser")
-                                            order_rows = soup.find_all("tr", class_="deliver-order")
-                                            
-                                            for row in order_rows:
-                                                item_div = row.find("div", class_="item-detail-img")
-                                                if item_div:
-                                                    assetid = item_div.get("data-assetid")
-                                                    if assetid:
-                                                        float_p = row.find("p", string=re.compile(r"Float:"))
-                                                        float_value = None
-                                                        if float_p:
-                                                            float_text = float_p.get_text()
-                                                            float_match = re.search(r"Float:\s*([\d.]+)", float_text)
-                                                            if float_match:
-                                                                float_value = float_match.group(1)
-                                                        
-                                                        price_span = row.find("span", class_="custom-currency")
-                                                        cny_price = None
-                                                        if price_span:
-                                                            cny_price = price_span.get("data-price")
-                                                        
-                                                        if assetid and float_value and cny_price:
-                                                            float_map[assetid] = {
-                                                                "float": float_value,
-                                                                "cny_price": cny_price
-                                                            }
+                            float_map = self.get_float_map(trades)
                         except Exception as e:
                             logger.error(f"[BuffAutoAcceptOffer] Failed to fetch float values: {str(e)}", exc_info=True)
 
@@ -478,7 +489,7 @@ class BuffAutoAcceptOffer:
                                             try:
                                                 platform_price, actual_price = self.calculate_prices(cny_price)
                                                 if self.post_to_master_panel(float_value, platform_price, actual_price, market_hash_name):
-                                                    logger.info(f"Successfully sent item {item_name} to master panel")
+                                                    logger.info(f"Queued item {item_name} for master panel")
                                             except Exception as e:
                                                 logger.warning(f"Failed to process prices for master panel: {str(e)}")
                                         elif self.api_url and self.api_key:
@@ -6,6 +6,7 @@ import json5
 import requests
 
 from utils.buff_helper import get_valid_session_for_buff
+from utils.buff_history import get_buff_history_store
 from utils.logger import handle_caught_exception
 from utils.static import (BUFF_COOKIES_FILE_PATH, SESSION_FOLDER,
                           SUPPORT_GAME_TYPES)
@@ -32,53 +33,10 @@ class BuffAutoComment:
         return False
 
     def get_buy_history(self, game: str) -> dict:
-        local_history = {}
-        history_file_path = os.path.join(SESSION_FOLDER, "buy_history_" + game + ".json")
-        try:
-            if os.path.exists(history_file_path):
-                with open(history_file_path, "r", encoding=get_encoding(history_file_path)) as f:
-                    local_history = json5.load(f)
-        except Exception as e:
-            self.logger.debug("[BuffAutoComment] Failed to read local purchase records: " + str(e), exc_info=True)
-        page_num = 1
-        result = {}
-        while True:
-            self.logger.debug(f"[BuffAutoComment] Fetching {game} purchase history, page: {page_num}")
-            url = ("https://buff.163.com/api/market/buy_order/history?page_num=" + str(page_num) +
-                   "&page_size=300&game=" + game)
-            response_json = self.session.get(url, headers=self.buff_headers).json()
-            if response_json["code"] != "OK":
-                self.logger.error("[BuffAutoComment] Failed to get historical orders")
-                break
-            items = response_json["data"]["items"]
-            should_break = False
-            for item in items:
-                if item['state'] != 'SUCCESS':
-                    continue
-                keys_to_form_dict_key = ["appid", "assetid", "classid", "contextid"]
-                keys_list = []
-                for key in keys_to_form_dict_key:
-                    keys_list.append(str(item["asset_info"][key]))
-                key_str = "_".join(keys_list)
-                if key_str not in result:  # Use the latest price
-                    result[key_str] = item["price"]
-                if key_str in local_history and item["price"] == local_history[key_str]:
-                    self.logger.info("[BuffAutoComment] No newer orders after this point, stopping pagination")
-                    should_break = True
-                    break
-            if len(items) < 300 or should_break:
-                break
-            page_num += 1
-            self.logger.info("[BuffAutoComment] Sleeping 15s to avoid account ban")
-            time.sleep(15)
-        if local_history:
-            for key in local_history:
-                if key not in result:
-                    result[key] = local_history[key]
-        if result:
-            with open(history_file_path, "w", encoding="utf-8") as f:
-                json5.dump(result, f, indent=4)
-        return result
+        """assetkey -> latest purchase price, served from the shared local history store"""
+        store = get_buff_history_store()
+        store.sync(self.session, self.buff_headers, "buy", game)
+        return store.get_latest_prices("buy", game)
 
     def check_buff_account_state(self):
         response_json = self.session.get("https://buff.163.com/account/api/user/info", headers=self.buff_headers).json()
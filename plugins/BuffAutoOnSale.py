@@ -2,6 +2,7 @@ import datetime
 import os
 import pickle
 import random
+import threading
 import time
 
 import apprise
@@ -13,6 +14,7 @@ from bs4 import BeautifulSoup
 from utils.BuffApiCrypt import BuffApiCrypt
 from utils.buff_helper import get_valid_session_for_buff
 from utils.logger import handle_caught_exception
+from utils.scheduler import get_scheduler
 from utils.static import (BUFF_COOKIES_FILE_PATH, SESSION_FOLDER,
                           SUPPORT_GAME_TYPES)
 from utils.tools import get_encoding
@@ -787,7 +789,13 @@ class BuffAutoOnSale:
         custom_floats = False
         if 'custom_floats' in self.config["buff_auto_on_sale"]:
             custom_floats = self.config["buff_auto_on_sale"]["custom_floats"]
-        while True:
+        listing_lock = threading.Lock()
+
+        def listing_pass():
+            with listing_lock:
+                run_listing_pass()
+
+        def run_listing_pass():
             try:
                 with self.steam_client_mutex:
                     if not self.steam_client.is_session_alive():
@@ -800,24 +808,13 @@ class BuffAutoOnSale:
                         steam_session_path = os.path.join(SESSION_FOLDER, self.steam_client.username.lower() + ".pkl")
                         with open(steam_session_path, "wb") as f:
                             pickle.dump(self.steam_client.session, f)
-                now = datetime.datetime.now()
-                if now.hour in black_list_time:
-                    self.logger.info("[BuffAutoOnSale] Current time is in blacklist hours. Sleeping " + str(sleep_interval) + "s")
-                    time.sleep(sleep_interval)
-                    continue
-                if len(white_list_time) != 0 and now.hour not in white_list_time:
-                    self.logger.info("[BuffAutoOnSale] Current time is outside whitelist hours. Sleeping " + str(sleep_interval) + "s")
-                    time.sleep(sleep_interval)
-                    continue
+                # Blacklist/whitelist hours are enforced by the scheduler
                 if random.randint(1, 100) > random_chance:
-                    self.logger.info("[BuffAutoOnSale] Random chance not hit. Sleeping " + str(sleep_interval) + "s")
-                    time.sleep(sleep_interval)
-                    continue
+                    self.logger.info("[BuffAutoOnSale] Random chance not hit. Next try in " + str(sleep_interval) + "s")
+                    return
             except Exception as e:
                 handle_caught_exception(e, "[BuffAutoOnSale]", known=True)
-                self.logger.info("[BuffAutoOnSale] Sleeping " + str(sleep_interval) + "s")
-                time.sleep(sleep_interval)
-                continue
+                return
             try:
                 # Process all accounts if multi-account rotation is enabled
                 if self.multi_account_rotation:
@@ -918,13 +915,27 @@ class BuffAutoOnSale:
             except Exception as e:
                 handle_caught_exception(e, "[BuffAutoOnSale]", known=True)
                 self.logger.error("[BuffAutoOnSale] Listing failed. Error: " + str(e), exc_info=True)
-            self.logger.info("[BuffAutoOnSale] Sleeping " + str(sleep_interval) + "s")
-            sleep_cnt = int(sleep_interval // 60)
-            for _ in range(sleep_cnt):
-                time.sleep(60)
-                if 'buy_order' in self.config["buff_auto_on_sale"] and \
-                        self.config["buff_auto_on_sale"]["buy_order"]["enable"]:
+            self.logger.info("[BuffAutoOnSale] Next listing pass in " + str(sleep_interval) + "s")
+
+        def confirm_supply_order_pass():
+            # The listing pass confirms on its own, don't interleave with it
+            if listing_lock.acquire(blocking=False):
+                try:
                     self.confirm_supply_order()
+                finally:
+                    listing_lock.release()
+
+        scheduler = get_scheduler()
+        job = scheduler.add_interval_job("BuffAutoOnSale", listing_pass, seconds=sleep_interval,
+                                         allowed_hours=white_list_time, blocked_hours=black_list_time, run_now=True)
+        if job is None:
+            self.logger.error("[BuffAutoOnSale] blacklist_time/whitelist_time leave no hour to list in")
+            return
+        if black_list_time or white_list_time:
+            self.logger.info("[BuffAutoOnSale] Listing is limited to configured hours. Next pass: " + str(job.next_run_time))
+        if 'buy_order' in self.config["buff_auto_on_sale"] and self.config["buff_auto_on_sale"]["buy_order"]["enable"]:
+            scheduler.add_interval_job("BuffAutoOnSale.confirm_supply_order", confirm_supply_order_pass, seconds=60)
+        threading.Event().wait()
 
     def supply_item_to_buy_order(self, item, highest_buy_order, game, app_id):
         """
@@ -1,25 +1,66 @@
 import time
+from concurrent.futures import ThreadPoolExecutor
 
-from PyC5Game import C5Account
+from PyC5Game import INVALID_APP_KEY, C5Account, C5ApiError
 from utils.logger import PluginLogger, handle_caught_exception
-from utils.steam_client import accept_trade_offer, external_handler
+from utils.steam_client import accept_trade_offers, external_handler
 
 logger = PluginLogger("C5AutoAcceptOffer")
 
+# After asking C5 to send offers, look for them this often until they all arrived or the timeout passed
+OFFER_POLL_INTERVAL = 5
+OFFER_WAIT_TIMEOUT = 30
+
 
 class C5AutoAcceptOffer:
     def __init__(self, steam_client, steam_client_mutex, config):
         self.steam_client = steam_client
         self.steam_client_mutex = steam_client_mutex
         self.config = config
+        self.accepted_offers = set()
         with steam_client_mutex:
             self.steam_id = steam_client.get_steam64id_from_cookies()
 
     def init(self) -> bool:
         return False
 
+    def get_orders(self):
+        """(pending delivery, delivering) orders, both listings fetched at once"""
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            pending = executor.submit(self.client.getFullOrderList, status=1, steamId=self.steam_id)
+            delivering = executor.submit(self.client.getFullOrderList, status=2, steamId=self.steam_id)
+            return pending.result(), delivering.result()
+
+    def request_offers(self, orders) -> set:
+        """Ask C5 to send offers for the orders the external handler lets through, returns their order IDs"""
+        order_ids = [
+            order["orderId"]
+            for order in orders
+            if external_handler("C5-" + str(order["orderId"]), desc=f"Platform: C5Game\nItem: {order['name']}\nOrder price: {order['price']} RMB")
+        ]
+        if order_ids:
+            logger.info(f"Sending {len(order_ids)} offer(s)...")
+            for resp in self.client.deliverAll(order_ids):
+                if not resp.get("success", False):
+                    logger.error(f"C5 failed to send some offers: {resp}")
+        return set(order_ids)
+
+    def accept_offers(self, orders) -> set:
+        """Accept the offers of delivering orders, returns the IDs of orders whose offer was there"""
+        offers = []
+        ready = set()
+        for order in orders:
+            offer_id = (order.get("orderConfirmInfoDTO") or {}).get("offerId")
+            if not offer_id:
+                continue
+            ready.add(order["orderId"])
+            offers.append((offer_id, f"Platform: C5Game\nItem: {order['name']}\nOrder price: {round(order['price'], 2)} RMB"))
+        if offers:
+            done = accept_trade_offers(self.steam_client, self.steam_client_mutex, offers, accepted=self.accepted_offers, reportToExternal=False)
+            logger.info(f"Delivered {len(done)} order(s)")
+        return ready
+
     def exec(self):
-        ignored_list = []
         try:
             self.interval = self.config.get("c5_auto_accept_offer").get("interval")
         except Exception as e:
@@ -28,7 +69,7 @@ class C5AutoAcceptOffer:
 
         app_key = self.config.get("c5_auto_accept_offer").get("app_key")
         self.client = C5Account(app_key)
-        if self.client.checkAppKey:
+        if self.client.checkAppKey():
             logger.info("C5 account login successful")
         else:
             logger.error("C5 account login failed. Check 'app_key' in the config file.")
@@ -37,62 +78,24 @@ class C5AutoAcceptOffer:
         while True:
             try:
                 logger.info("Checking for pending delivery orders...")
-                notDeliveredOrders = []
-                page = 0
-                while True:
-                    page += 1
-                    resp = self.client.orderList(status=1, page=page, steamId=self.steam_id)
-                    if resp.get("errorCode", "") == 400001:
-                        logger.error("Invalid app_key. Check 'app_key' in the config file.")
-                        logger.error("Plugin stopped due to invalid app_key.")
-                        return 1
-                    notDeliveredOrders = resp.get("data").get("list", [])
-                    if len(resp.get("data").get("list", [])) < resp["data"]["limit"]:
-                        break
-                logger.info(f"Found {len(notDeliveredOrders)} pending delivery orders")
-                if notDeliveredOrders:
-                    toSendOrderIds = []
-                    for order in notDeliveredOrders:
-                        if external_handler(
-                            "C5-" + str(order["orderId"]),
-                            desc=f"Platform: C5Game\nItem: {order['name']}\nOrder price: {order['price']} RMB",
-                        ):
-                            toSendOrderIds.append(order["orderId"])
-                    if len(toSendOrderIds) > 0:
-                        logger.info(f"Sending {len(toSendOrderIds)} offer(s)...")
-                        self.client.deliver(toSendOrderIds)
-                        logger.info("Requested C5 server to send offers. Will fetch offer IDs in 30 seconds")
-                        time.sleep(30)
+                notDeliveredOrders, deliveringOrders = self.get_orders()
+                logger.info(f"Found {len(notDeliveredOrders)} pending delivery orders and {len(deliveringOrders)} orders in delivery")
+                self.accept_offers(deliveringOrders)
 
-                deliveringOrders = []
-                page = 0
-                while True:
-                    page += 1
-                    resp = self.client.orderList(status=2, page=page, steamId=self.steam_id)
-                    deliveringOrders = resp.get("data").get("list", [])
-                    if len(resp.get("data").get("list", [])) < resp["data"]["limit"]:
-                        break
-                logger.info(f"Found {len(deliveringOrders)} orders in delivery")
-                for deliveringOrder in deliveringOrders:
-                    logger.info(f"Processing order {deliveringOrder['name']} ...")
-                    offerId = deliveringOrder["orderConfirmInfoDTO"]["offerId"]
-                    if offerId in ignored_list:
-                        logger.info(f"Order {deliveringOrder['name']} already delivered. Skipping")
-                        continue
-                    if accept_trade_offer(
-                        self.steam_client,
-                        self.steam_client_mutex,
-                        offerId,
-                        desc=f"Platform: C5Game\nItem: {deliveringOrder['name']}\nOrder price: {round(deliveringOrder['price'], 2)} RMB",
-                        reportToExternal=False,
-                    ):
-                        logger.info(f"Order {deliveringOrder['name']} delivered")
-                        ignored_list.append(offerId)
-                        if deliveringOrders.index(deliveringOrder) != len(deliveringOrders) - 1:
-                            logger.info("To avoid frequent Steam requests, waiting 3 seconds before next order")
-                            time.sleep(3)
-                    else:
-                        logger.error(f"Order {deliveringOrder['name']} delivery failed. Check network or Steam account.")
+                requested = self.request_offers(notDeliveredOrders)
+                deadline = time.time() + OFFER_WAIT_TIMEOUT
+                while requested and time.time() < deadline:
+                    time.sleep(OFFER_POLL_INTERVAL)
+                    deliveringOrders = self.client.getFullOrderList(status=2, steamId=self.steam_id)
+                    requested -= self.accept_offers([order for order in deliveringOrders if order["orderId"] in requested])
+                if requested:
+                    logger.info(f"{len(requested)} offer(s) not sent by C5 yet. Will retry next check")
+            except C5ApiError as e:
+                if e.error_code == INVALID_APP_KEY:
+                    logger.error("Invalid app_key. Check 'app_key' in the config file.")
+                    logger.error("Plugin stopped due to invalid app_key.")
+                    return 1
+                handle_caught_exception(e, prefix="C5AutoAcceptOffer")
             except Exception as e:
                 handle_caught_exception(e, prefix="C5AutoAcceptOffer")
             logger.info(f"Waiting {self.interval} seconds before rechecking for pending delivery orders")
@@ -1,24 +1,28 @@
 import copy
+import dataclasses
 import datetime
 import json
 import os
 import time
-from threading import Thread
-from typing import Dict, List, Union
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event, Thread
+from typing import List
 
 from BuffApi import BuffAccount
 from BuffApi.models import BuffOnSaleAsset
-from PyECOsteam import ECOsteamClient, models
+from PyECOsteam import PUBLISH_BATCH_SIZE, ECOsteamClient, models
 from steampy.client import SteamClient
 from utils import static
 from utils.buff_helper import get_valid_session_for_buff
+from utils.job_queue import get_shelf_job_queue
 from utils.logger import LogFilter, PluginLogger, handle_caught_exception
 from utils.models import Asset, LeaseAsset, ModelEncoder
+from utils.shelf_diff import compare_lease_shelf, compare_shelves
 from utils.static import ECOSTEAM_RSAKEY_FILE
 from utils.steam_client import accept_trade_offer, external_handler, get_cs2_inventory
 from utils.tools import exit_code, get_encoding
 from utils.uu_helper import get_valid_token_for_uu
-from uuyoupinapi import UUAccount
+from uuyoupinapi import ONSHELF_BATCH_SIZE, PRICE_CHANGE_BATCH_SIZE, UUAccount
 
 sync_sell_shelf_enabled = False
 sync_lease_shelf_enabled = False
@@ -31,181 +35,199 @@ sell_logger = PluginLogger("[ECOsteam.cn] [Sync multi-platform sales]")
 lease_logger = PluginLogger("[ECOsteam.cn] [Sync lease shelves]")
 accept_offer_logger = PluginLogger("[ECOsteam.cn] [Auto delivery]")
 
-
-def compare_shelves(A: List[Asset], B: List[Asset], ratio: float) -> Union[bool, dict[str, list[Asset]]]:
-    result = {"add": [], "delete": [], "change": []}
-    ratio = round(ratio, 2)
-
-    # Warn and remove elements that are not Asset
-    for asset in A.copy():
-        if not isinstance(asset, Asset):
-            sell_logger.debug("List A may contain items not yet off-shelved")
-            A.remove(asset)
-    for asset in B.copy():
-        if not isinstance(asset, Asset):
-            sell_logger.debug("List B may contain items not yet off-shelved")
-            B.remove(asset)
-
-    # Dicts for quick lookup
-    A_dict = {item.assetid: item for item in A}
-    B_dict = {item.assetid: item for item in B}
-
-    # Added and deleted
-    for assetid in A_dict:
-        if assetid not in B_dict:
-            adjusted_dict = A_dict[assetid].model_copy()
-            adjusted_dict.price = round(adjusted_dict.price / ratio, 2)
-            result["add"].append(adjusted_dict)
-
-    for assetid in B_dict:
-        if assetid not in A_dict:
-            result["delete"].append(B_dict[assetid])
-
-    # Price changes
-    for assetid in A_dict:
-        if assetid in B_dict:
-            A_price = A_dict[assetid].price
-            B_price = B_dict[assetid].price
-            if abs(round(A_price / B_price - ratio, 2)) > 0.01:
-                adjusted_dict = B_dict[assetid].model_copy()
-                adjusted_dict.price = round(A_price / ratio, 2)
-                result["change"].append(adjusted_dict)
-
-    return result
-
-
-def compare_lease_shelf(A: List[LeaseAsset], B: List[LeaseAsset], ratio: float) -> Dict[str, List[LeaseAsset]]:
-    result = {"add": [], "delete": [], "change": []}
-    ratio = round(ratio, 2)
-
-    # Warn and remove elements that are not Asset
-    for asset in A:
-        if not isinstance(asset, Asset):
-            sell_logger.debug("List A may contain items not yet off-shelved")
-            A.remove(asset)
-    for asset in B:
-        if not isinstance(asset, Asset):
-            sell_logger.debug("List B may contain items not yet off-shelved")
-            B.remove(asset)
-
-    A_dict = {item.assetid: item for item in A}
-    B_dict = {item.assetid: item for item in B}
-
-    for assetid in A_dict:
-        if assetid not in B_dict:
-            result["add"].append(A_dict[assetid])
-
-    for assetid in B_dict:
-        if assetid not in A_dict:
-            result["delete"].append(B_dict[assetid])
-
-    for assetid in A_dict:
-        if assetid in B_dict:
-            A_item = A_dict[assetid]
-            B_item = B_dict[assetid]
-
-            changes_needed = False
-            if A_item.LeaseDeposit != B_item.LeaseDeposit:
-                changes_needed = True
-            if A_item.LeaseMaxDays != B_item.LeaseMaxDays:
-                changes_needed = True
-            if round(abs(A_item.LeaseUnitPrice / B_item.LeaseUnitPrice - ratio), 2) >= 0.01:
-                changes_needed = True
-            if A_item.LongLeaseUnitPrice and B_item.LongLeaseUnitPrice:
-                if round(abs(A_item.LongLeaseUnitPrice / B_item.LongLeaseUnitPrice - ratio), 2) > 0.01:
-                    changes_needed = True
-            elif A_item.LongLeaseUnitPrice != B_item.LongLeaseUnitPrice:
-                changes_needed = True
-
-            if changes_needed:
-                adjusted_dict = A_item.model_copy()
-                adjusted_dict.orderNo = B_item.orderNo
-                adjusted_dict.LeaseUnitPrice = round(A_item.LeaseUnitPrice / ratio, 2)
-                if A_item.LongLeaseUnitPrice:
-                    adjusted_dict.LongLeaseUnitPrice = round(A_item.LongLeaseUnitPrice / ratio, 2)
-                result["change"].append(adjusted_dict)
-
-    return result
+# Pending orders are re-listed for the whole last 30 days this often, in between only orders since the last poll
+ORDER_FULL_SCAN_INTERVAL = 60 * 60
+# Order DetailsState of orders waiting for delivery
+WAIT_DELIVER_DETAILS_STATE = 8
+
+
+class ShelfState:
+    """
+    Last-known shelves per platform for incremental shelf sync.
+    The main platform and the Steam inventory are read on every pass; other platforms are only refetched after we pushed
+    changes to them, on their first pass, or on a full resync every `full_sync_every` passes. Between full resyncs only the
+    assets whose main listing changed since the previous pass, or that left the Steam inventory, are diffed.
+    """
+
+    def __init__(self, full_sync_every: int = 10):
+        self.full_sync_every = max(int(full_sync_every), 1)
+        self.passes = 0
+        self.shelves = {}
+        self.dirty = set()
+        # Platforms read during the current pass
+        self.fetched = set()
+        # assetid -> price key of the main platform listing at the previous pass
+        self.main_snapshot = {}
+
+    def start_pass(self) -> bool:
+        """Count a pass, True when it has to be a full resync"""
+        full_sync = self.passes % self.full_sync_every == 0
+        self.passes += 1
+        self.fetched = set()
+        return full_sync
+
+    def needs_fetch(self, platform, full_sync) -> bool:
+        return full_sync or platform in self.dirty or platform not in self.shelves
+
+    def store(self, platform, shelf):
+        self.shelves[platform] = shelf
+        self.dirty.discard(platform)
+        self.fetched.add(platform)
+
+    def mark_dirty(self, platform):
+        self.dirty.add(platform)
+
+    def reset(self):
+        """Forget everything, the next pass is a full resync"""
+        self.passes = 0
+        self.shelves = {}
+        self.dirty = set()
+        self.main_snapshot = {}
+
+    def changed_assets(self, main_shelf, price_key) -> set:
+        """Asset IDs listed, delisted or repriced on the main platform since the previous pass"""
+        snapshot = {asset.assetid: price_key(asset) for asset in main_shelf if isinstance(asset, Asset)}
+        changed = {assetid for assetid in snapshot.keys() | self.main_snapshot.keys() if snapshot.get(assetid) != self.main_snapshot.get(assetid)}
+        self.main_snapshot = snapshot
+        return changed
+
+    def gone_assets(self, inventory) -> set:
+        """Asset IDs on a last-known shelf that are no longer in the Steam inventory, i.e. sold or traded away since"""
+        return {
+            asset.assetid
+            for shelf in self.shelves.values()
+            for asset in shelf
+            if isinstance(asset, Asset) and asset.assetid not in inventory
+        }
+
+    def affected(self, main_platform, platform, changed):
+        """(main shelf, platform shelf) to diff for `platform`, narrowed to `changed` when it was not refetched this pass"""
+        main_shelf, shelf = self.shelves[main_platform], self.shelves[platform]
+        if platform in self.fetched:
+            return list(main_shelf), list(shelf)
+        return (
+            [asset for asset in main_shelf if isinstance(asset, Asset) and asset.assetid in changed],
+            [asset for asset in shelf if isinstance(asset, Asset) and asset.assetid in changed],
+        )
 
 
 class tasks:
+    """
+    Publishing worker for one platform. Shelf sync queues listing/repricing jobs, `run` publishes them from its own thread
+    in batches of the platform's largest request, so the next diff can run while a batch is still going out.
+    Jobs live in the durable shelf job queue: one job per asset and kind, retried with backoff, kept across restarts.
+    """
+
     def __init__(self, client, steamid) -> None:
-        self.sell_queue = []
-        self.sell_change_queue = []
-        self.lease_queue = []
-        self.lease_change_queue = []
         self.client = client
         self.steamid = steamid
+        self.queue = get_shelf_job_queue()
+        self.wakeup = Event()
         if isinstance(self.client, ECOsteamClient):
             self.platform = "ECOsteam"
+            self.batch_sizes = {"add": PUBLISH_BATCH_SIZE, "change": PUBLISH_BATCH_SIZE}
         elif isinstance(self.client, UUAccount):
             self.platform = "UUyoupin"
+            self.batch_sizes = {"add": ONSHELF_BATCH_SIZE, "change": PRICE_CHANGE_BATCH_SIZE}
+
+    def put(self, kind, assets):
+        self.queue.put(self.platform, self.steamid, kind, assets)
+        self.wakeup.set()
 
     def sell_add(self, assets: List[Asset]):
-        self.sell_queue += assets
+        self.put("sell_add", assets)
 
     def sell_change(self, assets: List[Asset]):
-        self.sell_change_queue += assets
+        self.put("sell_change", assets)
 
-    def sell_remove(self, assetId: str):
-        for asset in self.sell_queue:
-            if asset.assetid == assetId:
-                self.sell_queue.remove(asset)
-                break
+    def sell_remove(self, assetIds: List[str]):
+        """Forget queued sale listing/repricing for assets that are being delisted"""
+        self.queue.remove(self.platform, self.steamid, ["sell_add", "sell_change"], assetIds)
+
+    def sell_retain(self, assetIds):
+        """Forget queued sale jobs for assets the main platform no longer lists"""
+        dropped = self.queue.retain(self.platform, self.steamid, ["sell_add", "sell_change"], assetIds)
+        if dropped:
+            logger.info(f"{self.platform}: dropped {dropped} queued sale job(s) for items no longer listed on the main platform")
 
     def lease_add(self, assets: List[LeaseAsset]):
-        self.lease_queue += assets
+        self.put("lease_add", assets)
 
     def lease_change(self, assets: List[LeaseAsset]):
-        self.lease_change_queue += assets
-
-    def lease_remove(self, assetId: str):
-        for asset in self.lease_queue:
-            if asset.assetid == assetId:
-                self.lease_queue.remove(asset)
-                break
+        self.put("lease_change", assets)
+
+    def lease_remove(self, assetIds: List[str]):
+        """Forget queued lease listing/repricing for assets that are being delisted"""
+        self.queue.remove(self.platform, self.steamid, ["lease_add", "lease_change"], assetIds)
+
+    def lease_retain(self, assetIds):
+        """Forget queued lease jobs for assets the main platform no longer lists"""
+        dropped = self.queue.retain(self.platform, self.steamid, ["lease_add", "lease_change"], assetIds)
+        if dropped:
+            logger.info(f"{self.platform}: dropped {dropped} queued lease job(s) for items no longer listed on the main platform")
+
+    def publish(self, operation) -> bool:
+        """
+        Send one batch of due `operation` ("add" lists, "change" reprices) jobs, sale jobs first.
+        :return: False if nothing was due
+        """
+        sell_jobs = self.queue.take(self.platform, self.steamid, "sell_" + operation, self.batch_sizes[operation])
+        lease_jobs = self.queue.take(self.platform, self.steamid, "lease_" + operation, self.batch_sizes[operation] - len(sell_jobs))
+        if not sell_jobs and not lease_jobs:
+            return False
+        sell_assets = [asset for asset, _ in sell_jobs]
+        lease_assets = [asset for asset, _ in lease_jobs]
+        action = "List" if operation == "add" else "Reprice"
+        logger.info(f"{self.platform}: will {action.lower()} {len(sell_assets)} sale items and {len(lease_assets)} lease items")
+        logger.debug(f"{self.platform} {action.lower()} batch: " + json.dumps(sell_assets + lease_assets, cls=ModelEncoder, ensure_ascii=False))
+        try:
+            if isinstance(self.client, ECOsteamClient):
+                success_count, failure_count = self.client.PublishRentAndSaleGoods(self.steamid, 1 if operation == "add" else 2, sell_assets, lease_assets)
+            elif operation == "add":
+                success_count, failure_count = self.client.onshelf_sell_and_lease(sell_assets, lease_assets)
+            else:
+                success_count, failure_count = self.client.change_price_sell_and_lease(sell_assets, lease_assets)
+        except Exception as e:
+            handle_caught_exception(e, known=False)
+            logger.error(f"Error during {action.lower()}: {e}")
+            self.queue.fail(self.platform, self.steamid, "sell_" + operation, sell_jobs, str(e))
+            self.queue.fail(self.platform, self.steamid, "lease_" + operation, lease_jobs, str(e))
+            return True
+        if success_count == 0 and failure_count != 0:
+            # Nothing went through, retry the whole batch later
+            self.queue.fail(self.platform, self.steamid, "sell_" + operation, sell_jobs, "all items failed")
+            self.queue.fail(self.platform, self.steamid, "lease_" + operation, lease_jobs, "all items failed")
+        else:
+            # Only counts are reported. Items that failed are still missing from the shelf and the next diff queues them again
+            self.queue.complete(self.platform, self.steamid, "sell_" + operation, sell_jobs)
+            self.queue.complete(self.platform, self.steamid, "lease_" + operation, lease_jobs)
+        if failure_count != 0:
+            logger.error(f"{action} failed for {failure_count} items")
+        logger.info(f"{action} succeeded for {success_count} items")
+        return True
 
     def process(self):
-        logger.debug(self.platform + " sell queue: " + json.dumps(self.sell_queue, cls=ModelEncoder, ensure_ascii=False))
-        logger.debug(self.platform + " lease queue: " + json.dumps(self.lease_queue, cls=ModelEncoder, ensure_ascii=False))
-        logger.debug(self.platform + " sell reprice queue: " + json.dumps(self.sell_change_queue, cls=ModelEncoder, ensure_ascii=False))
-        logger.debug(self.platform + " lease reprice queue: " + json.dumps(self.lease_change_queue, cls=ModelEncoder, ensure_ascii=False))
-        if len(self.sell_queue) > 0 or len(self.lease_queue) > 0 or len(self.sell_change_queue) > 0 or len(self.lease_change_queue) > 0:
-            logger.info(self.platform + " task queue start")
-        else:
-            logger.info(self.platform + " task queue empty. Nothing to do")
+        """Publish every due job, listings before repricing"""
+        pending = self.queue.pending(self.platform, self.steamid)
+        if not pending:
+            logger.debug(self.platform + " task queue empty. Nothing to do")
+            return
+        logger.info(f"{self.platform} task queue start. Queued: {pending}")
+        for operation in ["add", "change"]:
+            while self.publish(operation):
+                pass
 
-        if len(self.sell_queue) > 0 or len(self.lease_queue) > 0:
-            logger.info(f"Will list {len(self.sell_queue)} items to sale shelf")
-            logger.info(f"Will list {len(self.lease_queue)} items to lease shelf")
-            success_count, failure_count = 0, 0
+    def run(self, idle_interval=60):
+        """Worker loop. Wakes up when jobs are queued or the earliest retry is due"""
+        while True:
+            self.wakeup.clear()
             try:
-                if isinstance(self.client, ECOsteamClient):
-                    success_count, failure_count = self.client.PublishRentAndSaleGoods(self.steamid, 1, self.sell_queue, self.lease_queue)
-                elif isinstance(self.client, UUAccount):
-                    success_count, failure_count = self.client.onshelf_sell_and_lease(self.sell_queue, self.lease_queue)
+                self.process()
             except Exception as e:
-                handle_caught_exception(e, known=False)
-                logger.error(f"Error during listing: {e}")
-            self.sell_queue = []
-            self.sell_change_queue = []
-            if failure_count != 0:
-                logger.error(f"Listing failed for {failure_count} items")
-            logger.info(f"Listing succeeded for {success_count} items")
-
-        if len(self.sell_change_queue) > 0 or len(self.lease_change_queue) > 0:
-            logger.info(f"Will reprice {len(self.sell_change_queue)} sale items")
-            logger.info(f"Will reprice {len(self.lease_change_queue)} lease items")
-            success_count, failure_count = 0, 0
-            if isinstance(self.client, ECOsteamClient):
-                success_count, failure_count = self.client.PublishRentAndSaleGoods(self.steamid, 2, self.sell_change_queue, self.lease_change_queue)
-            elif isinstance(self.client, UUAccount):
-                success_count, failure_count = self.client.change_price_sell_and_lease(self.sell_change_queue, self.lease_change_queue)
-            self.lease_queue = []
-            self.lease_change_queue = []
-            if failure_count != 0:
-                logger.error(f"Reprice failed for {failure_count} items")
-            logger.info(f"Reprice succeeded for {success_count} items")
+                handle_caught_exception(e, "ECOsteam.cn")
+            next_due = self.queue.next_due(self.platform, self.steamid)
+            timeout = idle_interval if next_due is None else min(max(next_due - time.time(), 1), idle_interval)
+            self.wakeup.wait(timeout)
 
 
 class ECOsteamPlugin:
@@ -214,7 +236,17 @@ class ECOsteamPlugin:
         self.steam_client_mutex = steam_client_mutex
         self.config = config
         self.ignored_offer = []
+        # Delivery polling state: OrderNum -> order still waiting for delivery, and orders already handled
+        self.pending_orders = {}
+        self.delivered_orders = set()
+        self.offer_sent_orders = set()
+        self.last_order_poll = None
+        self.last_full_order_scan = 0
         self.steam_id = static.STEAM_64_ID
+        full_sync_every = self.config.get("ecosteam", {}).get("full_sync_interval", 10)
+        self.sell_shelf_state = ShelfState(full_sync_every)
+        self.lease_shelf_state = ShelfState(full_sync_every)
+        self.inventory = None
 
     def init(self):
         if not os.path.exists(ECOSTEAM_RSAKEY_FILE):
@@ -275,59 +307,48 @@ class ECOsteamPlugin:
         else:
             self.auto_accept_offer()
 
-    # Fetch sales shelves for platforms
-    def get_shelf(self, platform, inventory):
-        assets = list()
+    # Fetch sales listings for platforms, without Steam inventory details
+    def get_listings(self, platform):
+        """[(Asset with assetid/orderNo/price only, item name)] as listed on `platform`"""
+        listings = list()
         if platform == "eco":
-            result = self.client.getFullSellGoodsList(self.steam_id)
-            if not inventory:
-                raise SystemError
-            for item in result:
-                asset = Asset(assetid=item["AssetId"], orderNo=item["GoodsNum"], price=float(item["Price"]))
-                try:
-                    asset.appid = inventory[asset.assetid]["appid"]
-                    asset.classid = inventory[asset.assetid]["classid"]
-                    asset.contextid = inventory[asset.assetid]["contextid"]
-                    asset.instanceid = inventory[asset.assetid]["instanceid"]
-                    asset.market_hash_name = inventory[asset.assetid]["market_hash_name"]
-                    assets.append(asset)
-                except KeyError:
-                    sell_logger.warning(f"ECOsteam listed item {item['GoodsName']} not found in Steam inventory")
-                    assets.append(asset.orderNo)
-            return assets
+            for item in self.client.getFullSellGoodsList(self.steam_id):
+                listings.append((Asset(assetid=str(item["AssetId"]), orderNo=item["GoodsNum"], price=float(item["Price"])), item["GoodsName"]))
         elif platform == "buff":
             data = self.buff_client.get_on_sale().json()["data"]
             items = data["items"]
             if data['total_count'] > 500:
                 items += self.buff_client.get_on_sale(page_num=2).json()["data"]["items"]
             for item in items:
-                asset = Asset(assetid=item["asset_info"]["assetid"], orderNo=item["id"], price=float(item["price"]))
-                try:
-                    asset.appid = inventory[asset.assetid]["appid"]
-                    asset.classid = inventory[asset.assetid]["classid"]
-                    asset.contextid = inventory[asset.assetid]["contextid"]
-                    asset.instanceid = inventory[asset.assetid]["instanceid"]
-                    asset.market_hash_name = inventory[asset.assetid]["market_hash_name"]
-                    assets.append(asset)
-                except KeyError:
-                    sell_logger.warning(f"BUFF listed item {data['goods_infos'][str(item['goods_id'])]['market_hash_name']} not found in Steam inventory")
-                    assets.append(asset.orderNo)
-            return assets
+                name = data['goods_infos'].get(str(item['goods_id']), {}).get('market_hash_name', item['goods_id'])
+                listings.append((Asset(assetid=str(item["asset_info"]["assetid"]), orderNo=item["id"], price=float(item["price"])), name))
         elif platform == "uu":
-            data = self.uu_client.get_sell_list()
-            for item in data:
-                asset = Asset(assetid=str(item["steamAssetId"]), orderNo=item["id"], price=float(item["sellAmount"]))
-                try:
-                    asset.appid = inventory[asset.assetid]["appid"]
-                    asset.classid = inventory[asset.assetid]["classid"]
-                    asset.contextid = inventory[asset.assetid]["contextid"]
-                    asset.instanceid = inventory[asset.assetid]["instanceid"]
-                    asset.market_hash_name = inventory[asset.assetid]["market_hash_name"]
-                    assets.append(asset)
-                except KeyError:
-                    sell_logger.warning(f"UU listed item {item['name']} not found in Steam inventory")
-                    assets.append(asset.orderNo)
-            return assets
+            for item in self.uu_client.shelf_index.refresh_sell():
+                listings.append((Asset(assetid=str(item["steamAssetId"]), orderNo=item["id"], price=float(item["sellAmount"])), item["name"]))
+        return listings
+
+    def build_shelf(self, platform, listings, inventory):
+        """Listings completed from the Steam inventory. Listings missing from the inventory are kept as their order numbers"""
+        if not inventory:
+            raise SystemError
+        assets = list()
+        for listing, name in listings:
+            try:
+                item = inventory[listing.assetid]
+                assets.append(
+                    dataclasses.replace(
+                        listing,
+                        appid=item["appid"],
+                        classid=item["classid"],
+                        contextid=item["contextid"],
+                        instanceid=item["instanceid"],
+                        market_hash_name=item["market_hash_name"],
+                    )
+                )
+            except KeyError:
+                sell_logger.warning(f"{platform.upper()} listed item {name} not found in Steam inventory")
+                assets.append(listing.orderNo)
+        return assets
 
     # Auto delivery thread
     def auto_accept_offer(self):
@@ -339,33 +360,76 @@ class ECOsteamPlugin:
                 accept_offer_logger.error("Unknown error. Retry later.")
                 time.sleep(self.config["ecosteam"]["auto_accept_offer"]["interval"])
 
+    def send_missing_offers(self, orders):
+        """Ask ECO to send offers for orders that have none yet. Returns the orders worth a detail lookup"""
+        ready = []
+        for order in orders:
+            if order['OrderStateCode'] == 1 and order['OrderNum'] not in self.offer_sent_orders:
+                if not external_handler('ECO-' + str(order['OrderNum']), desc=f"Platform: ECOsteam\nItem: {order['GoodsName']}\nOrder price: {order['OrderAmount']}"):
+                    accept_offer_logger.info(f"Order {order['OrderNum']} ignored by external handler. Skip sending offer")
+                    continue
+                logger.info(f"Order {order['OrderNum']} has no offer. Sending offer...")
+                try:
+                    self.client.SellerSendOffer(OrderNum=order["OrderNum"], GameId=730)
+                    accept_offer_logger.info(f"Order {order['OrderNum']} offer sent")
+                    self.offer_sent_orders.add(order['OrderNum'])
+                except Exception as e:
+                    handle_caught_exception(e, "ECOsteam.cn")
+                    accept_offer_logger.error(f"Order {order['OrderNum']} offer failed. Retry later.")
+                    continue
+            ready.append(order)
+        return ready
+
+    def forget_settled_orders(self):
+        """Anything no longer waiting for delivery can't come back, stop remembering it"""
+        self.delivered_orders &= self.pending_orders.keys()
+        self.offer_sent_orders &= self.pending_orders.keys()
+
+    def get_order_detail(self, order):
+        accept_offer_logger.debug(f"Fetching details for order {order['OrderNum']}")
+        try:
+            return self.client.GetSellerOrderDetail(OrderNum=order["OrderNum"]).json()["ResultData"]
+        except Exception as e:
+            handle_caught_exception(e, "ECOsteam.cn", known=True)
+            accept_offer_logger.error(f"Failed to fetch details for order {order['OrderNum']}. Retry later.")
+            return None
+
     # Auto delivery implementation
     def __auto_accept_offer(self):
         accept_offer_logger.info("Checking pending deliveries...")
-        today = datetime.datetime.today()
-        tomorrow = datetime.datetime.today() + datetime.timedelta(days=1)
-        last_month = today - datetime.timedelta(days=30)
-        tomorrow = tomorrow.strftime("%Y-%m-%d")
-        last_month = last_month.strftime("%Y-%m-%d")
-        wait_deliver_orders = self.client.getFullSellerOrderList(last_month, tomorrow, DetailsState=8, SteamId=self.steam_id)
+        poll_started = datetime.datetime.today()
+        tomorrow = (poll_started + datetime.timedelta(days=1)).strftime("%Y-%m-%d")
+        full_scan = self.last_order_poll is None or time.time() - self.last_full_order_scan > ORDER_FULL_SCAN_INTERVAL
+        if full_scan:
+            start = (poll_started - datetime.timedelta(days=30)).strftime("%Y-%m-%d")
+        else:
+            # The API filters by day, one day of overlap covers timezone differences with ECO's clock
+            start = (self.last_order_poll - datetime.timedelta(days=1)).strftime("%Y-%m-%d")
+        new_orders = self.client.getFullSellerOrderList(start, tomorrow, DetailsState=WAIT_DELIVER_DETAILS_STATE, SteamId=self.steam_id)
+        if full_scan:
+            self.pending_orders = {order['OrderNum']: order for order in new_orders}
+            self.last_full_order_scan = time.time()
+        else:
+            # Older orders still waiting are carried over from previous polls, their detail below tells whether they still are
+            for order in new_orders:
+                self.pending_orders[order['OrderNum']] = order
+        self.forget_settled_orders()
+        self.last_order_poll = poll_started
+
+        wait_deliver_orders = [order for order in self.pending_orders.values() if order['OrderNum'] not in self.delivered_orders]
         accept_offer_logger.info(f"Found {len(wait_deliver_orders)} pending orders")
         if len(wait_deliver_orders) > 0:
-            for order in wait_deliver_orders:
-                if order['OrderStateCode'] == 1:
-                    if not external_handler('ECO-' + str(order['OrderNum']), desc=f"Platform: ECOsteam\nItem: {order['GoodsName']}\nOrder price: {order['OrderAmount']}"):
-                        accept_offer_logger.info(f"Order {order['OrderNum']} ignored by external handler. Skip sending offer")
-                        continue
-                    logger.info(f"Order {order['OrderNum']} has no offer. Sending offer...")
-                    try:
-                        self.client.SellerSendOffer(OrderNum=order["OrderNum"], GameId=730)
-                        accept_offer_logger.info(f"Order {order['OrderNum']} offer sent")
-                    except Exception as e:
-                        handle_caught_exception(e, "ECOsteam.cn")
-                        accept_offer_logger.error(f"Order {order['OrderNum']} offer failed. Retry later.")
-                        continue
-                accept_offer_logger.debug(f"Fetching details for order {order['OrderNum']}")
-                detail = self.client.GetSellerOrderDetail(OrderNum=order["OrderNum"]).json()["ResultData"]
-                time.sleep(0.3)
+            orders = self.send_missing_offers(wait_deliver_orders)
+            # Lookups run concurrently, the client's rate limiter keeps them inside the qps budget
+            with ThreadPoolExecutor(max_workers=max(min(int(self.client.qps), 8), 1)) as executor:
+                details = list(executor.map(self.get_order_detail, orders))
+            for order, detail in zip(orders, details):
+                if detail is None:
+                    continue
+                if detail.get("DetailsState") not in (None, WAIT_DELIVER_DETAILS_STATE):
+                    accept_offer_logger.info(f"Order {order['OrderNum']} is no longer waiting for delivery")
+                    self.pending_orders.pop(order['OrderNum'], None)
+                    continue
                 tradeOfferId = detail["TradeOfferId"]
                 goodsName = detail["GoodsName"]
                 sellingPrice = detail["TotalMoney"]
@@ -378,8 +442,13 @@ class ECOsteamPlugin:
                     if accept_trade_offer(self.steam_client, self.steam_client_mutex, tradeOfferId, desc=f"Platform: ECOsteam\nItem: {goodsName}\nOrder price: {sellingPrice}\nBuyer: {buyerNickName}", reportToExternal=False):
                         accept_offer_logger.info(f"Delivered {goodsName}, offer {tradeOfferId}")
                         self.ignored_offer.append(tradeOfferId)
+                        self.delivered_orders.add(order['OrderNum'])
+                        # The item left the Steam inventory, keep the stock index in step without a rescan
+                        self.client.stock_index.apply_orders([detail])
                 else:
                     accept_offer_logger.info(f"Ignored offer {tradeOfferId} for {goodsName} as already processed")
+                    self.delivered_orders.add(order['OrderNum'])
+        self.forget_settled_orders()
         interval = self.config["ecosteam"]["auto_accept_offer"]["interval"]
         accept_offer_logger.info(f"Wait {interval}s then re-check pending deliveries")
         time.sleep(interval)
@@ -457,32 +526,36 @@ class ECOsteamPlugin:
         global eco_queue
         if hasattr(self, "uu_client") and self.uu_client:
             uu_queue = tasks(self.uu_client, self.steam_id)
+            Thread(target=uu_queue.run, daemon=True).start()
         eco_queue = tasks(self.client, self.steam_id)
+        Thread(target=eco_queue.run, daemon=True).start()
 
         while True:
             if sync_sell_shelf_enabled:
                 self.sync_sell_shelves()
             if sync_lease_shelf_enabled:
                 self.sync_lease_shelves()
-            eco_queue.process()
-            if isinstance(uu_queue, tasks):
-                uu_queue.process()
             logger.info(f'Wait {self.config["ecosteam"]["sync_interval"]}s then re-check multi-platform shelves')
             time.sleep(self.config["ecosteam"]["sync_interval"])
 
-    # Lease shelf sync implementation
-    def sync_lease_shelves(self):
-        lease_logger.info("Fetching ECOsteam lease listings...")
-        lease_shelves = {}
-        lease_shelves['eco'] = self.client.getFulRentGoodsList(self.steam_id)
-        lease_logger.debug(f'ECO lease shelf: {json.dumps(lease_shelves["eco"], cls=ModelEncoder)}')
-        lease_logger.info(f"ECOsteam has {len(lease_shelves['eco'])} lease items")
+    @staticmethod
+    def get_queue(platform):
+        queue = {"uu": uu_queue, "eco": eco_queue}.get(platform)
+        return queue if isinstance(queue, tasks) else None
 
-        lease_logger.info("Fetching UU lease listings...")
-        lease_shelves['uu'] = self.uu_client.get_uu_leased_inventory()
-        lease_logger.debug(f'UU lease shelf: {json.dumps(lease_shelves["uu"], cls=ModelEncoder)}')
-        lease_logger.info(f"UU has {len(lease_shelves['uu'])} lease items")
+    # Lease shelf sync implementation
+    def fetch_lease_shelf(self, platform):
+        if platform == "eco":
+            lease_logger.info("Fetching ECOsteam lease listings...")
+            shelf = self.client.getFulRentGoodsList(self.steam_id)
+        else:
+            lease_logger.info("Fetching UU lease listings...")
+            shelf = self.uu_client.shelf_index.refresh_lease()
+        lease_logger.debug(f'{platform.upper()} lease shelf: {json.dumps(shelf, cls=ModelEncoder)}')
+        lease_logger.info(f"{platform.upper()} has {len(shelf)} lease items")
+        return shelf
 
+    def sync_lease_shelves(self):
         if self.lease_main_platform == "eco":
             lease_logger.info("Lease sync main platform: ECOsteam")
             self.lease_other_platform = "uu"
@@ -490,16 +563,49 @@ class ECOsteamPlugin:
             lease_logger.info("Lease sync main platform: UU")
             self.lease_other_platform = "eco"
 
+        state = self.lease_shelf_state
+        full_sync = state.start_pass()
+        platforms = [self.lease_main_platform]
+        if state.needs_fetch(self.lease_other_platform, full_sync):
+            platforms.append(self.lease_other_platform)
+        else:
+            lease_logger.debug(f"{self.lease_other_platform.upper()} lease shelf unchanged since last pass, using last known listings")
+        try:
+            with ThreadPoolExecutor(max_workers=len(platforms)) as executor:
+                shelves = dict(zip(platforms, executor.map(self.fetch_lease_shelf, platforms)))
+            for platform, shelf in shelves.items():
+                state.store(platform, shelf)
+        except Exception as e:
+            handle_caught_exception(e, "ECOsteam.cn")
+            lease_logger.error("Failed to read lease shelves. Will run a full resync next time")
+            state.reset()
+            return
+        lease_shelves = state.shelves
+        other_queue = self.get_queue(self.lease_other_platform)
+        if other_queue:
+            # Durable jobs outlive passes, never publish an item the main platform has since delisted
+            other_queue.lease_retain([asset.assetid for asset in lease_shelves[self.lease_main_platform] if isinstance(asset, Asset)])
+
+        changed = state.changed_assets(
+            lease_shelves[self.lease_main_platform],
+            lambda asset: (asset.LeaseUnitPrice, asset.LongLeaseUnitPrice, asset.LeaseDeposit, asset.LeaseMaxDays),
+        )
+        if self.lease_other_platform not in state.fetched and not changed:
+            lease_logger.info(f"{self.lease_other_platform.upper()} lease shelf already in sync")
+            return
+        main_shelf, other_shelf = state.affected(self.lease_main_platform, self.lease_other_platform, changed)
+
         lease_logger.debug(f'Comparing {self.lease_main_platform.upper()} vs {self.lease_other_platform.upper()} for lease listings')
         difference = compare_lease_shelf(
-            lease_shelves[self.lease_main_platform],
-            lease_shelves[self.lease_other_platform],
+            main_shelf,
+            other_shelf,
             self.config['ecosteam']['auto_sync_lease_shelf']['ratio'][self.lease_main_platform]
             / self.config['ecosteam']['auto_sync_lease_shelf']['ratio'][self.lease_other_platform],
         )
         lease_logger.debug(f"Lease - target platform: {self.lease_other_platform.upper()}\nDifference: {json.dumps(difference, cls=ModelEncoder)}")
         if difference != {"add": [], "delete": [], "change": []}:
             lease_logger.warning(f"{self.lease_other_platform.upper()} needs lease listing/price updates")
+            state.mark_dirty(self.lease_other_platform)
             if self.lease_other_platform == "uu":
                 # Add
                 if len(difference['add']) > 0:
@@ -510,6 +616,8 @@ class ECOsteamPlugin:
                         lease_logger.error("UU task queue not initialized")
                 # Remove
                 if len(difference['delete']) > 0:
+                    if isinstance(uu_queue, tasks):
+                        uu_queue.lease_remove([item.assetid for item in difference['delete']])
                     lease_logger.info(f"Off-shelving {len(difference['delete'])} UU lease items")
                     rsp = self.uu_client.off_shelf([item.orderNo for item in difference["delete"]]).json()
                     if rsp['Code'] == 0:
@@ -534,6 +642,8 @@ class ECOsteamPlugin:
 
                 # Remove
                 if len(difference['delete']) > 0:
+                    if isinstance(eco_queue, tasks):
+                        eco_queue.lease_remove([item.assetid for item in difference['delete']])
                     lease_logger.info(f"Off-shelving {len(difference['delete'])} ECO lease items")
                     batches = [difference['delete'][i: i + 100] for i in range(0, len(difference['delete']), 100)]
                     success_count = 0
@@ -558,68 +668,121 @@ class ECOsteamPlugin:
                         lease_logger.error("ECOsteam task queue not initialized")
 
     # Sale shelf sync implementation
-    def sync_sell_shelves(self):
-        tc = copy.deepcopy(self.config["ecosteam"]["auto_sync_sell_shelf"])
-        main_platform = tc["main_platform"]
-        shelves = {}
-        ratios = {}
-        for platform in tc["enabled_platforms"]:
-            shelves[platform] = list()
-            ratios[platform] = tc["ratio"][platform]
+    def refresh_inventory(self) -> bool:
         sell_logger.info("Fetching Steam inventory...")
         inventory = get_cs2_inventory(self.steam_client, self.steam_client_mutex)
         if not inventory:
             sell_logger.error("Steam error. Cannot fetch inventory now.")
-            return
-        else:
-            sell_logger.info(f"Steam inventory has {len(inventory)} items")
+            return False
+        sell_logger.info(f"Steam inventory has {len(inventory)} items")
+        self.inventory = inventory
+        return True
+
+    def offshelf_missing(self, platform, shelf):
+        """
+        Off-shelve listings whose item left the Steam inventory.
+        :return: (shelf without them, whether every off-shelf went through)
+        """
+        offshelf_list = [good for good in shelf if not isinstance(good, Asset)]
+        if len(offshelf_list) == 0:
+            return shelf, True
+        sell_logger.warning(f"Detected {len(offshelf_list)} {platform.upper()} items not in Steam inventory. Off-shelving")
+        settled = True
+        if platform == "eco":
+            success_count, failure_count = self.client.OffshelfGoods([models.GoodsNum(GoodsNum=good, SteamGameId='730') for good in offshelf_list])
+            sell_logger.info(f"Off-shelved {success_count} items")
+            if failure_count != 0:
+                sell_logger.error(f"Failed to off-shelf {failure_count} items")
+                settled = False
+        elif platform == "buff":
+            try:
+                count, problems = self.buff_client.cancel_sale(offshelf_list)
+                sell_logger.info(f"Off-shelved {count} BUFF items. Failed {len(problems)}")
+                settled = not problems
+            except Exception as e:
+                handle_caught_exception(e, "ECOsteam.cn", known=True)
+                sell_logger.error("Off-shelf failed. Some may have succeeded")
+                settled = False
+        elif platform == "uu":
+            response = self.uu_client.off_shelf(offshelf_list)
+            if int(response.json()["Code"]) == 0:
+                sell_logger.info(f"Off-shelved {len(offshelf_list)} UU items")
+            else:
+                sell_logger.error(f"Off-shelved {len(offshelf_list)} UU items failed. {str(response.json())}")
+                settled = False
+        # Whatever is left of them is never diffed, the platform is read again next pass if anything failed
+        return [good for good in shelf if isinstance(good, Asset)], settled
+
+    def sync_sell_shelves(self):
+        tc = self.config["ecosteam"]["auto_sync_sell_shelf"]
+        main_platform = tc["main_platform"]
+        ratios = {platform: tc["ratio"][platform] for platform in tc["enabled_platforms"]}
+        state = self.sell_shelf_state
+        full_sync = state.start_pass()
+        if full_sync:
+            sell_logger.info("Full shelf resync")
+
+        # Main platform is read every pass and decides what the others have to change
+        platforms = [main_platform]
+        for platform in tc["enabled_platforms"]:
+            if platform != main_platform:
+                if state.needs_fetch(platform, full_sync):
+                    platforms.append(platform)
+                else:
+                    sell_logger.debug(f"{platform.upper()} unchanged since last pass, using last known listings")
 
         try:
-            for platform in tc["enabled_platforms"]:
-                sell_logger.info(f"Fetching {platform.upper()} listings...")
-                shelves[platform] = self.get_shelf(platform, inventory)
-                sell_logger.info(f"{platform.UPPER()} has {len(shelves[platform])} listed items")
-                # Off-shelve items not in Steam inventory
-                if len(shelves[platform]) > 0:
-                    offshelf_list = []
-                    for good in shelves[platform]:
-                        if not isinstance(good, Asset):
-                            offshelf_list.append(good)
-                    if len(offshelf_list) > 0:
-                        sell_logger.warning(f"Detected {len(offshelf_list)} {platform.upper()} items not in Steam inventory. Off-shelving")
-                        if platform == "eco":
-                            success_count, failure_count = self.client.OffshelfGoods([models.GoodsNum(GoodsNum=good, SteamGameId='730') for good in offshelf_list])
-                            sell_logger.info(f"Off-shelved {success_count} items")
-                            if failure_count != 0:
-                                sell_logger.error(f"Failed to off-shelf {failure_count} items")
-                        elif platform == "buff":
-                            try:
-                                count, problems = self.buff_client.cancel_sale(offshelf_list)
-                                sell_logger.info(f"Off-shelved {count} BUFF items. Failed {len(problems)}")
-                            except Exception as e:
-                                handle_caught_exception(e, "ECOsteam.cn", known=True)
-                                sell_logger.error("Off-shelf failed. Some may have succeeded")
-                        elif platform == "uu":
-                            response = self.uu_client.off_shelf(offshelf_list)
-                            if int(response.json()["Code"]) == "0":
-                                sell_logger.info(f"Off-shelved {len(offshelf_list)} UU items")
-                            else:
-                                sell_logger.error(f"Off-shelved {len(offshelf_list)} UU items failed. {str(response.json())}")
-                        shelves[platform] = self.get_shelf(platform, inventory)
+            # Platforms and the Steam inventory are independent services, read them all at once.
+            # The inventory is read every pass: an item sold on any platform has to come off the others right away
+            with ThreadPoolExecutor(max_workers=len(platforms) + 1) as executor:
+                inventory_future = executor.submit(self.refresh_inventory)
+                listing_futures = {platform: executor.submit(self.get_listings, platform) for platform in platforms}
+                for platform in platforms:
+                    sell_logger.info(f"Fetching {platform.upper()} listings...")
+                listings = {platform: future.result() for platform, future in listing_futures.items()}
+                if not inventory_future.result():
+                    state.reset()
+                    return
+                shelves = {platform: self.build_shelf(platform, listings[platform], self.inventory) for platform in platforms}
+                for platform in platforms:
+                    sell_logger.info(f"{platform.upper()} has {len(shelves[platform])} listed items")
+                results = dict(zip(platforms, executor.map(lambda platform: self.offshelf_missing(platform, shelves[platform]), platforms)))
         except Exception as e:
             handle_caught_exception(e, "ECOsteam.cn")
+            # A partial read must never be diffed, an empty shelf would look like everything was delisted
+            sell_logger.error("Failed to read shelves. Will run a full resync next time")
+            state.reset()
+            return
+        for platform, (shelf, settled) in results.items():
+            state.store(platform, shelf)
+            if not settled:
+                state.mark_dirty(platform)
 
+        main_assetids = [asset.assetid for asset in state.shelves[main_platform] if isinstance(asset, Asset)]
+        for platform in tc["enabled_platforms"]:
+            queue = self.get_queue(platform)
+            if platform != main_platform and queue:
+                # Durable jobs outlive passes, never publish an item the main platform has since delisted
+                queue.sell_retain(main_assetids)
+
+        changed = state.changed_assets(state.shelves[main_platform], lambda asset: asset.price)
+        gone = state.gone_assets(self.inventory)
+        if gone:
+            sell_logger.info(f"{len(gone)} listed item(s) left the Steam inventory. Off-shelving them everywhere")
+            changed |= gone
         for platform in tc["enabled_platforms"]:
             if platform != main_platform:
-                sell_logger.debug(f"Comparing {main_platform.upper()} vs {platform.upper()} shelves")
-                difference = compare_shelves(
-                    shelves[main_platform],
-                    shelves[platform],
-                    ratios[main_platform] / ratios[platform],
-                )
+                if platform not in state.fetched and not changed:
+                    sell_logger.info(f"{platform.upper()} already in sync")
+                    continue
+                main_shelf, shelf = state.affected(main_platform, platform, changed)
+                sell_logger.debug(f"Comparing {main_platform.upper()} vs {platform.upper()} shelves ({len(main_shelf)} vs {len(shelf)} listings)")
+                difference = compare_shelves(main_shelf, shelf, ratios[main_platform] / ratios[platform])
                 sell_logger.debug(f"Platform: {platform.upper()}\nDifference: {json.dumps(difference, cls=ModelEncoder, ensure_ascii=False)}")
                 if difference != {"add": [], "delete": [], "change": []}:
                     sell_logger.warning(f"{platform.upper()} requires listing/price updates")
+                    # Read it back next pass to see what actually went through
+                    state.mark_dirty(platform)
                     try:
                         self.solve_platform_difference(platform, difference)
                     except Exception as e:
@@ -641,6 +804,8 @@ class ECOsteamPlugin:
             # Delete
             assets = [asset.orderNo for asset in difference["delete"]]
             if len(assets) > 0:
+                if isinstance(eco_queue, tasks):
+                    eco_queue.sell_remove([asset.assetid for asset in difference["delete"]])
                 sell_logger.info(f"Off-shelving {len(assets)} items on ECO")
                 success_count, failure_count = self.client.OffshelfGoods([models.GoodsNum(GoodsNum=goodsNum, SteamGameId='730') for goodsNum in assets])
                 sell_logger.info(f"Off-shelved {success_count} items")
@@ -723,6 +888,8 @@ class ECOsteamPlugin:
             delete = difference["delete"]
             assets = [str(item.orderNo) for item in delete]
             if len(assets) > 0:
+                if isinstance(uu_queue, tasks):
+                    uu_queue.sell_remove([item.assetid for item in delete])
                 sell_logger.info(f"Off-shelving {len(assets)} items on UU")
                 response = self.uu_client.off_shelf(assets)
                 if int(response.json()["Code"]) == 0:
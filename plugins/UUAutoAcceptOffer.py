@@ -39,39 +39,40 @@ class UUAutoAcceptOffer:
                 try:
                     uuyoupin.send_device_info()
                     self.logger.info("Checking UUYoupin pending deliveries...")
-                    uu_wait_deliver_list = uuyoupin.get_wait_deliver_list()
-                    len_uu_wait_deliver_list = len(uu_wait_deliver_list)
-                    self.logger.info(f"{len_uu_wait_deliver_list} UUYoupin pending orders")
-                    if len(uu_wait_deliver_list) != 0:
-                        for item in uu_wait_deliver_list:
-                            accepted = False
+                    pending_count = 0
+                    accepted = False
+                    # Offers arrive as soon as UU resolves them, accept while the rest are still being looked up
+                    for item in uuyoupin.iter_wait_deliver_list():
+                        pending_count += 1
+                        self.logger.info(
+                            f"Accepting UUYoupin pending offer. Item: {item['item_name']}, "
+                            f"Offer ID: {item['offer_id']}"
+                        )
+                        if item["offer_id"] is None:
+                            self.logger.warning(
+                                "This order requires manual delivery (or is abnormal). Cannot auto-process. Skipping."
+                            )
+                        elif item["offer_id"] in ignored_offer and ignored_offer[item["offer_id"]] <= 10:
                             self.logger.info(
-                                f"Accepting UUYoupin pending offer. Item: {item['item_name']}, "
-                                f"Offer ID: {item['offer_id']}"
+                                "This trade offer was already handled by Steamauto. "
+                                "Likely due to UU system delay or a bulk purchase. This is not an error."
                             )
-                            if item["offer_id"] is None:
-                                self.logger.warning(
-                                    "This order requires manual delivery (or is abnormal). Cannot auto-process. Skipping."
-                                )
-                            elif item["offer_id"] in ignored_offer and ignored_offer[item["offer_id"]] <= 10:
-                                self.logger.info(
-                                    "This trade offer was already handled by Steamauto. "
-                                    "Likely due to UU system delay or a bulk purchase. This is not an error."
-                                )
-                                ignored_offer[item["offer_id"]] += 1
-                            else:
-                                if accept_trade_offer(
-                                    self.steam_client,
-                                    self.steam_client_mutex,
-                                    str(item["offer_id"]),
-                                    desc=f"Platform: UUYoupin\nItem: {item['item_name']}"
-                                ):
-                                    ignored_offer[str(item["offer_id"])] = 1
-                                    self.logger.info(f"Offer [{str(item['offer_id'])}] accepted.")
-                                    accepted = True
-                            if (uu_wait_deliver_list.index(item) != len_uu_wait_deliver_list - 1) and accepted:
+                            ignored_offer[item["offer_id"]] += 1
+                        else:
+                            if accepted:
                                 self.logger.info("Waiting 5 seconds to avoid frequent Steam API calls...")
                                 time.sleep(5)
+                            accepted = False
+                            if accept_trade_offer(
+                                self.steam_client,
+                                self.steam_client_mutex,
+                                str(item["offer_id"]),
+                                desc=f"Platform: UUYoupin\nItem: {item['item_name']}"
+                            ):
+                                ignored_offer[str(item["offer_id"])] = 1
+                                self.logger.info(f"Offer [{str(item['offer_id'])}] accepted.")
+                                accepted = True
+                    self.logger.info(f"{pending_count} UUYoupin pending orders")
                 except Exception as e:
                     if '登录状态失效，请重新登录' in str(e):  # keep original substring match from upstream
                         handle_caught_exception(e, "UUAutoAcceptOffer", known=True)
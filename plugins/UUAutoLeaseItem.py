@@ -1,14 +1,14 @@
-import datetime
 import time
 
 import json5
-import numpy as np
 import schedule
 
 import uuyoupinapi
+from utils.lease_price import get_lease_price_engine, quote_key
 from utils.logger import PluginLogger, handle_caught_exception
 from utils.models import LeaseAsset
 from utils.notifier import send_notification
+from utils.reprice import RepricePlanner
 from utils.tools import exit_code, is_subsequence
 from utils.uu_helper import get_valid_token_for_uu
 from uuyoupinapi import models
@@ -20,8 +20,8 @@ class UUAutoLeaseItem:
         self.config = config
         self.timeSleep = 10
         self.inventory_list = []
-        self.lease_price_cache = {}
         self.compensation_type = 0
+        self.reprice_planner = RepricePlanner(self.config.get("uu_auto_lease_item", {}).get("reprice_tolerance", 0))
 
     @property
     def leased_inventory_list(self) -> list:
@@ -35,51 +35,14 @@ class UUAutoLeaseItem:
         return False
 
     def get_lease_price(self, template_id, min_price=0, max_price=20000, cnt=15):
-
-        if template_id in self.lease_price_cache:
-            if datetime.datetime.now() - self.lease_price_cache[template_id]["cache_time"] <= datetime.timedelta(minutes=20):
-                commodity_name = self.lease_price_cache[template_id]["commodity_name"]
-                lease_unit_price = self.lease_price_cache[template_id]["lease_unit_price"]
-                long_lease_unit_price = self.lease_price_cache[template_id]["long_lease_unit_price"]
-                lease_deposit = self.lease_price_cache[template_id]["lease_deposit"]
-                self.logger.info(
-                    f"Item {commodity_name} uses cached pricing. "
-                    f"Short-term: {lease_unit_price:.2f}, Long-term: {long_lease_unit_price:.2f}, Deposit: {lease_deposit:.2f}"
-                )
-                return {
-                    "LeaseUnitPrice": lease_unit_price,
-                    "LongLeaseUnitPrice": long_lease_unit_price,
-                    "LeaseDeposit": lease_deposit,
-                }
         max_price = 20000 if max_price == 0 else max_price
-        rsp_list = self.uuyoupin.get_market_lease_price(template_id, min_price=min_price, max_price=max_price, cnt=cnt)
-        if len(rsp_list) > 0:
-            rsp_cnt = len(rsp_list)
-            commodity_name = rsp_list[0].CommodityName
-
-            lease_unit_price_list = []
-            long_lease_unit_price_list = []
-            lease_deposit_list = []
-            for i, item in enumerate(rsp_list):
-                if item.LeaseUnitPrice and i < min(10, rsp_cnt):
-                    lease_unit_price_list.append(float(item.LeaseUnitPrice))
-                    if item.LeaseDeposit:
-                        lease_deposit_list.append(float(item.LeaseDeposit))
-                if item.LongLeaseUnitPrice:
-                    long_lease_unit_price_list.append(float(item.LongLeaseUnitPrice))
-
-            lease_unit_price = float(np.mean(lease_unit_price_list)) * 0.97
-            lease_unit_price = max(lease_unit_price, float(lease_unit_price_list[0]), 0.01)
-
-            long_lease_unit_price = min(lease_unit_price * 0.98, float(np.mean(long_lease_unit_price_list)) * 0.95)
-            if len(long_lease_unit_price_list) == 0:
-                long_lease_unit_price = max(lease_unit_price - 0.01, 0.01)
-            else:
-                long_lease_unit_price = max(long_lease_unit_price, float(long_lease_unit_price_list[0]), 0.01)
-
-            lease_deposit = max(float(np.mean(lease_deposit_list)) * 0.98, float(min(lease_deposit_list)))
-
-            self.logger.info(f"Short-term ref prices: {lease_unit_price_list}. Long-term ref prices: {long_lease_unit_price_list}")
+        quote = get_lease_price_engine().quote(self.uuyoupin, template_id, min_price=min_price, max_price=max_price, cnt=cnt)
+        if quote:
+            commodity_name = quote["commodity_name"]
+            lease_unit_price = quote["LeaseUnitPrice"]
+            long_lease_unit_price = quote["LongLeaseUnitPrice"]
+            lease_deposit = quote["LeaseDeposit"]
+            self.logger.debug(f"Short-term ref prices: {quote['short_prices']}. Long-term ref prices: {quote['long_prices']}")
         else:
             lease_unit_price = long_lease_unit_price = lease_deposit = 0
             commodity_name = ""
@@ -101,14 +64,6 @@ class UUAutoLeaseItem:
             f"Item {commodity_name}. "
             f"Short-term: {lease_unit_price:.2f}, Long-term: {long_lease_unit_price:.2f}, Deposit: {lease_deposit:.2f}"
         )
-        if lease_unit_price != 0:
-            self.lease_price_cache[template_id] = {
-                "commodity_name": commodity_name,
-                "lease_unit_price": lease_unit_price,
-                "long_lease_unit_price": long_lease_unit_price,
-                "lease_deposit": lease_deposit,
-                "cache_time": datetime.datetime.now(),
-            }
 
         return {
             "LeaseUnitPrice": lease_unit_price,
@@ -116,6 +71,19 @@ class UUAutoLeaseItem:
             "LeaseDeposit": lease_deposit,
         }
 
+    @staticmethod
+    def get_lease_price_key(item: LeaseAsset) -> tuple:
+        """The price fields a lease price change compares"""
+        return (item.LeaseUnitPrice, item.LongLeaseUnitPrice or 0, item.LeaseDeposit, item.LeaseMaxDays)
+
+    def prefetch_lease_prices(self, items):
+        """Quote every distinct template up front so the per-item get_lease_price calls are cache hits. `items` are (template_id, price)"""
+        # Same range get_lease_price samples with, so every item gets the quote for its own price
+        keys = {quote_key(template_id, price, price * 2 or 20000) for template_id, price in items}
+        if keys:
+            self.logger.info(f"Fetching lease market prices for {len(keys)} template/price range(s)...")
+            get_lease_price_engine().quote_many(self.uuyoupin, keys)
+
     def auto_lease(self):
         self.logger.info("UUYoupin auto lease listing started")
         self.operate_sleep()
@@ -127,11 +95,10 @@ class UUAutoLeaseItem:
 
                 self.inventory_list = self.uuyoupin.get_inventory(refresh=True)
 
+                candidates = []
                 for i, item in enumerate(self.inventory_list):
                     if item["AssetInfo"] is None:
                         continue
-                    asset_id = item["SteamAssetId"]
-                    template_id = item["TemplateInfo"]["Id"]
                     short_name = item["ShotName"]
                     price = item["TemplateInfo"]["MarkPrice"]
                     if (
@@ -141,7 +108,13 @@ class UUAutoLeaseItem:
                         or any(s != "" and is_subsequence(s, short_name) for s in self.config["uu_auto_lease_item"]["filter_name"])
                     ):
                         continue
-                    self.operate_sleep()
+                    candidates.append(item)
+                self.prefetch_lease_prices([(item["TemplateInfo"]["Id"], item["TemplateInfo"]["MarkPrice"]) for item in candidates])
+
+                for item in candidates:
+                    asset_id = item["SteamAssetId"]
+                    template_id = item["TemplateInfo"]["Id"]
+                    price = item["TemplateInfo"]["MarkPrice"]
 
                     price_rsp = self.get_lease_price(template_id, min_price=price, max_price=price*2)
                     if price_rsp["LeaseUnitPrice"] == 0:
@@ -199,33 +172,47 @@ class UUAutoLeaseItem:
             self.uuyoupin.send_device_info()
             self.logger.info("Fetching UUYoupin leased listings...")
             leased_item_list = self.leased_inventory_list
-            for i, item in enumerate(leased_item_list):
+            candidates = [
+                item
+                for item in leased_item_list
+                if not any(s != "" and is_subsequence(s, item.short_name) for s in self.config["uu_auto_lease_item"]["filter_name"])
+            ]
+            self.prefetch_lease_prices([(item.templateid, item.price) for item in candidates])
+            change_list = []
+            for item in candidates:
 
                 template_id = item.templateid
-                short_name = item.short_name
                 price = item.price
 
-                if any(s != "" and is_subsequence(s, short_name) for s in self.config["uu_auto_lease_item"]["filter_name"]):
-                    continue
-
                 price_rsp = self.get_lease_price(template_id, min_price=price, max_price=price*2)
                 if price_rsp["LeaseUnitPrice"] == 0:
                     continue
 
+                listed_price = self.get_lease_price_key(item)
                 item.LeaseUnitPrice = price_rsp["LeaseUnitPrice"]
                 item.LongLeaseUnitPrice = price_rsp["LongLeaseUnitPrice"]
                 item.LeaseDeposit = price_rsp["LeaseDeposit"]
                 item.LeaseMaxDays = self.config["uu_auto_lease_item"]["lease_max_days"]
                 if self.config["uu_auto_lease_item"]["lease_max_days"] <= 8:
                     item.LongLeaseUnitPrice = None
+                if self.reprice_planner.needs_change(item.orderNo, self.get_lease_price_key(item), listed_price):
+                    change_list.append(item)
 
-            self.logger.info(f"{len(leased_item_list)} items can be repriced for leasing.")
-            self.operate_sleep()
-            if len(leased_item_list) > 0:
-                success_count = self.uuyoupin.change_leased_price(leased_item_list, compensation_type=self.compensation_type)
+            self.logger.info(
+                f"{len(change_list)} items can be repriced for leasing, {len(leased_item_list) - len(change_list)} left as listed."
+            )
+            if len(change_list) > 0:
+                self.operate_sleep()
+                succeeded = set()
+                success_count = self.uuyoupin.change_leased_price(change_list, compensation_type=self.compensation_type, succeeded=succeeded)
+                for item in change_list:
+                    if int(item.orderNo) in succeeded:
+                        self.reprice_planner.record(item.orderNo, self.get_lease_price_key(item))
+                    else:
+                        self.reprice_planner.forget(item.orderNo)
                 self.logger.info(f"Successfully updated lease price for {success_count} item(s).")
-                if len(leased_item_list) - success_count > 0:
-                    self.logger.error(f"{len(leased_item_list) - success_count} item(s) failed to update lease price.")
+                if len(change_list) - success_count > 0:
+                    self.logger.error(f"{len(change_list) - success_count} item(s) failed to update lease price.")
             else:
                 self.logger.info("No items to update.")
 
@@ -1,17 +1,21 @@
 import datetime
 import random
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import schedule
 
 import uuyoupinapi
 from utils.logger import PluginLogger, handle_caught_exception, logger
 from utils.notifier import send_notification
+from utils.reprice import RepricePlanner
 from utils.tools import exit_code
 from utils.uu_helper import get_valid_token_for_uu
 
 # Move sale_price_cache from instance variable to module level
 sale_price_cache = {}
+# Pricing threads, actual request rate is capped by uuyoupinapi.uu_rate_limiter
+MARKET_PRICE_WORKERS = 8
 
 
 class UUAutoSellItem:
@@ -22,6 +26,7 @@ class UUAutoSellItem:
         self.inventory_list = []
         self.buy_price_cache = {}
         self.sale_inventory_list = None
+        self.reprice_planner = RepricePlanner(self.config.get("uu_auto_sell_item", {}).get("reprice_tolerance", 0))
 
     def init(self) -> bool:
         return False
@@ -89,6 +94,30 @@ class UUAutoSellItem:
 
         return sale_price
 
+    def get_market_sale_prices(self, templates: dict) -> dict:
+        """
+        Price every distinct template concurrently, paced by the shared UU rate limiter.
+        :param templates: template id -> item name
+        :return: template id -> sale price, templates that failed are left out
+        """
+        prices = {}
+        if not templates:
+            return prices
+        self.logger.info(f"Fetching market prices for {len(templates)} distinct item(s)...")
+        with ThreadPoolExecutor(max_workers=min(MARKET_PRICE_WORKERS, len(templates))) as executor:
+            futures = {
+                executor.submit(self.get_market_sale_price, item_id, good_name=short_name): (item_id, short_name)
+                for item_id, short_name in templates.items()
+            }
+            for future in as_completed(futures):
+                item_id, short_name = futures[future]
+                try:
+                    prices[item_id] = future.result()
+                except Exception as e:
+                    handle_caught_exception(e, "UUAutoSellItem", known=True)
+                    self.logger.error(f"Failed to get market price for {short_name}: {e}. Skip")
+        return prices
+
     def sell_item(self, items):
         item_infos = items
         num = len(item_infos)
@@ -120,15 +149,31 @@ class UUAutoSellItem:
             self.logger.info("No items to reprice")
             return 0
 
+        total_success = 0
+        any_batch_ok = False
+        for i in range(0, num, uuyoupinapi.PRICE_CHANGE_BATCH_SIZE):
+            batch = item_infos[i : i + uuyoupinapi.PRICE_CHANGE_BATCH_SIZE]
+            success_count = self.change_sale_price_batch(batch)
+            if success_count >= 0:
+                any_batch_ok = True
+                total_success += success_count
+        if num > uuyoupinapi.PRICE_CHANGE_BATCH_SIZE:
+            self.logger.info(f"Repriced {total_success} of {num} item(s)")
+        return total_success if any_batch_ok else -1
+
+    def change_sale_price_batch(self, batch):
+        num = len(batch)
         try:
             rsp = self.uuyoupin.call_api(
                 "PUT",
                 "/api/commodity/Commodity/PriceChangeWithLeaseV2",
-                data={"Commoditys": item_infos},
+                data={"Commoditys": batch},
             ).json()
             if rsp["Code"] == 0:
                 success_count = 0
                 fail_count = 0
+                total_processed = 0
+                failed_ids = set()
                 data_section = rsp.get('Data', {})
 
                 if isinstance(data_section, dict) and 'Commoditys' in data_section:
@@ -140,6 +185,7 @@ class UUAutoSellItem:
                             fail_count += 1
                             error_msg = commodity_result.get('Message', 'Unknown error')
                             comm_id = commodity_result.get('CommodityId', 'Unknown ID')
+                            failed_ids.add(str(comm_id))
                             self.logger.error(f"Failed to change price for {comm_id}: {error_msg}")
 
                     if 'SuccessCount' in data_section:
@@ -149,6 +195,12 @@ class UUAutoSellItem:
                 if total_processed == 0 and success_count == 0 and fail_count == 0:
                     success_count = num
 
+                for item in batch:
+                    if str(item["CommodityId"]) in failed_ids:
+                        self.reprice_planner.forget(item["CommodityId"])
+                    else:
+                        self.reprice_planner.record(item["CommodityId"], item["Price"])
+
                 self.logger.info(f"Tried {num} items. Success {success_count}, Fail {fail_count}")
                 return success_count
             else:
@@ -170,6 +222,7 @@ class UUAutoSellItem:
 
                 self.inventory_list = self.uuyoupin.get_inventory(refresh=True)
 
+                candidates = []
                 for i, item in enumerate(self.inventory_list):
                     if item["AssetInfo"] is None:
                         continue
@@ -192,12 +245,14 @@ class UUAutoSellItem:
                             self.logger.info(f"Item {short_name} hit blacklist. Skip listing")
                             continue
 
-                    try:
-                        sale_price = self.get_market_sale_price(item_id, good_name=short_name)
-                    except Exception as e:
-                        handle_caught_exception(e, "UUAutoSellItem", known=True)
-                        logger.error(f"Failed to get market price for {short_name}: {e}. Skip")
+                    candidates.append((asset_id, item_id, short_name, buy_price))
+
+                market_prices = self.get_market_sale_prices({item_id: short_name for _, item_id, short_name, _ in candidates})
+
+                for asset_id, item_id, short_name, buy_price in candidates:
+                    if item_id not in market_prices:
                         continue
+                    sale_price = market_prices[item_id]
 
                     if self.config['uu_auto_sell_item']['take_profile']:
                         self.logger.info(f"Use take-profit ratio {self.config['uu_auto_sell_item']['take_profile_ratio']:.2f}")
@@ -270,8 +325,13 @@ class UUAutoSellItem:
             if not self.sale_inventory_list:
                 self.logger.info("No items available for repricing")
                 return
+            candidates = []
+            listed_prices = {}
+            unchanged_count = 0
             for i, item in enumerate(self.sale_inventory_list):
                 asset_id = item["id"]
+                if item.get("sellAmount") is not None:
+                    listed_prices[asset_id] = float(item["sellAmount"])
                 item_id = item["templateId"]
                 short_name = item["name"]
                 buy_price = self.buy_price_cache.get(item_id, 0)
@@ -285,7 +345,14 @@ class UUAutoSellItem:
                         self.logger.info(f"Reprice skip: {short_name} hit blacklist")
                         continue
 
-                sale_price = self.get_market_sale_price(item_id, good_name=short_name)
+                candidates.append((asset_id, item_id, short_name, buy_price))
+
+            market_prices = self.get_market_sale_prices({item_id: short_name for _, item_id, short_name, _ in candidates})
+
+            for asset_id, item_id, short_name, buy_price in candidates:
+                if item_id not in market_prices:
+                    continue
+                sale_price = market_prices[item_id]
 
                 if self.config['uu_auto_sell_item']['take_profile']:
                     self.logger.info(f"Use take-profit ratio {self.config['uu_auto_sell_item']['take_profile_ratio']:.2f}")
@@ -306,6 +373,10 @@ class UUAutoSellItem:
                         sale_price = max(price_threshold, sale_price - 0.01)
                         sale_price = round(sale_price, 2)
 
+                if not self.reprice_planner.needs_change(asset_id, sale_price, listed_prices.get(asset_id)):
+                    unchanged_count += 1
+                    continue
+
                 sale_item = {
                     "CommodityId": asset_id,
                     "IsCanLease": False,
@@ -315,7 +386,9 @@ class UUAutoSellItem:
                 }
                 new_sale_item_list.append(sale_item)
 
-            self.logger.info(f"{len(new_sale_item_list)} item(s) can be repriced")
+            self.logger.info(f"{len(new_sale_item_list)} item(s) can be repriced, {unchanged_count} already at the target price")
+            if not new_sale_item_list:
+                return
             self.operate_sleep()
             self.change_sale_price(new_sale_item_list)
 
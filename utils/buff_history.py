@@ -0,0 +1,251 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import json5
+
+from utils.logger import PluginLogger, handle_caught_exception
+from utils.static import SESSION_FOLDER
+from utils.tools import get_encoding
+
+logger = PluginLogger("BuffHistory")
+
+HISTORY_DB_PATH = os.path.join(SESSION_FOLDER, "buff_history.db")
+
+HISTORY_KINDS = {
+    "buy": {"url": "https://buff.163.com/api/market/buy_order/history", "page_size": 300},
+    "sell": {"url": "https://buff.163.com/api/market/sell_order/history", "page_size": 100},
+}
+# Same cutoff the profit report always used for purchase history
+BUY_HISTORY_MAX_AGE = int(365 * 1.5 * 24 * 60 * 60)
+# In-progress states an order can still leave for SUCCESS. Any other state (SUCCESS, FAIL, CANCEL...) is settled and never re-read
+OPEN_STATES = ("PAYING", "TO_DELIVER", "DELIVERING", "TO_RECEIVE", "TO_CONFIRM")
+# Orders left in an open state for longer than this are treated as abandoned and no longer re-read
+OPEN_ORDER_MAX_AGE = 8 * 24 * 60 * 60
+
+
+def get_asset_key(asset_info: dict) -> str:
+    """appid_assetid_classid_contextid, the key BUFF history is matched against inventory by"""
+    return "_".join(str(asset_info[key]) for key in ["appid", "assetid", "classid", "contextid"])
+
+
+class BuffHistoryStore:
+    """
+    Local SQLite copy of BUFF buy/sell history, shared by every plugin.
+    Orders of every state are stored so one still in progress is picked up again once it succeeds; reads only return SUCCESS orders.
+    `sync` only walks pages newer than what is already stored, or back to the oldest order still in progress; reads never hit the network.
+    """
+
+    def __init__(self, db_path: str = HISTORY_DB_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        # One sync at a time, so a second caller finds the store fresh instead of paging BUFF again
+        self._sync_lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS orders (
+                    kind TEXT NOT NULL,
+                    game TEXT NOT NULL,
+                    trade_id TEXT NOT NULL,
+                    asset_key TEXT NOT NULL,
+                    created_at INTEGER NOT NULL DEFAULT 0,
+                    transact_time INTEGER NOT NULL DEFAULT 0,
+                    price TEXT,
+                    state TEXT NOT NULL DEFAULT 'SUCCESS',
+                    data TEXT NOT NULL,
+                    PRIMARY KEY (kind, game, trade_id)
+                );
+                CREATE INDEX IF NOT EXISTS idx_orders_asset_key ON orders (kind, game, asset_key);
+                CREATE INDEX IF NOT EXISTS idx_orders_created_at ON orders (kind, game, created_at);
+                CREATE TABLE IF NOT EXISTS sync_state (
+                    kind TEXT NOT NULL,
+                    game TEXT NOT NULL,
+                    synced_at REAL NOT NULL DEFAULT 0,
+                    covered_since INTEGER,
+                    PRIMARY KEY (kind, game)
+                );
+                """
+            )
+            # Stores created before orders of every state were kept only hold SUCCESS orders
+            if "state" not in {row[1] for row in conn.execute("PRAGMA table_info(orders)")}:
+                conn.execute("ALTER TABLE orders ADD COLUMN state TEXT NOT NULL DEFAULT 'SUCCESS'")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _get_state(self, conn, kind, game):
+        row = conn.execute("SELECT synced_at, covered_since FROM sync_state WHERE kind = ? AND game = ?", (kind, game)).fetchone()
+        return row if row else (0, None)
+
+    def _set_state(self, conn, kind, game, synced_at, covered_since):
+        conn.execute(
+            "INSERT OR REPLACE INTO sync_state (kind, game, synced_at, covered_since) VALUES (?, ?, ?, ?)",
+            (kind, game, synced_at, covered_since),
+        )
+
+    def _insert(self, conn, kind, game, items):
+        conn.executemany(
+            "INSERT OR REPLACE INTO orders (kind, game, trade_id, asset_key, created_at, transact_time, price, state, data) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    kind,
+                    game,
+                    str(item["id"]),
+                    get_asset_key(item["asset_info"]),
+                    int(item.get("created_at") or item.get("transact_time") or 0),
+                    int(item.get("transact_time") or 0),
+                    str(item.get("price", "")),
+                    item.get("state", "SUCCESS"),
+                    json.dumps(item, ensure_ascii=False),
+                )
+                for item in items
+            ],
+        )
+
+    def import_legacy_file(self, kind: str, game: str, file_path: str, covered_since: int):
+        """One-off import of the old `<kind>_history_<game>_full.json` files, skipped once the store has data"""
+        if not os.path.exists(file_path):
+            return
+        with self._lock, self._connect() as conn:
+            if conn.execute("SELECT 1 FROM orders WHERE kind = ? AND game = ? LIMIT 1", (kind, game)).fetchone():
+                return
+            try:
+                with open(file_path, "r", encoding=get_encoding(file_path)) as f:
+                    legacy = json5.load(f)
+                items = [item for item in legacy.values() if "id" in item and "asset_info" in item]
+                self._insert(conn, kind, game, items)
+                synced_at, _ = self._get_state(conn, kind, game)
+                self._set_state(conn, kind, game, synced_at, covered_since)
+                logger.info(f"Imported {len(items)} {kind} record(s) for {game} from {os.path.basename(file_path)}")
+            except Exception as e:
+                handle_caught_exception(e, "BuffHistory", known=True)
+                logger.error(f"Failed to import {file_path}")
+
+    def sync(self, session, headers: dict, kind: str, game: str, max_age: int | None = None, page_interval: float = 15, min_interval: float = 600) -> bool:
+        """
+        Pull new orders into the store and refresh the state of the ones still in progress.
+        Paging stops at the first stored trade ID or at anything older than the newest stored order, but never before the oldest order
+        still in an OPEN_STATES state (younger than OPEN_ORDER_MAX_AGE), and always at `max_age` seconds back.
+        A full walk only happens while the stored history doesn't yet cover the requested window.
+        :return: False if BUFF returned an error
+        """
+        with self._sync_lock:
+            return self._sync(session, headers, kind, game, max_age, page_interval, min_interval)
+
+    def _sync(self, session, headers, kind, game, max_age, page_interval, min_interval) -> bool:
+        config = HISTORY_KINDS[kind]
+        now = time.time()
+        cutoff = int(now - max_age) if max_age else 0
+        with self._lock, self._connect() as conn:
+            synced_at, covered_since = self._get_state(conn, kind, game)
+            newest = conn.execute("SELECT MAX(created_at) FROM orders WHERE kind = ? AND game = ?", (kind, game)).fetchone()[0] or 0
+            open_since = conn.execute(
+                f"SELECT MIN(created_at) FROM orders WHERE kind = ? AND game = ? AND state IN ({','.join('?' * len(OPEN_STATES))}) AND created_at >= ?",
+                [kind, game, *OPEN_STATES, int(now - OPEN_ORDER_MAX_AGE)],
+            ).fetchone()[0]
+        # An order stored while in progress must be re-read, so the walk goes back at least to the oldest one
+        stop_before = min(newest, open_since) if open_since else newest
+        covered = covered_since is not None and covered_since <= cutoff
+        if covered and now - synced_at < min_interval:
+            logger.debug(f"{kind} history for {game} synced {int(now - synced_at)}s ago, skipping")
+            return True
+
+        page_num = 1
+        new_items = []
+        reached_end = False
+        ok = True
+        while True:
+            logger.debug(f"Fetching {game} {kind} history, page: {page_num}")
+            response_json = session.get(config["url"], headers=headers, params={"page_num": page_num, "page_size": config["page_size"], "game": game}).json()
+            if response_json["code"] != "OK":
+                logger.error(f"Failed to get {game} {kind} history")
+                ok = False
+                break
+            items = response_json["data"]["items"]
+            goods_infos = response_json["data"].get("goods_infos", {})
+            should_break = False
+            with self._connect() as conn:
+                known_ids = {
+                    row[0]
+                    for row in conn.execute(
+                        f"SELECT trade_id FROM orders WHERE kind = ? AND game = ? AND trade_id IN ({','.join('?' * len(items))})",
+                        [kind, game] + [str(item["id"]) for item in items],
+                    )
+                } if items else set()
+            for item in items:
+                transact_time = item.get("transact_time") or 0
+                if cutoff and transact_time and transact_time < cutoff:
+                    should_break = True
+                    reached_end = True
+                    break
+                created_at = item.get("created_at") or 0
+                if covered and ((not open_since and str(item["id"]) in known_ids) or (stop_before and created_at and created_at < stop_before)):
+                    should_break = True
+                    break
+                item_copy = item.copy()
+                item_copy["item_details"] = goods_infos.get(str(item_copy["goods_id"]), {})
+                new_items.append(item_copy)
+            if len(items) < config["page_size"]:
+                reached_end = True
+                break
+            if should_break:
+                break
+            page_num += 1
+            logger.info(f"Sleeping {page_interval}s before the next {kind} history page to avoid ban")
+            time.sleep(page_interval)
+
+        with self._lock, self._connect() as conn:
+            self._insert(conn, kind, game, new_items)
+            if ok:
+                if reached_end:
+                    covered_since = cutoff if covered_since is None else min(covered_since, cutoff)
+                self._set_state(conn, kind, game, time.time(), covered_since)
+        if new_items:
+            logger.info(f"Stored {len(new_items)} new or updated {game} {kind} record(s)")
+        return ok
+
+    def get_history(self, kind: str, game: str, max_age: int | None = None) -> dict:
+        """trade_id -> SUCCESS order, newest first"""
+        query = "SELECT trade_id, data FROM orders WHERE kind = ? AND game = ? AND state = 'SUCCESS'"
+        params = [kind, game]
+        if max_age:
+            query += " AND (transact_time = 0 OR transact_time >= ?)"
+            params.append(int(time.time() - max_age))
+        query += " ORDER BY created_at DESC, trade_id DESC"
+        with self._connect() as conn:
+            return {trade_id: json.loads(data) for trade_id, data in conn.execute(query, params)}
+
+    def get_latest_prices(self, kind: str, game: str) -> dict:
+        """asset_key -> price of the newest SUCCESS order for that asset"""
+        result = {}
+        with self._connect() as conn:
+            for asset_key, price in conn.execute(
+                "SELECT asset_key, price FROM orders WHERE kind = ? AND game = ? AND state = 'SUCCESS' ORDER BY created_at DESC, trade_id DESC", (kind, game)
+            ):
+                if asset_key not in result:
+                    result[asset_key] = price
+        return result
+
+
+buff_history_store = None
+_buff_history_store_lock = threading.Lock()
+
+
+def get_buff_history_store() -> BuffHistoryStore:
+    """Get the global BUFF history store instance"""
+    global buff_history_store
+    with _buff_history_store_lock:
+        if buff_history_store is None:
+            buff_history_store = BuffHistoryStore()
+        return buff_history_store
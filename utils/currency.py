@@ -0,0 +1,129 @@
+import json
+import os
+import threading
+import time
+from decimal import Decimal, ROUND_HALF_UP
+
+import requests
+
+from utils.logger import PluginLogger
+from utils.static import SESSION_FOLDER
+
+logger = PluginLogger("Currency")
+
+RATES_PATH = os.path.join(SESSION_FOLDER, "exchange_rates.json")
+RATES_API_URL = "https://api.frankfurter.dev/v1/latest"
+BASE_CURRENCY = "USD"
+# Currencies we report in, with the fallback used until the first successful fetch
+DEFAULT_RATES = {"CNY": Decimal("7.1098")}
+RATES_TTL = 3600
+# Minimum gap between fetch attempts while the API keeps failing
+RETRY_INTERVAL = 300
+CENT = Decimal("0.01")
+
+
+class CurrencyService:
+    """
+    Process-wide exchange rates against USD.
+    The last known rates are persisted to the session folder. Reads never block: a stale table triggers one background refresh and the current values are returned meanwhile.
+    """
+
+    def __init__(self, rates_path: str = RATES_PATH, ttl: float = RATES_TTL):
+        self.rates_path = rates_path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._fetched_at = 0.0
+        self._attempted_at = 0.0
+        self._rates = dict(DEFAULT_RATES)
+        self._table = {}
+        self._load()
+        self._build_table()
+
+    def _load(self):
+        try:
+            if not os.path.exists(self.rates_path):
+                return
+            with open(self.rates_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("base") != BASE_CURRENCY:
+                return
+            for currency, rate in data.get("rates", {}).items():
+                if currency in DEFAULT_RATES:
+                    self._rates[currency] = Decimal(str(rate))
+            self._fetched_at = float(data.get("fetched_at", 0))
+        except Exception as e:
+            logger.warning(f"Failed to load cached exchange rates: {str(e)}")
+
+    def _save(self):
+        try:
+            os.makedirs(os.path.dirname(self.rates_path) or ".", exist_ok=True)
+            with open(self.rates_path, "w", encoding="utf-8") as f:
+                json.dump({"base": BASE_CURRENCY, "fetched_at": self._fetched_at, "rates": {k: str(v) for k, v in self._rates.items()}}, f)
+        except Exception as e:
+            logger.warning(f"Failed to save exchange rates: {str(e)}")
+
+    def _build_table(self):
+        """Precompute (from, to) -> factor for every reported currency"""
+        table = {(BASE_CURRENCY, BASE_CURRENCY): Decimal(1)}
+        for currency, rate in self._rates.items():
+            table[(BASE_CURRENCY, currency)] = rate
+            table[(currency, BASE_CURRENCY)] = Decimal(1) / rate
+            table[(currency, currency)] = Decimal(1)
+        self._table = table
+
+    def _refresh(self):
+        try:
+            response = requests.get(RATES_API_URL, params={"base": BASE_CURRENCY, "symbols": ",".join(DEFAULT_RATES)}, timeout=10)
+            if response.status_code == 200:
+                rates = response.json().get("rates", {})
+                with self._lock:
+                    for currency in DEFAULT_RATES:
+                        if rates.get(currency):
+                            new_rate = Decimal(str(rates[currency]))
+                            if new_rate != self._rates.get(currency):
+                                logger.info(f"Updated {BASE_CURRENCY} to {currency} exchange rate: {new_rate}")
+                            self._rates[currency] = new_rate
+                    self._fetched_at = time.time()
+                    self._build_table()
+                    self._save()
+            else:
+                logger.warning(f"Failed to fetch exchange rate. Status: {response.status_code}")
+        except Exception as e:
+            logger.warning(f"Failed to fetch exchange rate: {str(e)}. Using cached rates")
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _refresh_if_stale(self):
+        with self._lock:
+            now = time.time()
+            if self._refreshing or now - self._fetched_at < self.ttl or now - self._attempted_at < RETRY_INTERVAL:
+                return
+            self._refreshing = True
+            self._attempted_at = now
+        threading.Thread(target=self._refresh, name="CurrencyRefresh", daemon=True).start()
+
+    def rate(self, from_currency: str, to_currency: str) -> Decimal:
+        self._refresh_if_stale()
+        table = self._table
+        if (from_currency, to_currency) in table:
+            return table[(from_currency, to_currency)]
+        return table[(from_currency, BASE_CURRENCY)] * table[(BASE_CURRENCY, to_currency)]
+
+    def convert(self, amount, from_currency: str, to_currency: str) -> Decimal:
+        """Convert and round to cents (half up)"""
+        return (Decimal(str(amount)) * self.rate(from_currency, to_currency)).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+currency_service = None
+_currency_service_lock = threading.Lock()
+
+
+def get_currency_service() -> CurrencyService:
+    """Get the global currency service instance"""
+    global currency_service
+    with _currency_service_lock:
+        if currency_service is None:
+            currency_service = CurrencyService()
+        return currency_service
@@ -0,0 +1,175 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from utils.logger import PluginLogger
+from utils.models import Asset, LeaseAsset
+from utils.static import SESSION_FOLDER
+
+logger = PluginLogger("JobQueue")
+
+JOB_QUEUE_DB_PATH = os.path.join(SESSION_FOLDER, "shelf_jobs.db")
+
+# sell_add / sell_change carry an Asset, lease_add / lease_change a LeaseAsset
+JOB_KINDS = ("sell_add", "sell_change", "lease_add", "lease_change")
+MAX_ATTEMPTS = 5
+RETRY_BASE_DELAY = 30
+RETRY_MAX_DELAY = 30 * 60
+
+
+class ShelfJobQueue:
+    """
+    Durable listing/repricing jobs per platform and Steam account, stored in SQLite so nothing is lost on a crash.
+    A job is keyed by (platform, steamid, kind, assetid): queueing the same asset again only replaces its payload.
+    Failed jobs are retried with exponential backoff and dropped after `max_attempts`.
+    """
+
+    def __init__(self, db_path: str = JOB_QUEUE_DB_PATH, max_attempts: int = MAX_ATTEMPTS):
+        self.db_path = db_path
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    platform TEXT NOT NULL,
+                    steamid TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    assetid TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    revision INTEGER NOT NULL DEFAULT 0,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt REAL NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL DEFAULT 0,
+                    last_error TEXT,
+                    PRIMARY KEY (platform, steamid, kind, assetid)
+                );
+                CREATE INDEX IF NOT EXISTS idx_jobs_due ON jobs (platform, steamid, kind, next_attempt);
+                """
+            )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def put(self, platform: str, steamid: str, kind: str, assets: list):
+        """
+        Queue `assets`. An asset already queued for the same kind keeps its place and retry state, only its payload is replaced.
+        Re-queueing an identical payload is a no-op, so a batch being published still completes.
+        """
+        if kind not in JOB_KINDS:
+            raise ValueError(f"Unknown job kind {kind}")
+        if not assets:
+            return
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.executemany(
+                """
+                INSERT INTO jobs (platform, steamid, kind, assetid, payload, created_at) VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (platform, steamid, kind, assetid) DO UPDATE SET payload = excluded.payload, revision = revision + 1
+                WHERE payload != excluded.payload
+                """,
+                [(platform, str(steamid), kind, str(asset.assetid), json.dumps(asset.to_dict(), ensure_ascii=False), now) for asset in assets],
+            )
+
+    def remove(self, platform: str, steamid: str, kinds, assetids):
+        """Drop queued jobs of `kinds` for `assetids`"""
+        with self._lock, self._connect() as conn:
+            conn.executemany(
+                "DELETE FROM jobs WHERE platform = ? AND steamid = ? AND kind = ? AND assetid = ?",
+                [(platform, str(steamid), kind, str(assetid)) for kind in kinds for assetid in assetids],
+            )
+
+    def retain(self, platform: str, steamid: str, kinds, assetids) -> int:
+        """Drop queued jobs of `kinds` whose asset is not in `assetids`, returns how many were dropped"""
+        keep = {str(assetid) for assetid in assetids}
+        with self._lock, self._connect() as conn:
+            stale = [
+                (platform, str(steamid), kind, assetid)
+                for kind in kinds
+                for (assetid,) in conn.execute("SELECT assetid FROM jobs WHERE platform = ? AND steamid = ? AND kind = ?", (platform, str(steamid), kind))
+                if assetid not in keep
+            ]
+            conn.executemany("DELETE FROM jobs WHERE platform = ? AND steamid = ? AND kind = ? AND assetid = ?", stale)
+        return len(stale)
+
+    def take(self, platform: str, steamid: str, kind: str, limit: int) -> list:
+        """
+        Up to `limit` due jobs of one kind, oldest first. Jobs stay queued until `complete` or `fail`.
+        :return: [(asset, revision)]
+        """
+        if limit <= 0:
+            return []
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(
+                "SELECT payload, revision FROM jobs WHERE platform = ? AND steamid = ? AND kind = ? AND next_attempt <= ? ORDER BY created_at LIMIT ?",
+                (platform, str(steamid), kind, time.time(), limit),
+            ).fetchall()
+        asset_cls = LeaseAsset if kind.startswith("lease") else Asset
+        return [(asset_cls(**json.loads(payload)), revision) for payload, revision in rows]
+
+    def complete(self, platform: str, steamid: str, kind: str, jobs: list):
+        """Drop finished jobs, unless they were queued again with a new payload meanwhile"""
+        with self._lock, self._connect() as conn:
+            conn.executemany(
+                "DELETE FROM jobs WHERE platform = ? AND steamid = ? AND kind = ? AND assetid = ? AND revision = ?",
+                [(platform, str(steamid), kind, str(asset.assetid), revision) for asset, revision in jobs],
+            )
+
+    def fail(self, platform: str, steamid: str, kind: str, jobs: list, error: str = ""):
+        """Schedule a retry with exponential backoff, dropping jobs that ran out of attempts"""
+        now = time.time()
+        dropped = 0
+        with self._lock, self._connect() as conn:
+            for asset, revision in jobs:
+                key = (platform, str(steamid), kind, str(asset.assetid))
+                row = conn.execute("SELECT attempts, revision FROM jobs WHERE platform = ? AND steamid = ? AND kind = ? AND assetid = ?", key).fetchone()
+                # Gone, or queued again with a new payload that deserves a fresh try
+                if row is None or row[1] != revision:
+                    continue
+                attempts = row[0] + 1
+                if attempts >= self.max_attempts:
+                    conn.execute("DELETE FROM jobs WHERE platform = ? AND steamid = ? AND kind = ? AND assetid = ?", key)
+                    dropped += 1
+                    continue
+                delay = min(RETRY_BASE_DELAY * 2 ** (attempts - 1), RETRY_MAX_DELAY)
+                conn.execute(
+                    "UPDATE jobs SET attempts = ?, next_attempt = ?, last_error = ? WHERE platform = ? AND steamid = ? AND kind = ? AND assetid = ?",
+                    (attempts, now + delay, error, *key),
+                )
+        if dropped:
+            logger.error(f"Dropped {dropped} {platform} {kind} job(s) after {self.max_attempts} failed attempts. Last error: {error}")
+
+    def pending(self, platform: str, steamid: str) -> dict:
+        """kind -> number of queued jobs, due or not"""
+        with self._lock, self._connect() as conn:
+            rows = conn.execute("SELECT kind, COUNT(*) FROM jobs WHERE platform = ? AND steamid = ? GROUP BY kind", (platform, str(steamid))).fetchall()
+        return {kind: count for kind, count in rows}
+
+    def next_due(self, platform: str, steamid: str):
+        """Timestamp of the earliest queued job, None if the queue is empty"""
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT MIN(next_attempt) FROM jobs WHERE platform = ? AND steamid = ?", (platform, str(steamid))).fetchone()
+        return row[0] if row else None
+
+
+shelf_job_queue = None
+_shelf_job_queue_lock = threading.Lock()
+
+
+def get_shelf_job_queue() -> ShelfJobQueue:
+    """Get the global shelf job queue instance"""
+    global shelf_job_queue
+    with _shelf_job_queue_lock:
+        if shelf_job_queue is None:
+            shelf_job_queue = ShelfJobQueue()
+        return shelf_job_queue
@@ -0,0 +1,183 @@
+import threading
+import time
+import warnings
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from utils.logger import PluginLogger, handle_caught_exception
+
+logger = PluginLogger("LeasePrice")
+
+LEASE_PRICE_TTL = 20 * 60
+LEASE_PRICE_CACHE_SIZE = 1024
+# Share of listings dropped at each end before averaging, so one troll listing can't drag the price
+TRIM_PROPORTION = 0.1
+# Deposit floor percentile, replaces the single cheapest deposit
+DEPOSIT_FLOOR_PERCENTILE = 10
+# Only the cheapest listings set the short-term price and deposit
+SHORT_LEASE_SAMPLE = 10
+
+
+def pad_rows(rows: list) -> np.ndarray:
+    """Ragged float rows -> NaN-padded matrix"""
+    width = max((len(row) for row in rows), default=0) or 1
+    matrix = np.full((len(rows), width), np.nan)
+    for i, row in enumerate(rows):
+        matrix[i, : len(row)] = row
+    return matrix
+
+
+def trimmed_mean(matrix: np.ndarray, proportion: float = TRIM_PROPORTION) -> np.ndarray:
+    """Row-wise mean of a NaN-padded matrix after dropping `proportion` of each row's values at both ends, NaN for empty rows"""
+    ordered = np.sort(matrix, axis=1)
+    counts = np.sum(~np.isnan(matrix), axis=1)
+    cut = np.floor(counts * proportion).astype(int)
+    positions = np.arange(matrix.shape[1])
+    keep = (positions >= cut[:, None]) & (positions < (counts - cut)[:, None])
+    kept_counts = keep.sum(axis=1)
+    sums = np.where(keep, ordered, 0.0).sum(axis=1)
+    return np.where(kept_counts > 0, sums / np.maximum(kept_counts, 1), np.nan)
+
+
+def percentile(matrix: np.ndarray, q: float) -> np.ndarray:
+    """Row-wise percentile of a NaN-padded matrix, NaN for empty rows"""
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        return np.nanpercentile(matrix, q, axis=1)
+
+
+def compute_lease_quotes(market_lists: dict) -> dict:
+    """
+    key -> market listings (models.UUMarketLeaseItem) into key -> quote, all keys in one pass.
+    A quote is None when the market has no usable short-term price.
+    """
+    keys = list(market_lists)
+    if not keys:
+        return {}
+    short_rows, long_rows, deposit_rows, names = [], [], [], []
+    for key in keys:
+        items = market_lists[key]
+        short_items = [item for item in items[:SHORT_LEASE_SAMPLE] if item.LeaseUnitPrice]
+        short_rows.append([float(item.LeaseUnitPrice) for item in short_items])
+        deposit_rows.append([float(item.LeaseDeposit) for item in short_items if item.LeaseDeposit])
+        long_rows.append([float(item.LongLeaseUnitPrice) for item in items if item.LongLeaseUnitPrice])
+        names.append(items[0].CommodityName if items else "")
+
+    short_matrix, long_matrix, deposit_matrix = pad_rows(short_rows), pad_rows(long_rows), pad_rows(deposit_rows)
+    # Listings come cheapest first, column 0 is the price to beat
+    first_short, first_long = short_matrix[:, 0], long_matrix[:, 0]
+    long_counts = np.sum(~np.isnan(long_matrix), axis=1)
+
+    lease_unit_price = np.maximum(np.maximum(trimmed_mean(short_matrix) * 0.97, first_short), 0.01)
+    long_lease_unit_price = np.where(
+        long_counts > 0,
+        np.maximum(np.maximum(np.minimum(lease_unit_price * 0.98, trimmed_mean(long_matrix) * 0.95), first_long), 0.01),
+        np.maximum(lease_unit_price - 0.01, 0.01),
+    )
+    lease_deposit = np.maximum(trimmed_mean(deposit_matrix) * 0.98, percentile(deposit_matrix, DEPOSIT_FLOOR_PERCENTILE))
+
+    quotes = {}
+    for i, key in enumerate(keys):
+        if np.isnan(lease_unit_price[i]) or np.isnan(lease_deposit[i]):
+            quotes[key] = None
+            continue
+        quotes[key] = {
+            "commodity_name": names[i],
+            "LeaseUnitPrice": float(lease_unit_price[i]),
+            "LongLeaseUnitPrice": float(long_lease_unit_price[i]),
+            "LeaseDeposit": float(lease_deposit[i]),
+            "short_prices": short_rows[i],
+            "long_prices": long_rows[i],
+        }
+    return quotes
+
+
+def quote_key(template_id, min_price=0, max_price=20000) -> tuple:
+    """(template_id, min_price, max_price) a quote is cached under; the deposit range decides which listings were sampled"""
+    return template_id, round(float(min_price or 0), 2), round(float(max_price or 20000), 2)
+
+
+class LeasePriceEngine:
+    """
+    Market lease quotes per UU template and deposit range, shared by every plugin in the process.
+    Distinct (template, range) pairs are fetched concurrently (paced by the UU rate limiter) and quoted together;
+    results sit in a bounded LRU cache.
+    """
+
+    def __init__(self, ttl: float = LEASE_PRICE_TTL, max_size: int = LEASE_PRICE_CACHE_SIZE, max_workers: int = 8):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.max_workers = max_workers
+        # quote_key -> (cached_at, quote)
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def peek(self, key: tuple):
+        """Cached quote for a `quote_key` without touching the network, None if missing or expired"""
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None or time.time() - entry[0] > self.ttl:
+                return None
+            self._cache.move_to_end(key)
+            return entry[1]
+
+    def _store(self, quotes: dict):
+        now = time.time()
+        with self._lock:
+            for key, quote in quotes.items():
+                self._cache[key] = (now, quote)
+                self._cache.move_to_end(key)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+
+    def quote_many(self, uu_client, keys, cnt: int = 15) -> dict:
+        """
+        :param keys: `quote_key`s, each sampled with its own deposit range
+        :return: quote_key -> quote dict, or None when the market had nothing usable
+        """
+        quotes = {}
+        misses = []
+        for key in dict.fromkeys(keys):
+            quote = self.peek(key)
+            if quote is not None:
+                quotes[key] = quote
+            else:
+                misses.append(key)
+        if not misses:
+            return quotes
+
+        def fetch(key):
+            template_id, min_price, max_price = key
+            try:
+                return uu_client.get_market_lease_price(template_id, min_price=min_price, max_price=max_price, cnt=cnt)
+            except Exception as e:
+                handle_caught_exception(e, "LeasePrice", known=True)
+                logger.error(f"Failed to fetch lease market for template {template_id}")
+                return []
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            market_lists = dict(zip(misses, executor.map(fetch, misses)))
+        fresh = compute_lease_quotes(market_lists)
+        self._store({key: quote for key, quote in fresh.items() if quote is not None})
+        quotes.update(fresh)
+        logger.debug(f"Quoted {len(fresh)} template range(s) from market, {len(quotes) - len(fresh)} from cache")
+        return quotes
+
+    def quote(self, uu_client, template_id, min_price=0, max_price=20000, cnt: int = 15):
+        key = quote_key(template_id, min_price, max_price)
+        return self.quote_many(uu_client, [key], cnt=cnt).get(key)
+
+
+lease_price_engine = None
+_lease_price_engine_lock = threading.Lock()
+
+
+def get_lease_price_engine() -> LeasePriceEngine:
+    """Get the global lease price engine instance"""
+    global lease_price_engine
+    with _lease_price_engine_lock:
+        if lease_price_engine is None:
+            lease_price_engine = LeasePriceEngine()
+        return lease_price_engine
@@ -0,0 +1,162 @@
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+
+import requests
+
+from utils.logger import PluginLogger, handle_caught_exception
+from utils.static import SESSION_FOLDER
+
+logger = PluginLogger("MasterPanel")
+
+
+def get_journal_path(api_url: str, api_key: str) -> str:
+    """One journal per panel and key, so replayed items go back to the panel they were meant for"""
+    digest = hashlib.sha1(f"{api_url.rstrip('/')}\n{api_key}".encode("utf-8")).hexdigest()[:12]
+    return os.path.join(SESSION_FOLDER, f"master_panel_journal_{digest}.jsonl")
+
+
+class MasterPanelUnreachable(Exception):
+    pass
+
+
+class MasterPanelReporter:
+    """
+    Background reporter for the master panel `/items` endpoint.
+    Items are queued and posted by a daemon worker over one keep-alive session, so callers never block on the panel.
+    Items that can't be delivered after `max_retries` attempts are spilled to a JSONL journal and replayed once the panel is back.
+    """
+
+    def __init__(self, api_url: str, api_key: str, journal_path: str | None = None, batch_size: int = 20, max_retries: int = 3, retry_interval: float = 30):
+        self.api_url = api_url.rstrip("/")
+        self.api_key = api_key
+        self.journal_path = journal_path or get_journal_path(api_url, api_key)
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.retry_interval = retry_interval
+
+        self.session = requests.Session()
+        self.session.headers.update({"Content-Type": "application/json", "X-API-Key": self.api_key})
+        self._queue = queue.Queue()
+        self._journal_lock = threading.Lock()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+
+    def submit(self, item_data: dict):
+        """Queue one item for reporting, returns immediately"""
+        self._queue.put(item_data)
+        self._ensure_worker()
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def _ensure_worker(self):
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="MasterPanelReporter", daemon=True)
+                self._worker.start()
+
+    def _next_batch(self, timeout):
+        batch = [self._queue.get(timeout=timeout)]
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        # Replay whatever an earlier run could not deliver
+        self._replay_journal()
+        while True:
+            try:
+                batch = self._next_batch(timeout=self.retry_interval if self._has_journal() else None)
+            except queue.Empty:
+                self._replay_journal()
+                continue
+            try:
+                delivered = self._post_batch(batch)
+                if delivered and self._has_journal():
+                    self._replay_journal()
+            except Exception as e:
+                # _post_batch journals what it could not deliver itself, spilling the batch here would post items twice
+                handle_caught_exception(e, "MasterPanel", known=True)
+
+    def _post_batch(self, batch) -> bool:
+        """Post items in order. Spills the items not yet delivered to the journal if the panel is unreachable or posting fails."""
+        for index, item in enumerate(batch):
+            try:
+                self._post_item(item)
+            except MasterPanelUnreachable as e:
+                logger.warning(f"Master panel unreachable ({e}), {len(batch) - index} item(s) saved for later")
+                self._spill(batch[index:])
+                return False
+            except Exception as e:
+                handle_caught_exception(e, "MasterPanel", known=True)
+                logger.warning(f"Failed to post to master panel, {len(batch) - index} item(s) saved for later")
+                self._spill(batch[index:])
+                return False
+        return True
+
+    def _post_item(self, item_data):
+        last_error = ""
+        for attempt in range(self.max_retries):
+            if attempt:
+                time.sleep(2 ** (attempt - 1))
+            try:
+                response = self.session.post(f"{self.api_url}/items", data=json.dumps(item_data), timeout=10)
+            except requests.RequestException as e:
+                last_error = str(e)
+                continue
+            if response.status_code in [200, 201]:
+                logger.info(f"Successfully sent item {item_data.get('marketHashName')} to master panel")
+                return
+            if 400 <= response.status_code < 500 and response.status_code != 429:
+                # Retrying won't change the answer
+                logger.warning(f"Master panel rejected item {item_data.get('marketHashName')}. Status: {response.status_code}, Response: {response.text}")
+                return
+            last_error = f"status {response.status_code}"
+        raise MasterPanelUnreachable(last_error)
+
+    def _has_journal(self) -> bool:
+        return os.path.exists(self.journal_path) and os.path.getsize(self.journal_path) > 0
+
+    def _spill(self, items):
+        with self._journal_lock:
+            os.makedirs(os.path.dirname(self.journal_path) or ".", exist_ok=True)
+            with open(self.journal_path, "a", encoding="utf-8") as f:
+                for item in items:
+                    f.write(json.dumps(item, ensure_ascii=False) + "\n")
+
+    def _replay_journal(self):
+        with self._journal_lock:
+            if not self._has_journal():
+                return
+            with open(self.journal_path, "r", encoding="utf-8") as f:
+                lines = f.readlines()
+            os.remove(self.journal_path)
+        items = []
+        for line in lines:
+            try:
+                items.append(json.loads(line))
+            except json.JSONDecodeError:
+                logger.warning("Dropping corrupt master panel journal line")
+        if items:
+            logger.info(f"Replaying {len(items)} journaled master panel item(s)")
+            self._post_batch(items)
+
+
+_reporters = {}
+_reporters_lock = threading.Lock()
+
+
+def get_master_panel_reporter(api_url: str, api_key: str) -> MasterPanelReporter:
+    """Get the process-wide reporter for a panel, so every plugin instance shares one queue and journal"""
+    with _reporters_lock:
+        key = (api_url.rstrip("/"), api_key)
+        if key not in _reporters:
+            _reporters[key] = MasterPanelReporter(api_url, api_key)
+        return _reporters[key]
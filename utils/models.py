@@ -1,10 +1,17 @@
+import dataclasses
+import functools
 import json
+from dataclasses import dataclass
 from typing import Union
 
-from pydantic import BaseModel
 
+@dataclass(slots=True, kw_only=True)
+class Asset:
+    """
+    Internal listing record, a plain slotted dataclass without validation.
+    Callers convert API values to the annotated types when building it; request payloads are validated by each client's pydantic models.
+    """
 
-class Asset(BaseModel):
     assetid: str
     templateid: Union[int, None] = None
     appid: Union[str, int, None] = '730'
@@ -16,6 +23,13 @@ class Asset(BaseModel):
     orderNo: Union[str, int, None] = None
     price: float = float(0)
 
+    def to_dict(self, exclude_none: bool = True) -> dict:
+        if exclude_none:
+            return {name: value for name in field_names(type(self)) if (value := getattr(self, name)) is not None}
+        return {name: getattr(self, name) for name in field_names(type(self))}
+
+
+@dataclass(slots=True, kw_only=True)
 class LeaseAsset(Asset):
     price: Union[float, None] = None
     IsCanLease: bool = True
@@ -26,8 +40,82 @@ class LeaseAsset(Asset):
     LongLeaseUnitPrice: float = float(0)
     orderNo: Union[str, int, None] = None
 
+
+@functools.cache
+def field_names(cls) -> tuple:
+    return tuple(field.name for field in dataclasses.fields(cls))
+
+
 class ModelEncoder(json.JSONEncoder):
     def default(self, obj):
-        if isinstance(obj, (Asset, LeaseAsset)):
-            return obj.model_dump(exclude_none=True)
+        if isinstance(obj, Asset):
+            return obj.to_dict()
         return json.JSONEncoder.default(self, obj)
+
+
+if __name__ == "__main__":
+    # Memory and CPU of a 10k listing shelf sync cycle: build, copy with a new price, serialize for the debug log.
+    # The pydantic models below are the previous definitions, kept here only for comparison.
+    import time
+    import tracemalloc
+
+    from pydantic import BaseModel
+
+    class PydanticAsset(BaseModel):
+        assetid: str
+        templateid: Union[int, None] = None
+        appid: Union[str, int, None] = '730'
+        classid: Union[str, int, None] = None
+        instanceid: Union[str, int, None] = None
+        contextid: Union[int, str, None] = 2
+        market_hash_name: Union[str, int, None] = None
+        short_name: Union[str, None] = None
+        orderNo: Union[str, int, None] = None
+        price: float = float(0)
+
+    class PydanticLeaseAsset(PydanticAsset):
+        price: Union[float, None] = None
+        IsCanLease: bool = True
+        IsCanSold: bool = False
+        LeaseDeposit: float
+        LeaseMaxDays: int
+        LeaseUnitPrice: float
+        LongLeaseUnitPrice: float = float(0)
+        orderNo: Union[str, int, None] = None
+
+    class PydanticEncoder(json.JSONEncoder):
+        def default(self, obj):
+            if isinstance(obj, PydanticAsset):
+                return obj.model_dump(exclude_none=True)
+            return json.JSONEncoder.default(self, obj)
+
+    count = 10000
+
+    def build(sell_cls, lease_cls):
+        sell = [sell_cls(assetid=str(i), orderNo=f"o{i}", price=float(i % 1000) + 0.5) for i in range(count)]
+        lease = [
+            lease_cls(assetid=str(i), templateid=i % 500, orderNo=f"o{i}", LeaseDeposit=float(i % 1000), LeaseMaxDays=30, LeaseUnitPrice=1.5)
+            for i in range(count)
+        ]
+        return sell, lease
+
+    def cycle(sell_cls, lease_cls, copy, encoder):
+        sell, lease = build(sell_cls, lease_cls)
+        changed = [copy(asset, price=round(asset.price / 0.95, 2)) for asset in sell]
+        json.dumps(changed, cls=encoder)
+        json.dumps(lease, cls=encoder)
+
+    for name, sell_cls, lease_cls, copy, encoder in [
+        ("pydantic", PydanticAsset, PydanticLeaseAsset, lambda asset, **update: asset.model_copy(update=update), PydanticEncoder),
+        ("dataclass", Asset, LeaseAsset, dataclasses.replace, ModelEncoder),
+    ]:
+        tracemalloc.start()
+        shelves = build(sell_cls, lease_cls)
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del shelves
+        start = time.perf_counter()
+        for _ in range(5):
+            cycle(sell_cls, lease_cls, copy, encoder)
+        elapsed = (time.perf_counter() - start) / 5
+        print(f"{name}: {size / 1024 / 1024:.1f} MiB for {count} sell + {count} lease records, {elapsed * 1000:.0f} ms per sync cycle")
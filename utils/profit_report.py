@@ -0,0 +1,324 @@
+from collections import deque
+from decimal import Decimal
+from typing import Callable
+
+import numpy as np
+
+from utils.static import SUPPORT_GAME_TYPES
+
+# BUFF transaction fee in per-mille of the sell price
+TRANSACTION_FEE_PERMILLE = {"csgo": 975, "dota2": 982}
+WITHDRAWAL_FEE_PERCENT = 99
+NO_PRICE = Decimal("-1")
+# Fee table for the games we actually run, built once
+FEE_TABLE = {game["game"]: TRANSACTION_FEE_PERMILLE.get(game["game"], TRANSACTION_FEE_PERMILLE["csgo"]) for game in SUPPORT_GAME_TYPES}
+
+
+def get_match_key(asset_info: dict) -> tuple:
+    return asset_info["assetid"], asset_info["classid"], asset_info["contextid"]
+
+
+def get_fee_permille(game: str) -> int:
+    return FEE_TABLE.get(game) or TRANSACTION_FEE_PERMILLE.get(game, TRANSACTION_FEE_PERMILLE["csgo"])
+
+
+def to_cents(price) -> int:
+    """Exact conversion, raises ValueError for sub-cent amounts"""
+    cents = Decimal(price) * 100
+    if cents != cents.to_integral_value():
+        raise ValueError(f"{price} is not a whole number of cents")
+    return int(cents)
+
+
+def cents_to_decimal(cents: int) -> Decimal:
+    return Decimal(int(cents)).scaleb(-2)
+
+
+def price_after_fee(price, fee_permille: int) -> Decimal:
+    """Scalar Decimal reference of `prices_after_fee`, used for amounts that aren't whole cents"""
+    real_price = (Decimal(price) * fee_permille / 1000).quantize(Decimal("0.00"), rounding="ROUND_DOWN")
+    return (real_price * WITHDRAWAL_FEE_PERCENT / 100).quantize(Decimal("0.00"), rounding="ROUND_DOWN")
+
+
+def prices_after_fee(price_cents: np.ndarray, fee_permille: np.ndarray) -> np.ndarray:
+    """
+    What actually reaches the wallet after BUFF's transaction fee and the 1% withdrawal fee.
+    Both steps round down to the cent, which for non-negative integer cents is floor division.
+    """
+    return (price_cents * fee_permille // 1000) * WITHDRAWAL_FEE_PERCENT // 100
+
+
+class BuyHistoryIndex:
+    """
+    Hash index over purchase history keyed by (assetid, classid, contextid).
+    `take` hands out the first unmatched purchase for a key in history order, the same one a linear scan would find.
+    """
+
+    def __init__(self, buy_history: dict):
+        self.remaining = dict(buy_history)
+        self._index = {}
+        for trade_id, order in buy_history.items():
+            self._index.setdefault(get_match_key(order["asset_info"]), deque()).append(trade_id)
+
+    def take(self, asset_info: dict):
+        trade_ids = self._index.get(get_match_key(asset_info))
+        if not trade_ids:
+            return None, None
+        trade_id = trade_ids.popleft()
+        return trade_id, self.remaining.pop(trade_id)
+
+
+class ProfitReport:
+    def __init__(self):
+        self.inventory = []
+        self.total_profit_in_inventory = Decimal("0.00")
+        self.total_profit_after_fee_in_inventory = Decimal("0.00")
+        self.sold = []
+        self.total_profit_in_sold = Decimal("0.00")
+        self.total_profit_after_fee_in_sold = Decimal("0.00")
+        self.missing = []
+        self.total_profit_in_missing = Decimal("0.00")
+        self.total_profit_after_fee_in_missing = Decimal("0.00")
+
+
+class ProfitReportBuilder:
+    """
+    Joins BUFF inventory and sell history against purchase history per game, then prices every row of every game in one NumPy pass.
+    Purely in-memory, so it runs the same on live API data or on a stored history snapshot.
+    """
+
+    SECTIONS = ("inventory", "sold", "missing")
+
+    def __init__(self):
+        # Row columns, priced together in build()
+        self._section = []
+        self._entry = []
+        self._sell = []
+        self._buy = []
+        self._fee = []
+        self._amount = []
+        # Rows with sub-cent amounts (hand-written remarks), priced with Decimal
+        self._exact_rows = []
+
+    def _add_row(self, section: str, entry: dict, sell_price, buy_price, fee_permille: int, amount: int = 1):
+        try:
+            sell_cents, buy_cents = to_cents(sell_price), to_cents(buy_price)
+        except ValueError:
+            self._exact_rows.append((section, entry, Decimal(sell_price), Decimal(buy_price), fee_permille, amount))
+            return
+        self._section.append(self.SECTIONS.index(section))
+        self._entry.append(entry)
+        self._sell.append(sell_cents)
+        self._buy.append(buy_cents)
+        self._fee.append(fee_permille)
+        self._amount.append(amount)
+
+    def add_game(self, game: str, buy_history: dict, inventory: list, sell_history: dict, get_lowest_price: Callable[[str], Decimal]):
+        """
+        :param get_lowest_price: goods_id -> current lowest listing, NO_PRICE if unknown
+        """
+        fee_permille = get_fee_permille(game)
+        buy_index = BuyHistoryIndex(buy_history)
+
+        # Inventory items with a known purchase
+        unmatched_inventory = []
+        for item in inventory:
+            trade_id, buy = buy_index.take(item["asset_info"])
+            if trade_id is None:
+                unmatched_inventory.append(item)
+                continue
+            self._add_row("inventory", {"item_name": buy["item_details"]["name"]}, item["sell_min_price"], buy["price"], fee_permille)
+
+        # Inventory items whose purchase price only survives in the remark
+        for item in unmatched_inventory:
+            buy_price = Decimal("0")
+            if "asset_extra" in item and "remark" in item["asset_extra"]:
+                try:
+                    buy_price = Decimal(item["asset_extra"]["remark"].split(" ")[0])
+                except Exception:
+                    buy_price = Decimal("0")
+            if buy_price == Decimal("0") or not buy_price.is_finite():
+                continue
+            self._add_row(
+                "inventory",
+                {"item_name": item["name"], "purchase_price": str(buy_price), "sold_price": item["sell_min_price"]},
+                item["sell_min_price"],
+                buy_price,
+                fee_permille,
+            )
+
+        # Sold items with a known purchase
+        for sell in sell_history.values():
+            trade_id, buy = buy_index.take(sell["asset_info"])
+            if trade_id is None:
+                continue
+            self._add_row(
+                "sold",
+                {"item_name": buy["item_details"]["name"], "purchase_price": buy["price"], "sold_price": sell["sell_min_price"]},
+                sell["price"],
+                buy["price"],
+                fee_permille,
+            )
+
+        # Purchases with neither an inventory item nor a sale, valued at the current lowest price
+        purchased_items = {}
+        for buy in buy_index.remaining.values():
+            purchased_items.setdefault(buy["goods_id"], []).append(buy)
+        for goods_id, buys in purchased_items.items():
+            lowest_price = get_lowest_price(goods_id)
+            if lowest_price == NO_PRICE:
+                continue
+            total_amount = len(buys)
+            total_price = sum((Decimal(buy["price"]) for buy in buys), Decimal("0"))
+            average_price = (total_price / Decimal(total_amount)).quantize(Decimal("0.00"), rounding="ROUND_DOWN")
+            self._add_row(
+                "missing",
+                {
+                    "item_name": buys[0]["item_details"]["name"],
+                    "total_amount": total_amount,
+                    "total_price": total_price.quantize(Decimal("0.00"), rounding="ROUND_DOWN"),
+                    "average_price": average_price,
+                    "sold_price": lowest_price,
+                },
+                lowest_price,
+                average_price,
+                fee_permille,
+                total_amount,
+            )
+
+    def build(self) -> ProfitReport:
+        report = ProfitReport()
+        section = np.array(self._section, dtype=np.int64)
+        sell = np.array(self._sell, dtype=np.int64)
+        buy = np.array(self._buy, dtype=np.int64)
+        amount = np.array(self._amount, dtype=np.int64)
+        profit = sell - buy
+        profit_after_fee = prices_after_fee(sell, np.array(self._fee, dtype=np.int64)) - buy
+
+        rows = [
+            (self.SECTIONS[section_index], entry, cents_to_decimal(row_profit), cents_to_decimal(row_profit_after_fee))
+            for section_index, entry, row_profit, row_profit_after_fee in zip(section.tolist(), self._entry, profit.tolist(), profit_after_fee.tolist())
+        ]
+        rows += [
+            (row_section, entry, sell_price - buy_price, price_after_fee(sell_price, fee_permille) - buy_price)
+            for row_section, entry, sell_price, buy_price, fee_permille, _ in self._exact_rows
+        ]
+
+        totals = {}
+        for index, name in enumerate(self.SECTIONS):
+            mask = section == index
+            totals[name] = (
+                cents_to_decimal(int((profit[mask] * amount[mask]).sum())),
+                cents_to_decimal(int((profit_after_fee[mask] * amount[mask]).sum())),
+            )
+        for row_section, _, sell_price, buy_price, fee_permille, row_amount in self._exact_rows:
+            total, total_after_fee = totals[row_section]
+            totals[row_section] = (
+                total + (sell_price - buy_price) * row_amount,
+                total_after_fee + (price_after_fee(sell_price, fee_permille) - buy_price) * row_amount,
+            )
+
+        for row_section, entry, row_profit, row_profit_after_fee in rows:
+            entry = dict(entry)
+            if row_section == "missing":
+                entry["profit_per_item"] = str(row_profit)
+                entry["profit_per_item_after_fee"] = str(row_profit_after_fee)
+            else:
+                entry["profit"] = str(row_profit)
+                entry["profit_after_fee"] = str(row_profit_after_fee)
+            getattr(report, row_section).append(entry)
+        report.total_profit_in_inventory, report.total_profit_after_fee_in_inventory = totals["inventory"]
+        report.total_profit_in_sold, report.total_profit_after_fee_in_sold = totals["sold"]
+        report.total_profit_in_missing, report.total_profit_after_fee_in_missing = totals["missing"]
+        return report
+
+
+def format_profit_report(report: ProfitReport) -> str:
+    message = ""
+    message += "Total inventory profit: " + str(report.total_profit_in_inventory) + " RMB\n"
+    message += "Total inventory profit (after fees): " + str(report.total_profit_after_fee_in_inventory) + " RMB\n"
+    for item in report.inventory:
+        message += "Item: " + item["item_name"] + "\n"
+        message += "Profit: " + item["profit"] + " RMB\n"
+        message += "Profit (after fees): " + item["profit_after_fee"] + " RMB\n\n"
+    message += "----------------------------------\n\n\n"
+    message += "Total sold profit: " + str(report.total_profit_in_sold) + " RMB\n"
+    message += "Total sold profit (after fees): " + str(report.total_profit_after_fee_in_sold) + " RMB\n"
+    for item in report.sold:
+        message += "Item: " + item["item_name"] + "\n"
+        message += "Profit: " + item["profit"] + " RMB\n"
+        message += "Profit (after fees): " + item["profit_after_fee"] + " RMB\n"
+        message += "Purchase price: " + item["purchase_price"] + " RMB\n"
+        message += "Sell price: " + item["sold_price"] + " RMB\n\n"
+    message += "----------------------------------\n\n\n"
+    message += "Total profit for inventory without sell records: " + str(report.total_profit_in_missing) + " RMB\n"
+    message += "Total profit for inventory without sell records (after fees): " + str(report.total_profit_after_fee_in_missing) + " RMB\n"
+    for item in report.missing:
+        message += "Item: " + item["item_name"] + "\n"
+        message += "Profit: " + item["profit_per_item"] + " RMB\n"
+        message += "Profit (after fees): " + item["profit_per_item_after_fee"] + " RMB\n"
+        message += "Total profit: " + str(Decimal(item["profit_per_item"]) * Decimal(item["total_amount"])) + " RMB\n"
+        message += "Total profit (after fees): " + str(Decimal(item["profit_per_item_after_fee"]) * Decimal(item["total_amount"])) + " RMB\n"
+        message += "Average purchase price: " + str(item["average_price"]) + " RMB\n"
+        message += "Sell price: " + str(item["sold_price"]) + " RMB\n"
+        message += "Total amount: " + str(item["total_amount"]) + "\n"
+        message += "Total value: " + str(item["total_price"]) + " RMB\n\n"
+    message += "----------------------------------\n\n\n"
+    message += "Grand total profit: " + str(report.total_profit_in_inventory + report.total_profit_in_sold + report.total_profit_in_missing) + " RMB\n"
+    return message
+
+
+def build_report_from_store(store, games: list, inventories: dict, get_lowest_price: Callable[[str, str], Decimal], buy_max_age: int | None = None) -> ProfitReport:
+    """
+    Off-line report over a BuffHistoryStore snapshot.
+    :param inventories: game -> BUFF inventory items
+    :param get_lowest_price: (goods_id, game) -> lowest listing, NO_PRICE if unknown
+    """
+    builder = ProfitReportBuilder()
+    for game in games:
+        builder.add_game(
+            game,
+            store.get_history("buy", game, max_age=buy_max_age),
+            inventories.get(game, []),
+            store.get_history("sell", game),
+            lambda goods_id, game=game: get_lowest_price(goods_id, game),
+        )
+    return builder.build()
+
+
+if __name__ == "__main__":
+    # Matching inventory and sales against purchase history: the previous linear scan against BuyHistoryIndex.
+    # Run from the repository root with `python -m utils.profit_report`.
+    import random
+    import time
+
+    count = 2000
+    rng = random.Random(0)
+
+    def asset_info(assetid):
+        return {"appid": 730, "assetid": str(assetid), "classid": str(assetid % 97), "contextid": "2"}
+
+    buy_history = {f"b{i}": {"asset_info": asset_info(i), "price": "1.00"} for i in range(count)}
+    lookups = [asset_info(rng.randrange(count * 2)) for _ in range(count)]
+
+    def linear(history, infos):
+        remaining = dict(history)
+        matched = []
+        for info in infos:
+            key = get_match_key(info)
+            trade_id = next((trade_id for trade_id, order in remaining.items() if get_match_key(order["asset_info"]) == key), None)
+            if trade_id is not None:
+                del remaining[trade_id]
+            matched.append(trade_id)
+        return matched
+
+    def indexed(history, infos):
+        index = BuyHistoryIndex(history)
+        return [index.take(info)[0] for info in infos]
+
+    results = {}
+    for name, join in [("linear scan", linear), ("BuyHistoryIndex", indexed)]:
+        start = time.perf_counter()
+        results[name] = join(buy_history, lookups)
+        print(f"{name}: {(time.perf_counter() - start) * 1000:.0f} ms for {count} lookups over {count} purchases")
+    assert results["linear scan"] == results["BuyHistoryIndex"]
@@ -0,0 +1,38 @@
+import threading
+import time
+from collections import deque
+
+
+class RateLimiter:
+    """
+    Thread-safe sliding-window limiter.
+    At most `rate` calls are let through in any `period` seconds; extra callers block until a slot frees up.
+    Usable as a context manager: `with limiter: ...`
+    """
+
+    def __init__(self, rate: int, period: float = 1.0):
+        if rate < 1:
+            raise ValueError("rate must be >= 1")
+        self.rate = rate
+        self.period = period
+        self._calls = deque()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                while self._calls and now - self._calls[0] >= self.period:
+                    self._calls.popleft()
+                if len(self._calls) < self.rate:
+                    self._calls.append(now)
+                    return
+                wait = self.period - (now - self._calls[0])
+            time.sleep(wait)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
@@ -0,0 +1,48 @@
+import threading
+
+
+class RepricePlanner:
+    """
+    Decides which listings actually need a price-change call.
+    A price is a number or a tuple of numbers (e.g. short-term, long-term, deposit). It is compared against the price the
+    shelf currently reports, or the last price pushed for that commodity when the shelf doesn't report one.
+    Listings within `tolerance` (a fraction, 0.01 = 1%) of that baseline are left alone; with 0 only unchanged prices are skipped.
+    """
+
+    def __init__(self, tolerance: float = 0.0):
+        self.tolerance = max(float(tolerance or 0), 0.0)
+        # commodity id -> last pushed price
+        self._last_pushed = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _as_tuple(price) -> tuple:
+        return tuple(price) if isinstance(price, (tuple, list)) else (price,)
+
+    def _differs(self, new, old) -> bool:
+        if new is None or old is None:
+            return new != old
+        new, old = round(float(new), 2), round(float(old), 2)
+        if self.tolerance == 0 or old == 0:
+            return new != old
+        return abs(new - old) > abs(old) * self.tolerance
+
+    def needs_change(self, commodity_id, new_price, listed_price=None) -> bool:
+        baseline = listed_price
+        if baseline is None:
+            with self._lock:
+                baseline = self._last_pushed.get(str(commodity_id))
+        if baseline is None:
+            return True
+        new_price, baseline = self._as_tuple(new_price), self._as_tuple(baseline)
+        if len(new_price) != len(baseline):
+            return True
+        return any(self._differs(new, old) for new, old in zip(new_price, baseline))
+
+    def record(self, commodity_id, price):
+        with self._lock:
+            self._last_pushed[str(commodity_id)] = price
+
+    def forget(self, commodity_id):
+        with self._lock:
+            self._last_pushed.pop(str(commodity_id), None)
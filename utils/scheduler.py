@@ -0,0 +1,179 @@
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+from apscheduler.events import EVENT_JOB_MISSED
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.triggers.base import BaseTrigger
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+
+from utils.logger import PluginLogger, handle_caught_exception
+from utils.tools import jobHandler
+
+logger = PluginLogger("Scheduler")
+
+
+class JobMetrics:
+    def __init__(self):
+        self.runs = 0
+        self.failures = 0
+        self.missed = 0
+        self.last_run = None
+        self.last_duration = 0.0
+        self.total_duration = 0.0
+        self.last_error = ""
+
+    def to_dict(self) -> dict:
+        return dict(self.__dict__)
+
+
+class HourWindowTrigger(BaseTrigger):
+    """Wraps another trigger, pushing any fire time outside `hours` to the start of the next allowed hour"""
+
+    def __init__(self, trigger: BaseTrigger, hours: list):
+        self.trigger = trigger
+        self.hours = set(hours)
+
+    def get_next_fire_time(self, previous_fire_time, now):
+        fire_time = self.trigger.get_next_fire_time(previous_fire_time, now)
+        if fire_time is None or fire_time.hour in self.hours:
+            return fire_time
+        next_hour = fire_time.replace(minute=0, second=0, microsecond=0)
+        for _ in range(24):
+            next_hour += timedelta(hours=1)
+            if next_hour.hour in self.hours:
+                return next_hour
+        return None
+
+    def __str__(self):
+        return f"{self.trigger} during hours {sorted(self.hours)}"
+
+
+class Scheduler:
+    """
+    Shared APScheduler instance for plugins that run on a clock instead of a polling loop.
+    Jobs never overlap themselves, late runs are coalesced, and every job gets run/failure/miss/duration metrics.
+    Exceptions raised by a job are logged and counted, never propagated.
+    """
+
+    def __init__(self):
+        logging.getLogger("apscheduler").propagate = False
+        logging.getLogger("apscheduler").setLevel(logging.WARNING)
+        self._scheduler = BackgroundScheduler()
+        self._scheduler.add_listener(self._on_missed, EVENT_JOB_MISSED)
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self._started = False
+
+    def _ensure_started(self):
+        with self._lock:
+            if not self._started:
+                self._scheduler.start()
+                self._started = True
+
+    def _on_missed(self, event):
+        metrics = self._metrics.get(event.job_id)
+        if metrics:
+            metrics.missed += 1
+        logger.warning(f"Job {event.job_id} missed its run at {event.scheduled_run_time}")
+
+    def _wrap(self, name, func):
+        metrics = self._metrics[name]
+
+        def run(*args, **kwargs):
+            start = time.monotonic()
+            metrics.last_run = time.time()
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                metrics.failures += 1
+                metrics.last_error = str(e)
+                handle_caught_exception(e, name)
+            finally:
+                metrics.runs += 1
+                metrics.last_duration = time.monotonic() - start
+                metrics.total_duration += metrics.last_duration
+
+        return run
+
+    def add_job(self, name: str, func, trigger: BaseTrigger, misfire_grace_time: int | None = 60, args=None, kwargs=None):
+        """
+        Register `func` under a unique `name`. A job with the same name is replaced.
+        :param misfire_grace_time: seconds a run may start late before it counts as missed, None for no limit
+        """
+        with self._lock:
+            self._metrics.setdefault(name, JobMetrics())
+        job = self._scheduler.add_job(
+            self._wrap(name, func),
+            trigger,
+            args=args,
+            kwargs=kwargs,
+            id=name,
+            name=name,
+            replace_existing=True,
+            coalesce=True,
+            max_instances=1,
+            misfire_grace_time=misfire_grace_time,
+        )
+        # The replaced job object is gone from APScheduler, terminate_all must not try to remove it again
+        jobHandler.remove(name)
+        jobHandler.add(job)
+        self._ensure_started()
+        logger.debug(f"Job {name} scheduled, next run at {job.next_run_time}")
+        return job
+
+    def add_cron_job(self, name: str, func, jitter: int | None = None, misfire_grace_time: int | None = 3600, **cron_fields):
+        """`cron_fields` are CronTrigger fields: hour, minute, second, day_of_week..."""
+        return self.add_job(name, func, CronTrigger(jitter=jitter, **cron_fields), misfire_grace_time)
+
+    def add_interval_job(self, name: str, func, seconds: float, jitter: int | None = None, misfire_grace_time: int | None = 60,
+                         allowed_hours: list | None = None, blocked_hours: list | None = None, run_now: bool = False):
+        """
+        Run every `seconds`, optionally only inside `allowed_hours` and outside `blocked_hours` (local 0-23 hours).
+        :param run_now: fire the first run immediately instead of one interval from now
+        """
+        trigger = IntervalTrigger(seconds=seconds, jitter=jitter, start_date=datetime.now() if run_now else None)
+        hours = get_allowed_hours(allowed_hours, blocked_hours)
+        if hours is not None:
+            if not hours:
+                logger.warning(f"Job {name} has no allowed hours left and will never run")
+                return None
+            trigger = HourWindowTrigger(trigger, hours)
+        return self.add_job(name, func, trigger, misfire_grace_time)
+
+    def remove_job(self, name: str):
+        jobHandler.remove(name)
+        try:
+            self._scheduler.remove_job(name)
+        except Exception:
+            pass
+
+    def get_metrics(self, name: str | None = None) -> dict:
+        if name is not None:
+            metrics = self._metrics.get(name)
+            return metrics.to_dict() if metrics else {}
+        return {job_name: metrics.to_dict() for job_name, metrics in self._metrics.items()}
+
+
+def get_allowed_hours(allowed_hours: list | None, blocked_hours: list | None):
+    """Hours a job may run in, None if there's no restriction"""
+    if not allowed_hours and not blocked_hours:
+        return None
+    hours = [int(hour) for hour in allowed_hours] if allowed_hours else list(range(24))
+    blocked = {int(hour) for hour in blocked_hours or []}
+    return sorted({hour for hour in hours if 0 <= hour < 24 and hour not in blocked})
+
+
+scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> Scheduler:
+    """Get the global scheduler instance"""
+    global scheduler
+    with _scheduler_lock:
+        if scheduler is None:
+            scheduler = Scheduler()
+        return scheduler
@@ -0,0 +1,140 @@
+import dataclasses
+from typing import Dict, List, Union
+
+from utils.logger import PluginLogger
+from utils.models import Asset, LeaseAsset
+
+logger = PluginLogger("ShelfDiff")
+
+Shelf = Union[List[Asset], Dict[str, Asset]]
+
+
+def index_shelf(shelf: Shelf, name: str = "") -> Dict[str, Asset]:
+    """assetid -> Asset snapshot. Order numbers of listings not yet off-shelved (non-Asset entries) are skipped, the input is left untouched"""
+    if isinstance(shelf, dict):
+        return shelf
+    index = {}
+    skipped = 0
+    for asset in shelf:
+        if isinstance(asset, Asset):
+            index[asset.assetid] = asset
+        else:
+            skipped += 1
+    if skipped:
+        logger.debug(f"Shelf {name} has {skipped} item(s) not yet off-shelved")
+    return index
+
+
+def compare_shelves(A: Shelf, B: Shelf, ratio: float) -> Dict[str, List[Asset]]:
+    """
+    What B has to do to mirror A at price ratio A/B.
+    add: A listings missing from B, priced for B. delete: B listings not on A. change: B listings repriced to follow A.
+    """
+    result = {"add": [], "delete": [], "change": []}
+    ratio = round(ratio, 2)
+    A_index, B_index = index_shelf(A, "A"), index_shelf(B, "B")
+
+    for assetid, A_item in A_index.items():
+        B_item = B_index.get(assetid)
+        if B_item is None:
+            result["add"].append(dataclasses.replace(A_item, price=round(A_item.price / ratio, 2)))
+        elif not B_item.price or abs(round(A_item.price / B_item.price - ratio, 2)) > 0.01:
+            result["change"].append(dataclasses.replace(B_item, price=round(A_item.price / ratio, 2)))
+    result["delete"] = [B_item for assetid, B_item in B_index.items() if assetid not in A_index]
+    return result
+
+
+def lease_terms_differ(A_item: LeaseAsset, B_item: LeaseAsset, ratio: float) -> bool:
+    if A_item.LeaseDeposit != B_item.LeaseDeposit or A_item.LeaseMaxDays != B_item.LeaseMaxDays:
+        return True
+    if not B_item.LeaseUnitPrice or round(abs(A_item.LeaseUnitPrice / B_item.LeaseUnitPrice - ratio), 2) >= 0.01:
+        return True
+    if A_item.LongLeaseUnitPrice and B_item.LongLeaseUnitPrice:
+        return round(abs(A_item.LongLeaseUnitPrice / B_item.LongLeaseUnitPrice - ratio), 2) > 0.01
+    return A_item.LongLeaseUnitPrice != B_item.LongLeaseUnitPrice
+
+
+def compare_lease_shelf(A: Shelf, B: Shelf, ratio: float) -> Dict[str, List[LeaseAsset]]:
+    """Same as compare_shelves for lease listings. Changed listings carry A's terms scaled by the ratio and B's order number."""
+    result = {"add": [], "delete": [], "change": []}
+    ratio = round(ratio, 2)
+    A_index, B_index = index_shelf(A, "A"), index_shelf(B, "B")
+
+    for assetid, A_item in A_index.items():
+        B_item = B_index.get(assetid)
+        if B_item is None:
+            result["add"].append(A_item)
+        elif lease_terms_differ(A_item, B_item, ratio):
+            changes = {"orderNo": B_item.orderNo, "LeaseUnitPrice": round(A_item.LeaseUnitPrice / ratio, 2)}
+            if A_item.LongLeaseUnitPrice:
+                changes["LongLeaseUnitPrice"] = round(A_item.LongLeaseUnitPrice / ratio, 2)
+            result["change"].append(dataclasses.replace(A_item, **changes))
+    result["delete"] = [B_item for assetid, B_item in B_index.items() if assetid not in A_index]
+    return result
+
+
+if __name__ == "__main__":
+    # Randomized check against a straightforward reference, then timing at 10k listings
+    import random
+    import time
+
+    def reference_compare_shelves(A, B, ratio):
+        ratio = round(ratio, 2)
+        A = {a.assetid: a for a in A if isinstance(a, Asset)}
+        B = {b.assetid: b for b in B if isinstance(b, Asset)}
+        add = [(k, round(a.price / ratio, 2)) for k, a in A.items() if k not in B]
+        delete = [k for k in B if k not in A]
+        change = [(k, round(A[k].price / ratio, 2)) for k in A if k in B and abs(round(A[k].price / B[k].price - ratio, 2)) > 0.01]
+        return add, delete, change
+
+    def random_shelf(assetids, lease=False):
+        shelf = []
+        for assetid in assetids:
+            price = round(random.uniform(1, 1000), 2)
+            if lease:
+                shelf.append(LeaseAsset(assetid=assetid, orderNo=f"o{assetid}", LeaseDeposit=price, LeaseMaxDays=30, LeaseUnitPrice=round(price / 100, 2) or 0.01))
+            else:
+                shelf.append(Asset(assetid=assetid, orderNo=f"o{assetid}", price=price))
+        return shelf
+
+    for _ in range(200):
+        ids = [str(i) for i in random.sample(range(1000), 60)]
+        A = random_shelf(ids[:40]) + ["stale-order"]
+        B = random_shelf(ids[20:])
+        # Some overlapping listings already in sync
+        for A_item, B_item in zip(A[20:25], B[:5]):
+            B_item.price = A_item.price
+        ratio = random.choice([1, 0.95, 1.1])
+        A_before, B_before = list(A), list(B)
+        result = compare_shelves(A, B, ratio)
+        add, delete, change = reference_compare_shelves(A, B, ratio)
+        assert A == A_before and B == B_before, "inputs must not be mutated"
+        assert [(a.assetid, a.price) for a in result["add"]] == add
+        assert [b.assetid for b in result["delete"]] == delete
+        assert [(c.assetid, c.price) for c in result["change"]] == change
+        assert all(c.orderNo == f"o{c.assetid}" for c in result["change"])
+        lease_result = compare_lease_shelf(random_shelf(ids[:40], True), random_shelf(ids[20:], True), ratio)
+        assert len(lease_result["add"]) == 20 and len(lease_result["delete"]) == 20
+    print("randomized checks passed")
+
+    # 10k listings mirrored on both sides, 1% of them listed, delisted or repriced since the last sync,
+    # plus 2k order numbers of listings that are no longer in the Steam inventory
+    ids = [str(i) for i in range(10100)]
+    for name, func, lease in [("compare_shelves", compare_shelves, False), ("compare_lease_shelf", compare_lease_shelf, True)]:
+        A = random_shelf(ids[100:])
+        B = [dataclasses.replace(asset) for asset in A[:-50]] + random_shelf(ids[:50], lease)
+        if lease:
+            A = random_shelf(ids[100:], True)
+            B = [dataclasses.replace(asset) for asset in A[:-50]] + random_shelf(ids[:50], True)
+        for asset in B[:50]:
+            asset.orderNo = "changed"
+            if lease:
+                asset.LeaseUnitPrice += 1
+            else:
+                asset.price += 1
+        A += [f"stale-{i}" for i in range(2000)]
+        B += [f"stale-{i}" for i in range(2000)]
+        start = time.perf_counter()
+        for _ in range(10):
+            func(A, B, 1)
+        print(f"{name}: {(time.perf_counter() - start) / 10 * 1000:.1f} ms at 10k listings")
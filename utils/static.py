@@ -123,6 +123,9 @@ DEFAULT_CONFIG_JSON = r"""
     "enable": true,
     // Polling interval in seconds
     "interval": 300,
+    // At most request_rate BUFF requests in any request_period seconds, shared by every BUFF plugin. Higher rates risk BUFF's rate limits
+    "request_rate": 3,
+    "request_period": 10,
     // Enable dota2 support
     "dota2_support": false
   },
@@ -221,7 +224,9 @@ DEFAULT_CONFIG_JSON = r"""
     // Lease price ratio. Example: current 1000, ratio 0.001 => price 1 (not lower than normal calc)
     "fix_lease_ratio": 0.001,
     // Compensation type: 0(non-member), 7(v1), others unknown
-    "compensation_type": 7
+    "compensation_type": 7,
+    // Skip repricing when the new lease terms are within this fraction of the listed ones (0.01 = 1%). 0 only skips unchanged items
+    "reprice_tolerance": 0
   },
   // UU Youpin auto list-for-sale
   "uu_auto_sell_item": {
@@ -250,7 +255,9 @@ DEFAULT_CONFIG_JSON = r"""
       "blacklist_word_2"
     ],
     "use_price_adjustment": true, // Auto undercut by -0.01
-    "price_adjustment_threshold": 1.0 // Only undercut above this price
+    "price_adjustment_threshold": 1.0, // Only undercut above this price
+    // Skip repricing when the new price is within this fraction of the listed one (0.01 = 1%). 0 only skips unchanged items
+    "reprice_tolerance": 0
   },
   // Steam auto-accept gift offers
   "steam_auto_accept_offer": {
@@ -286,6 +293,7 @@ DEFAULT_CONFIG_JSON = r"""
       }
     },
     "sync_interval": 60, // Sync interval seconds. Do not set too long or accounts may be banned.
+    "full_sync_interval": 10, // Every N sync passes, re-read every shelf and the Steam inventory. Passes in between only re-read the main platform and shelves we changed
     "qps": 10 // Max requests per second. If you have VIP whitelist, 30 is suggested.
   },
   "c5_auto_accept_offer": { // C5 auto-delivery
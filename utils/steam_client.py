@@ -18,6 +18,7 @@ from steampy.models import GameOptions
 from utils import static
 from utils.logger import PluginLogger, handle_caught_exception
 from utils.notifier import send_notification
+from utils.rate_limiter import RateLimiter
 from utils.static import SESSION_FOLDER, STEAM_ACCOUNT_INFO_FILE_PATH, CONFIG_FILE_PATH
 from utils.tools import accelerator, get_encoding, pause
 
@@ -26,6 +27,9 @@ logger = PluginLogger('SteamClient')
 steam_client_mutex = threading.Lock()
 steam_client: Optional[SteamClient] = None
 token_refresh_thread = None  # background refresh thread reference
+# Spaces the offers of one accept_trade_offers batch (used by C5), so bursts of small orders don't hammer Steam.
+# Plain accept_trade_offer calls from other plugins are not paced by it.
+accept_rate_limiter = RateLimiter(1, 3.0)
 
 try:
     with open(CONFIG_FILE_PATH, "r", encoding=get_encoding(CONFIG_FILE_PATH)) as f:
@@ -675,6 +679,28 @@ def accept_trade_offer(client: SteamClient, mutex, tradeOfferId, retry=False, de
         send_notification(f'Offer ID: {tradeOfferId}\n{desc}', title='Offer accept failed')
         return False
 
+
+def accept_trade_offers(client: SteamClient, mutex, offers: list, accepted: Optional[set] = None, reportToExternal=True) -> list:
+    """
+    Accept a batch of trade offers in order. Back-to-back accepts of every batch are spaced by accept_rate_limiter,
+    so there is no fixed sleep per offer.
+    :param offers: [(tradeOfferId, desc)]
+    :param accepted: offer IDs already handled, skipped here and updated with the ones accepted now
+    :return: offer IDs accepted by this call
+    """
+    done = []
+    for tradeOfferId, desc in offers:
+        if accepted is not None and tradeOfferId in accepted:
+            logger.info(f'Offer {tradeOfferId} already processed. Skipping.')
+            continue
+        with accept_rate_limiter:
+            if accept_trade_offer(client, mutex, tradeOfferId, desc=desc, reportToExternal=reportToExternal):
+                done.append(tradeOfferId)
+                if accepted is not None:
+                    accepted.add(tradeOfferId)
+    return done
+
+
 def get_cs2_inventory(client: SteamClient, mutex):
     inventory = None
     try:
@@ -30,6 +30,11 @@ class jobHandler:
         global jobs
         jobs.append(job)
 
+    @staticmethod
+    def remove(job_id: str):
+        global jobs
+        jobs[:] = [job for job in jobs if job.id != job_id]
+
     @staticmethod
     def terminate_all():
         global jobs
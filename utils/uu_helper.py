@@ -56,9 +56,7 @@ def get_token_automatically():
     logger.debug("Random token_id: " + token_id)
     uk = ''
     try:
-        from utils.cloud_service import get_uu_uk_from_cloud
-
-        uk = get_uu_uk_from_cloud()
+        uk = uuyoupinapi.uk_provider.get()
     except Exception:
         logger.warning("Cloud service unavailable. Cannot get UK. Using defaults.")
         pass
@@ -1,15 +1,26 @@
+import dataclasses
 import json
 import random
 import string
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import requests
 
 from utils.logger import PluginLogger
+from utils.rate_limiter import RateLimiter
 from uuyoupinapi import models
 
 logger = PluginLogger("uuyoupinapi")
 
+# Shared by every UUAccount in the process, so concurrent callers can't burst past what UU tolerates
+uu_rate_limiter = RateLimiter(5, 1.0)
+# Largest commodity list the price-change endpoint takes in one call
+PRICE_CHANGE_BATCH_SIZE = 50
+# Largest item list the listing endpoint takes in one call
+ONSHELF_BATCH_SIZE = 50
+
 
 def generate_random_string(length):
     """
@@ -58,6 +69,137 @@ def is_json(data):
     return True
 
 
+def get_total_count(response_json: dict):
+    """Total item count reported by a UU list response, None if the endpoint doesn't report one"""
+    for container in (response_json.get("data"), response_json.get("Data"), response_json):
+        if isinstance(container, dict):
+            for key in ("totalCount", "TotalCount", "total", "Total"):
+                if isinstance(container.get(key), int):
+                    return container[key]
+    return None
+
+
+class UKProvider:
+    """
+    Process-wide cache of the UK verification parameter from the cloud service.
+    Only one thread fetches at a time; once a UK gets close to expiry it is renewed in the background while callers keep using it.
+    If the cloud can't deliver, callers get a random UK that is not cached.
+    """
+
+    def __init__(self, ttl: float = 30, renew_before: float = 10, failure_backoff: float = 5):
+        self.ttl = ttl
+        self.renew_before = renew_before
+        self.failure_backoff = failure_backoff
+        self._uk = ""
+        self._fetched_at = 0.0
+        self._failed_at = 0.0
+        self._lock = threading.Lock()
+        self._renewing = False
+
+    def _fetch(self):
+        try:
+            from utils import cloud_service
+
+            uk = cloud_service.get_uu_uk_from_cloud()
+        except ImportError:
+            logger.warning("Cloud service unavailable. Using a random UK.")
+            uk = ""
+        except Exception as e:
+            logger.warning(f"Error fetching UK: {e}. Using a random UK.")
+            uk = ""
+        if uk:
+            self._uk = uk
+            self._fetched_at = time.time()
+            logger.debug(f'Fetched UK successfully. Next refresh: {time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self._fetched_at + self.ttl - self.renew_before))}')
+        else:
+            self._failed_at = time.time()
+            logger.error("Failed to fetch UK from cloud. Using a random UK for this request without caching.")
+        return uk
+
+    def _renew(self):
+        try:
+            with self._lock:
+                if time.time() - self._fetched_at >= self.ttl - self.renew_before:
+                    self._fetch()
+        finally:
+            self._renewing = False
+
+    def get(self) -> str:
+        age = time.time() - self._fetched_at
+        if self._uk and age < self.ttl:
+            if age >= self.ttl - self.renew_before and not self._renewing:
+                self._renewing = True
+                threading.Thread(target=self._renew, name="UKRenew", daemon=True).start()
+            return self._uk
+        with self._lock:
+            # Someone else may have refreshed while we waited
+            if self._uk and time.time() - self._fetched_at < self.ttl:
+                return self._uk
+            if time.time() - self._failed_at < self.failure_backoff:
+                return generate_random_string(65)
+            return self._fetch() or generate_random_string(65)
+
+
+uk_provider = UKProvider()
+
+
+class UUShelfIndex:
+    """
+    assetid -> listing lookups over one account's UU sell and lease shelves.
+    Each shelf is fetched once per sync and reused; a lookup miss refetches that shelf at most once every `refresh_interval` seconds.
+    """
+
+    def __init__(self, account: "UUAccount", refresh_interval: float = 30):
+        self.account = account
+        self.refresh_interval = refresh_interval
+        # assetid -> raw sell list item
+        self._sell = {}
+        # assetid -> models.LeaseAsset
+        self._lease = {}
+        self._sell_synced_at = 0.0
+        self._lease_synced_at = 0.0
+        self._lock = threading.Lock()
+
+    def refresh_sell(self) -> list:
+        """Fetch the sell shelf, reindex it and return the raw list"""
+        shelf = self.account.get_sell_list()
+        with self._lock:
+            self._sell = {str(item["steamAssetId"]): item for item in shelf}
+            self._sell_synced_at = time.time()
+        return shelf
+
+    def refresh_lease(self) -> list:
+        """Fetch the lease shelf, reindex it and return the LeaseAsset list"""
+        shelf = self.account.get_uu_leased_inventory()
+        with self._lock:
+            self._lease = {str(asset.assetid): asset for asset in shelf}
+            self._lease_synced_at = time.time()
+        return shelf
+
+    def refresh(self):
+        self.refresh_sell()
+        self.refresh_lease()
+
+    def get_sell(self, assetid):
+        """Raw sell list item for `assetid`, or None"""
+        assetid = str(assetid)
+        if assetid not in self._sell and time.time() - self._sell_synced_at >= self.refresh_interval:
+            self.refresh_sell()
+        return self._sell.get(assetid)
+
+    def get_lease(self, assetid):
+        """LeaseAsset for `assetid`, or None"""
+        assetid = str(assetid)
+        if assetid not in self._lease and time.time() - self._lease_synced_at >= self.refresh_interval:
+            self.refresh_lease()
+        return self._lease.get(assetid)
+
+    def invalidate(self):
+        with self._lock:
+            self._sell_synced_at = 0.0
+            self._lease_synced_at = 0.0
+
+
 class UUAccount:
     def __init__(self, token: str, deviceToken="", proxy=None):
         """
@@ -75,6 +217,9 @@ class UUAccount:
         random.seed(token)
         self.deviceToken = deviceToken
         self.session.headers.update(generate_headers(deviceToken, deviceToken, token=token))
+        # uk is only sent with requests that need it, see call_api
+        self.session.headers.pop("uk", None)
+        self.shelf_index = UUShelfIndex(self)
         try:
             info = self.call_api("GET", "/api/user/Account/getUserInfo").json()
             self.nickname = info["Data"]["NickName"]
@@ -153,57 +298,20 @@ class UUAccount:
         :param data: payload
         """
         url = "https://api.youpin898.com" + path
-        if pc_platform:
-            self.session.headers["platform"] = "pc"
-        else:
-            self.session.headers["platform"] = "android"
-
-        if not uk_verify:
-            if "uk" in self.session.headers:
-                self.session.headers.pop("uk")
-        else:
-            try:
-                from utils import cloud_service
-
-                if not hasattr(self, "uk") or not hasattr(self, "uk_time") or (time.time() - self.uk_time > 30):
-                    if not hasattr(self, "uk"):
-                        logger.debug("No cached UK. Fetching verification parameter from cloud...")
-                    else:
-                        logger.debug("Cached UK expired or invalid. Fetching from cloud...")
-
-                    fetched_uk = cloud_service.get_uu_uk_from_cloud()
-                    if fetched_uk:
-                        self.uk = fetched_uk
-                        self.uk_time = time.time()
-                        self.session.headers["uk"] = self.uk
-                        logger.debug(
-                            f'Fetched UK successfully. Cached. Next refresh: {time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.uk_time + 30))}'
-                        )
-                    else:
-                        logger.error("Failed to fetch UK from cloud. Using a random UK for this request without caching.")
-                        self.session.headers["uk"] = generate_random_string(65)
-                else:
-                    self.session.headers["uk"] = self.uk
-                    logger.debug(
-                        "Using cached UK. Next refresh: "
-                        + time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.uk_time + 30))
-                    )
-
-            except ImportError:
-                logger.warning("Cloud service unavailable. Using a random UK.")
-                self.session.headers["uk"] = generate_random_string(65)
-            except Exception as e:
-                logger.warning(f"Error fetching or handling UK: {e}. Using a random UK for this request without caching.")
-                self.session.headers["uk"] = generate_random_string(65)
+        # Per-request headers, the session is shared between threads
+        headers = {"platform": "pc" if pc_platform else "android"}
+        if uk_verify:
+            headers["uk"] = uk_provider.get()
 
+        uu_rate_limiter.acquire()
         if method == "GET":
-            response = self.session.get(url, params=data)
+            response = self.session.get(url, params=data, headers=headers)
         elif method == "POST":
-            response = self.session.post(url, json=data)
+            response = self.session.post(url, json=data, headers=headers)
         elif method == "PUT":
-            response = self.session.put(url, json=data)
+            response = self.session.put(url, json=data, headers=headers)
         elif method == "DELETE":
-            response = self.session.delete(url)
+            response = self.session.delete(url, headers=headers)
         else:
             raise Exception("Method not supported")
         log_output = response.content.decode()
@@ -223,6 +331,57 @@ class UUAccount:
 
         return response
 
+    def iter_pages(self, path, data, get_items, page_size, method="POST", max_workers=4, short_page_is_last=True):
+        """
+        Yield every item of a paged UU list endpoint, in page order.
+        If page 1 reports a total count, the remaining pages are fetched concurrently, paced by uu_rate_limiter, and a page inside
+        that total that fails raises instead of silently truncating the list.
+        Otherwise pages are walked one at a time until the endpoint reports no more data or returns an empty page.
+        :param data: request payload without pageIndex/pageSize
+        :param get_items: parsed response -> list of items, or None when the endpoint reports no more data
+        :param short_page_is_last: the endpoint always fills a page, so a short page ends the walk without another request
+        """
+
+        def fetch(page_index):
+            response = self.call_api(method, path, data={**data, "pageIndex": page_index, "pageSize": page_size})
+            response.raise_for_status()
+            return response.json()
+
+        first_page = fetch(1)
+        items = get_items(first_page)
+        if not items:
+            return
+        yield from items
+        if short_page_is_last and len(items) < page_size:
+            return
+
+        total_count = get_total_count(first_page)
+        if total_count is not None:
+            page_count = -(-total_count // page_size)
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = [executor.submit(fetch, page_index) for page_index in range(2, page_count + 1)]
+                try:
+                    for page_index, future in enumerate(futures, start=2):
+                        items = get_items(future.result())
+                        if items is None:
+                            raise Exception(f"UU returned no data for page {page_index}/{page_count} of {path}")
+                        # The list shrank since page 1 was read, nothing further back
+                        if not items:
+                            break
+                        yield from items
+                finally:
+                    for future in futures:
+                        future.cancel()
+            return
+
+        page_index = 1
+        while not short_page_is_last or len(items) == page_size:
+            page_index += 1
+            items = get_items(fetch(page_index))
+            if not items:
+                return
+            yield from items
+
     def pre_change_lease_price_post(self, commodity_ids):
         self.call_api(
             "POST",
@@ -236,8 +395,9 @@ class UUAccount:
         ).json()
         return
 
-    def change_leased_price(self, items: list[models.LeaseAsset], compensation_type=0):
+    def change_leased_price(self, items: list[models.LeaseAsset], compensation_type=0, succeeded: set | None = None):
         """
+        :param succeeded: if given, the CommodityId of every item UU confirmed is added to it
         Request example:
         {
             "Commoditys": [{
@@ -286,20 +446,27 @@ class UUAccount:
                 item_info["Price"] = item.price
             commodity_ids.append(item_info["CommodityId"])
             item_infos.append(item_info)
-        self.pre_change_lease_price_post(commodity_ids)
-        rsp = self.call_api(
-            "PUT",
-            "/api/commodity/Commodity/PriceChangeWithLeaseV2",
-            data={
-                "Commoditys": item_infos,
-                "Sessionid": self.deviceToken,
-            },
-        ).json()
-        if rsp["Data"]["FailCount"] != 0:
+        success_count = 0
+        for i in range(0, len(item_infos), PRICE_CHANGE_BATCH_SIZE):
+            self.pre_change_lease_price_post(commodity_ids[i : i + PRICE_CHANGE_BATCH_SIZE])
+            rsp = self.call_api(
+                "PUT",
+                "/api/commodity/Commodity/PriceChangeWithLeaseV2",
+                data={
+                    "Commoditys": item_infos[i : i + PRICE_CHANGE_BATCH_SIZE],
+                    "Sessionid": self.deviceToken,
+                },
+            ).json()
+            if not rsp.get("Data"):
+                logger.error(f"Failed to change price for {len(item_infos[i : i + PRICE_CHANGE_BATCH_SIZE])} item(s). Response: {rsp}")
+                continue
             for commodity in rsp["Data"]["Commoditys"]:
                 if commodity["IsSuccess"] != 1:
-                    logger.error(f"Failed to change price. CommodityId: {commodity[id]}, reason: {commodity['Message']}")
-        return rsp["Data"]["SuccessCount"]
+                    logger.error(f"Failed to change price. CommodityId: {commodity['CommodityId']}, reason: {commodity['Message']}")
+                elif succeeded is not None:
+                    succeeded.add(int(commodity["CommodityId"]))
+            success_count += rsp["Data"]["SuccessCount"]
+        return success_count
 
     def send_offer(self, orderNo):
         rsp = self.call_api(
@@ -323,12 +490,67 @@ class UUAccount:
         else:
             return rsp["msg"]
 
-    def get_wait_deliver_list(self, game_id=730, return_offer_id=True):
+    def _send_offer_and_wait(self, order):
+        """Ask UU to send the offer for `order` and poll until it's out. The offer itself is picked up on the next poll."""
+        result = self.send_offer(order["orderNo"])
+        if result is not True:
+            logger.error(
+                f"[UUAutoAcceptOffer] Failed to send offer for order {order['orderNo']} ({order['commodityName']}). Reason: {result}"
+            )
+            return
+        logger.info(f"[UUAutoAcceptOffer] Offer for order {order['orderNo']} ({order['commodityName']}) is being sent. Waiting...")
+        for i in range(5):
+            result = self.get_offer_status(order["orderNo"])
+            if isinstance(result, dict) and result["data"]["status"] == 3:
+                logger.info(
+                    f"[UUAutoAcceptOffer] Offer for order {order['orderNo']} ({order['commodityName']}) sent. Token confirmation will occur next poll."
+                )
+                return
+            if i == 4:
+                logger.warning(f"[UUAutoAcceptOffer] Offer send wait timeout for order {order['orderNo']} ({order['commodityName']})")
+                return
+            time.sleep(1.5)
+
+    def _resolve_offer_id(self, order_no):
+        """Look up the Steam offer of one pending order through the two order detail endpoints, None if neither has it yet"""
+        orderDetail = self.call_api(
+            "POST",
+            "/api/youpin/bff/order/v2/detail",
+            data={
+                "orderId": order_no,
+                "Sessionid": self.deviceToken,
+            },
+        ).json()
+        if orderDetail["data"] and "orderDetail" in orderDetail["data"]:
+            orderDetail = orderDetail["data"]["orderDetail"]
+            if "offerId" in orderDetail:
+                return {
+                    "offer_id": orderDetail["offerId"],
+                    "item_name": orderDetail["productDetail"]["commodityName"],
+                }
+        orderDetail = self.call_api(
+            "POST",
+            "/api/youpin/bff/trade/v1/order/query/detail",
+            data={
+                "orderNo": order_no,
+                "Sessionid": self.deviceToken,
+            },
+        ).json()
+        orderDetail = orderDetail["data"]
+        if orderDetail and "tradeOfferId" in orderDetail and "系统验证中" not in str(orderDetail):
+            return {
+                "offer_id": orderDetail["tradeOfferId"],
+                "item_name": orderDetail["commodity"]["name"],
+            }
+        return None
+
+    def iter_wait_deliver_list(self, game_id=730, max_workers=4):
         """
-        Get pending-delivery list.
-        :param return_offer_id: default True. Whether to return Steam trade offer id.
+        Stream pending-delivery offers as soon as each one is known.
+        Offers are sent and polled concurrently, and orders missing an offer id are resolved in parallel;
+        request pacing comes from uu_rate_limiter instead of fixed sleeps.
         :param game_id: default 730
-        :return: list of dicts like [{'offer_id': '...', 'item_name': '...'}, ...]
+        :return: generator of dicts like {'offer_id': '...', 'item_name': '...'}
         """
         toDoList_response = self.call_api(
             "POST",
@@ -341,6 +563,7 @@ class UUAccount:
             },
         ).json()
         toDoList = dict()
+        orders_to_send = []
         for order in toDoList_response["data"]:
             if "赠送" in order["message"]:
                 logger.warning(
@@ -350,116 +573,72 @@ class UUAccount:
                 logger.info(
                     f"[UUAutoAcceptOffer] Order {order['orderNo']} ({order['commodityName']}) requires sending an offer. Sending..."
                 )
-                result = self.send_offer(order["orderNo"])
-                if result is True:
-                    logger.info(
-                        f"[UUAutoAcceptOffer] Offer for order {order['orderNo']} ({order['commodityName']}) is being sent. Waiting..."
-                    )
-                    for i in range(5):
-                        result = self.get_offer_status(order["orderNo"])
-                        if result["data"]["status"] == 3:
-                            logger.info(
-                                f"[UUAutoAcceptOffer] Offer for order {order['orderNo']} ({order['commodityName']}) sent. Token confirmation will occur next poll."
-                            )
-                            break
-                        if i == 4:
-                            logger.warning(
-                                f"[UUAutoAcceptOffer] Offer send wait timeout for order {order['orderNo']} ({order['commodityName']})"
-                            )
-                            break
-                        time.sleep(1.5)
-                else:
-                    logger.error(
-                        f"[UUAutoAcceptOffer] Failed to send offer for order {order['orderNo']} ({order['commodityName']}). Reason: {result}"
-                    )
+                orders_to_send.append(order)
             else:
                 toDoList[order["orderNo"]] = order
-        data_to_return = []
-        # There are three possible ways the platform exposes an offerId
-        if len(toDoList.keys()) != 0:
-            data = self.call_api(
-                "POST",
-                "/api/youpin/bff/trade/sale/v1/sell/list",
-                data={
-                    "keys": "",
-                    "orderStatus": "140",
-                    "pageIndex": 1,
-                    "pageSize": 100,
-                },
-            ).json()["data"]
-            for order in data["orderList"]:
-                if int(order["offerType"]) == 2:
-                    if order["tradeOfferId"] is not None:
-                        if order["orderNo"] in toDoList.keys():
-                            del toDoList[order["orderNo"]]
-                        data_to_return.append(
-                            {
-                                "offer_id": order["tradeOfferId"],
-                                "item_name": order["productDetail"]["commodityName"],
-                            }
-                        )
-        if len(toDoList.keys()) != 0:
-            for order in list(toDoList.keys()):
-                time.sleep(3)
-                orderDetail = self.call_api(
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            send_futures = [executor.submit(self._send_offer_and_wait, order) for order in orders_to_send]
+            # There are three possible ways the platform exposes an offerId
+            if len(toDoList.keys()) != 0:
+                data = self.call_api(
                     "POST",
-                    "/api/youpin/bff/order/v2/detail",
+                    "/api/youpin/bff/trade/sale/v1/sell/list",
                     data={
-                        "orderId": order,
-                        "Sessionid": self.deviceToken,
+                        "keys": "",
+                        "orderStatus": "140",
+                        "pageIndex": 1,
+                        "pageSize": 100,
                     },
-                ).json()
-                if orderDetail["data"] and "orderDetail" in orderDetail["data"]:
-                    orderDetail = orderDetail["data"]["orderDetail"]
-                    if "offerId" in orderDetail:
-                        data_to_return.append(
-                            {
-                                "offer_id": orderDetail["offerId"],
-                                "item_name": orderDetail["productDetail"]["commodityName"],
+                ).json()["data"]
+                for order in data["orderList"]:
+                    if int(order["offerType"]) == 2:
+                        if order["tradeOfferId"] is not None:
+                            if order["orderNo"] in toDoList.keys():
+                                del toDoList[order["orderNo"]]
+                            yield {
+                                "offer_id": order["tradeOfferId"],
+                                "item_name": order["productDetail"]["commodityName"],
                             }
-                        )
-                        if order in toDoList.keys():
-                            del toDoList[order]
-        if len(toDoList.keys()) != 0:
-            for order in list(toDoList.keys()):
-                time.sleep(3)
-                orderDetail = self.call_api(
-                    "POST",
-                    "/api/youpin/bff/trade/v1/order/query/detail",
-                    data={
-                        "orderNo": order,
-                        "Sessionid": self.deviceToken,
-                    },
-                ).json()
-                orderDetail = orderDetail["data"]
-                if orderDetail and "tradeOfferId" in orderDetail and "系统验证中" not in str(orderDetail):
-                    data_to_return.append(
-                        {
-                            "offer_id": orderDetail["tradeOfferId"],
-                            "item_name": orderDetail["commodity"]["name"],
-                        }
-                    )
-                    if order in toDoList.keys():
-                        del toDoList[order]
+            resolve_futures = {executor.submit(self._resolve_offer_id, order_no): order_no for order_no in toDoList.keys()}
+            for future in as_completed(resolve_futures):
+                order_no = resolve_futures[future]
+                try:
+                    offer = future.result()
+                except Exception as e:
+                    logger.warning(f"[UUAutoAcceptOffer] Failed to resolve offer id for order {order_no}: {e}")
+                    continue
+                if offer is not None:
+                    del toDoList[order_no]
+                    yield offer
+            for future in send_futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.error(f"[UUAutoAcceptOffer] Failed to send offer: {e}")
         if len(toDoList.keys()) != 0:
             logger.warning(
                 "[UUAutoAcceptOffer] Some orders did not return a Steam trade offer id. OrderNos: " + str(toDoList.keys()),
             )
-        return data_to_return
+
+    def get_wait_deliver_list(self, game_id=730, return_offer_id=True):
+        """
+        Get pending-delivery list.
+        :param return_offer_id: default True. Whether to return Steam trade offer id.
+        :param game_id: default 730
+        :return: list of dicts like [{'offer_id': '...', 'item_name': '...'}, ...]
+        """
+        return list(self.iter_wait_deliver_list(game_id=game_id))
 
     def get_sell_list(self):
-        data = {"pageIndex": 0, "pageSize": 100, "whetherMerge": 0}
-        shelf = list()
-        while True:
-            data["pageIndex"] += 1
-            response = self.call_api("POST", "/api/youpin/bff/new/commodity/v1/commodity/list/sell", data=data)
-            if response.json()["code"] != 0:
-                break
-            else:
-                for item in response.json()["data"]["commodityInfoList"]:
-                    if "steamAssetId" in item:
-                        shelf.append(item)
-        return shelf
+        items = self.iter_pages(
+            "/api/youpin/bff/new/commodity/v1/commodity/list/sell",
+            {"whetherMerge": 0},
+            lambda rsp: rsp["data"]["commodityInfoList"] if rsp["code"] == 0 else None,
+            page_size=100,
+            short_page_is_last=False,
+        )
+        return [item for item in items if "steamAssetId" in item]
 
     def put_items_on_lease_shelf(self, item_infos: list[models.UUOnLeaseShelfItem], GameId=730):
         """
@@ -510,48 +689,36 @@ class UUAccount:
                 logger.error(f"Failed to list item {asset['AssetId']}(AssetId). Reason: {asset['Remark']}")
         return success_count
 
-    def get_uu_leased_inventory(self, pageIndex=1, pageSize=100) -> list[models.LeaseAsset]:
-        new_leased_inventory_list = self.get_one_channel_leased_inventory(
-            "/api/youpin/bff/new/commodity/v1/commodity/list/lease", pageIndex, pageSize
-        )
-        zero_leased_inventory_list = self.get_one_channel_leased_inventory(
-            "/api/youpin/bff/new/commodity/v1/commodity/list/zeroCDLease", pageIndex, pageSize
-        )
+    def get_uu_leased_inventory(self, pageSize=100) -> list[models.LeaseAsset]:
+        new_leased_inventory_list = self.get_one_channel_leased_inventory("/api/youpin/bff/new/commodity/v1/commodity/list/lease", pageSize)
+        zero_leased_inventory_list = self.get_one_channel_leased_inventory("/api/youpin/bff/new/commodity/v1/commodity/list/zeroCDLease", pageSize)
         return new_leased_inventory_list + zero_leased_inventory_list
 
-    def get_one_channel_leased_inventory(self, path, pageIndex=1, pageSize=100) -> list[models.LeaseAsset]:
-        rsp = self.call_api(
-            "POST",
-            path,
-            data={
-                "pageIndex": pageIndex,
-                "pageSize": pageSize,
-                "whetherMerge": 0,
-                "Sessionid": self.deviceToken,
-            },
-        ).json()
+    def get_one_channel_leased_inventory(self, path, pageSize=100) -> list[models.LeaseAsset]:
+        def get_items(rsp):
+            if rsp["code"] == 0:
+                return rsp["data"]["commodityInfoList"]
+            elif rsp["code"] == 9004001:
+                return None
+            raise Exception("Failed to fetch UU leased shelf items.")
+
         leased_inventory_list = []
-        if rsp["code"] == 0:
-            for item in rsp["data"]["commodityInfoList"]:
-                leased_inventory_list.append(
-                    models.LeaseAsset(
-                        assetid=str(item["steamAssetId"]),
-                        templateid=item["templateId"],
-                        short_name=item["name"],
-                        LeaseDeposit=float(item["depositAmount"]),
-                        LeaseUnitPrice=float(item["shortLeaseAmount"]),
-                        LongLeaseUnitPrice=float(item["longLeaseAmount"]) if item["longLeaseAmount"] else float(0),
-                        LeaseMaxDays=item["leaseMaxDays"],
-                        IsCanSold=bool(item["commodityCanSell"]),
-                        IsCanLease=bool(item["commodityCanLease"]),
-                        orderNo=item["id"],
-                        price=float(item["referencePrice"][1:]),
-                    )
+        for item in self.iter_pages(path, {"whetherMerge": 0, "Sessionid": self.deviceToken}, get_items, page_size=pageSize):
+            leased_inventory_list.append(
+                models.LeaseAsset(
+                    assetid=str(item["steamAssetId"]),
+                    templateid=int(item["templateId"]),
+                    short_name=item["name"],
+                    LeaseDeposit=float(item["depositAmount"]),
+                    LeaseUnitPrice=float(item["shortLeaseAmount"]),
+                    LongLeaseUnitPrice=float(item["longLeaseAmount"]) if item["longLeaseAmount"] else float(0),
+                    LeaseMaxDays=int(item["leaseMaxDays"]),
+                    IsCanSold=bool(item["commodityCanSell"]),
+                    IsCanLease=bool(item["commodityCanLease"]),
+                    orderNo=item["id"],
+                    price=float(item["referencePrice"][1:]),
                 )
-        elif rsp["code"] == 9004001:
-            pass
-        else:
-            raise Exception("Failed to fetch UU leased shelf items.")
+            )
         return leased_inventory_list
 
     def get_inventory(self, refresh=False):
@@ -650,6 +817,7 @@ class UUAccount:
 
     def off_shelf(self, commodity_ids: list):
         # Works for both sale and lease items
+        self.shelf_index.invalidate()
         return self.call_api(
             "PUT",
             "/api/commodity/Commodity/OffShelf",
@@ -735,7 +903,7 @@ class UUAccount:
         item_infos += [models.UUOnSellShelfItem.fromAsset(asset).model_dump(exclude_none=True) for asset in sell_assets_dict.values()]
         item_infos += [models.UUOnLeaseShelfItem.fromLeaseAsset(asset).model_dump(exclude_none=True) for asset in lease_assets_dict.values()]
 
-        batches = [item_infos[i : i + 50] for i in range(0, len(item_infos), 50)]
+        batches = [item_infos[i : i + ONSHELF_BATCH_SIZE] for i in range(0, len(item_infos), ONSHELF_BATCH_SIZE)]
         change_price_onshelf_list = []
         success_count = 0
         for batch in batches:
@@ -772,30 +940,27 @@ class UUAccount:
                         logger.error(f"Failed to list {asset['AssetId']}. Reason: {asset['Remark']}")
         if change_price_onshelf_list:
             logger.info(f"Listing {len(change_price_onshelf_list)} item(s) via price-change workflow")
-            sell_shelf = self.get_sell_list()
-            lease_shelf = self.get_uu_leased_inventory()
+            self.shelf_index.refresh()
             for asset in change_price_onshelf_list:
                 if asset["IsCanSold"]:
-                    for lease_asset in lease_shelf:
-                        if asset["AssetId"] == int(lease_asset.assetid):
-                            asset["CommodityId"] = lease_asset.orderNo
-                            asset["LeaseDeposit"] = str(lease_asset.LeaseDeposit)
-                            asset["LeaseMaxDays"] = lease_asset.LeaseMaxDays
-                            asset["LeaseUnitPrice"] = lease_asset.LeaseUnitPrice
-                            if lease_asset.LongLeaseUnitPrice:
-                                asset["LongLeaseUnitPrice"] = lease_asset.LongLeaseUnitPrice
-                            asset["IsCanLease"] = True
-                            del asset["AssetId"]
-                            break
+                    lease_asset = self.shelf_index.get_lease(asset["AssetId"])
+                    if lease_asset:
+                        asset["CommodityId"] = lease_asset.orderNo
+                        asset["LeaseDeposit"] = str(lease_asset.LeaseDeposit)
+                        asset["LeaseMaxDays"] = lease_asset.LeaseMaxDays
+                        asset["LeaseUnitPrice"] = lease_asset.LeaseUnitPrice
+                        if lease_asset.LongLeaseUnitPrice:
+                            asset["LongLeaseUnitPrice"] = lease_asset.LongLeaseUnitPrice
+                        asset["IsCanLease"] = True
+                        del asset["AssetId"]
                 elif asset["IsCanLease"]:
-                    for sell_asset in sell_shelf:
-                        if asset["AssetId"] == int(sell_asset["steamAssetId"]):
-                            asset["CommodityId"] = sell_asset["id"]
-                            asset["Price"] = sell_asset["price"]
-                            asset["IsCanSold"] = True
-                            del asset["AssetId"]
-                            break
-            batches = [change_price_onshelf_list[i : i + 50] for i in range(0, len(change_price_onshelf_list), 50)]
+                    sell_asset = self.shelf_index.get_sell(asset["AssetId"])
+                    if sell_asset:
+                        asset["CommodityId"] = sell_asset["id"]
+                        asset["Price"] = sell_asset["price"]
+                        asset["IsCanSold"] = True
+                        del asset["AssetId"]
+            batches = [change_price_onshelf_list[i : i + PRICE_CHANGE_BATCH_SIZE] for i in range(0, len(change_price_onshelf_list), PRICE_CHANGE_BATCH_SIZE)]
             for batch in batches:
                 rsp = self.call_api(
                     "PUT",
@@ -815,9 +980,28 @@ class UUAccount:
                             )
                 except TypeError:
                     logger.error("Failed to list via price-change. Item may be in pending-delivery list.")
+        self.shelf_index.invalidate()
         failure_count = len(item_infos) - success_count
         return success_count, failure_count
 
+    def resolve_commodity_ids(self, assets: list) -> list:
+        """
+        Fill in missing CommodityIds (orderNo) from the shelf index, only for assets that lack one.
+        Assets that aren't on either shelf are logged and left out, so they can't abort a whole price-change batch.
+        """
+        resolved = []
+        for asset in assets:
+            if asset.orderNo is None:
+                lease_asset = self.shelf_index.get_lease(asset.assetid)
+                sell_asset = self.shelf_index.get_sell(asset.assetid) if lease_asset is None else None
+                order_no = lease_asset.orderNo if lease_asset else (sell_asset or {}).get("id")
+                if order_no is None:
+                    logger.error(f"Item {asset.assetid}(AssetId) is not on the UU shelf, skipping its price change")
+                    continue
+                asset = dataclasses.replace(asset, orderNo=order_no)
+            resolved.append(asset)
+        return resolved
+
     def change_price_sell_and_lease(self, sell_assets: list[models.Asset] = [], lease_assets: list[models.LeaseAsset] = []):
         """
         Change price for items that may be both sellable and leasable.
@@ -837,13 +1021,17 @@ class UUAccount:
         }
         """
         item_infos = []
+        requested = len(sell_assets) + len(lease_assets)
+        sell_assets, lease_assets = self.resolve_commodity_ids(sell_assets), self.resolve_commodity_ids(lease_assets)
+        # Unresolvable assets count as failures
+        skipped = requested - len(sell_assets) - len(lease_assets)
         sell_assets_dict = dict({asset.assetid: asset for asset in sell_assets})
         lease_assets_dict = dict({asset.assetid: asset for asset in lease_assets})
-        sell_lease_commodityID = set(sell_assets_dict.keys()) & set(lease_assets_dict.keys())
+        sell_lease_assets_id = set(sell_assets_dict.keys()) & set(lease_assets_dict.keys())
         # Merge if both provided
-        for id in sell_lease_commodityID:
+        for id in sell_lease_assets_id:
             item_info = {
-                "CommodityId": id,
+                "CommodityId": int(lease_assets_dict[id].orderNo or sell_assets_dict[id].orderNo),
                 "IsCanLease": True,
                 "IsCanSold": True,
                 "LeaseDeposit": str(lease_assets_dict[id].LeaseDeposit),
@@ -860,7 +1048,7 @@ class UUAccount:
         item_infos += [models.UUChangePriceItem.fromAsset(asset).model_dump(exclude_none=True) for asset in sell_assets_dict.values()]
         item_infos += [models.UUChangePriceItem.fromLeaseAsset(asset).model_dump(exclude_none=True) for asset in lease_assets_dict.values()]
 
-        batches = [item_infos[i : i + 50] for i in range(0, len(item_infos), 50)]
+        batches = [item_infos[i : i + PRICE_CHANGE_BATCH_SIZE] for i in range(0, len(item_infos), PRICE_CHANGE_BATCH_SIZE)]
         success_count = 0
         for batch in batches:
             rsp = self.call_api(
@@ -881,19 +1069,19 @@ class UUAccount:
                     elif asset.get("Message"):
                         reason = asset["Message"]
                     logger.error(f"Failed to change price. CommodityId {asset['CommodityId']}. Reason: {reason}")
-        failure_count = len(item_infos) - success_count
+        self.shelf_index.invalidate()
+        failure_count = len(item_infos) + skipped - success_count
         return success_count, failure_count
 
     def get_leased_out_list(self):
-        data = {"gameId": 730, "pageIndex": 0, "pageSize": 50, "sortType": 0, "keywords": ""}
-        result = []
-        while True:
-            data["pageIndex"] += 1
-            response = self.call_api("POST", "/api/youpin/bff/trade/v1/order/lease/out/list", data=data).json()
-            result += response["data"]["orderDataList"]
-            if len(response["data"]["orderDataList"]) < 50:
-                break
-        return result
+        return list(
+            self.iter_pages(
+                "/api/youpin/bff/trade/v1/order/lease/out/list",
+                {"gameId": 730, "sortType": 0, "keywords": ""},
+                lambda rsp: rsp["data"]["orderDataList"],
+                page_size=50,
+            )
+        )
 
     def get_template_id_by_order_id(self, order_id):
         response = self.call_api("POST", "/api/youpin/bff/order/v2/detail", data={"orderId": order_id}).json()
@@ -1118,17 +1306,11 @@ class UUAccount:
         return response
 
     def get_full_purchase_order_list(self, status=20):
-        index = 1
-        purchase_order_list = []
-        while True:
-            if index != 1:
-                time.sleep(2.5)
-            response = self.search_purchase_order_list(index, 40, status)
-            response.raise_for_status()
-            data = response.json()
-            if "成功" in data["msg"]:
-                purchase_order_list += data["data"]
-            if len(data["data"]) < 40:
-                break
-            index += 1
-        return purchase_order_list
+        return list(
+            self.iter_pages(
+                "/api/youpin/bff/trade/purchase/order/searchPurchaseOrderList",
+                {"status": status},
+                lambda rsp: rsp["data"] if "成功" in rsp["msg"] else None,
+                page_size=40,
+            )
+        )